@@ -0,0 +1,216 @@
+"""
+Micro-benchmarks des composants internes du bot.
+Usage : python benchmarks.py [nom_du_benchmark ...]  (sans argument : tous les benchmarks)
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+WORDS = (
+    "compte abonnement paiement paypal livraison produit gaming streaming netflix spotify vbucks fortnite "
+    "remboursement ticket crédit retrait niveau parrainage commission boutique catalogue option prix "
+    "premium vip mission défi classement succès xp serveur discord support problème erreur accès "
+    "formation revente méthode guide bonus code carte cadeau jeu console musique film série"
+).split()
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    # Mélange de vrais mots et de mots synthétiques pour obtenir un vocabulaire réaliste (plusieurs milliers de termes)
+    return " ".join(rng.choice(WORDS) if rng.random() < 0.5 else f"{rng.choice(WORDS)}{rng.randint(0, 99)}" for _ in range(length))
+
+
+def _report(name: str, timings: list, unit: str = "ms"):
+    factor = 1000 if unit == "ms" else 1_000_000
+    values = sorted(t * factor for t in timings)
+    p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+    print(f"  {name}: moyenne {statistics.mean(values):.3f} {unit} | médiane {statistics.median(values):.3f} {unit} | p95 {p95:.3f} {unit}")
+
+
+def bench_knowledge_index(doc_count: int = 10_000, query_count: int = 1_000):
+    from cogs.assistant_cog import KnowledgeIndex
+
+    rng = random.Random(42)
+    faqs = [{"question": _random_text(rng, 8) + " ?", "answer": _random_text(rng, 40)} for _ in range(doc_count // 2)]
+    products = [{"id": f"produit-{i}", "name": _random_text(rng, 3), "category": rng.choice(WORDS), "description": _random_text(rng, 25)} for i in range(doc_count - len(faqs))]
+
+    start = time.perf_counter()
+    index = KnowledgeIndex.from_knowledge(faqs, products)
+    build_time = time.perf_counter() - start
+    print(f"KnowledgeIndex ({doc_count} documents, {len(index.postings)} termes)")
+    print(f"  construction : {build_time * 1000:.1f} ms")
+
+    queries = [_random_text(rng, rng.randint(2, 8)) for _ in range(query_count)]
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, top_k=5)
+        timings.append(time.perf_counter() - start)
+    _report(f"recherche top-5 ({query_count} requêtes)", timings)
+
+
+def bench_ticket_archive(ticket_count: int = 20_000, query_count: int = 500):
+    import tempfile
+    from cogs.manager_cog import TicketArchive
+
+    rng = random.Random(42)
+    user_ids = [rng.randint(10**17, 10**18) for _ in range(2_000)]
+    with tempfile.TemporaryDirectory() as directory:
+        archive = TicketArchive(directory)
+        start = time.perf_counter()
+        for ticket_number in range(ticket_count):
+            user_id = rng.choice(user_ids)
+            lines = [f"[2024-01-01 12:{i % 60:02d}:00] membre{user_id % 97}: {_random_text(rng, rng.randint(5, 25))}" for i in range(rng.randint(10, 40))]
+            lines.insert(rng.randint(0, len(lines)), f"Code de transaction RB-{ticket_number:04X} pour {user_id}")
+            archive.add(str(ticket_number), "\n".join(lines), {"user_id": user_id, "closed_at": f"2024-01-01T{ticket_number:08d}"})
+        add_time = time.perf_counter() - start
+
+        stats = archive.stats()
+        print(f"TicketArchive ({stats['tickets']} tickets, {stats['terms']} termes)")
+        print(f"  archivage : {add_time:.2f} s ({ticket_count / add_time:.0f} tickets/s)")
+        print(f"  taille : {stats['raw_bytes'] / 1e6:.1f} Mo bruts -> {stats['compressed_bytes'] / 1e6:.1f} Mo compressés (ratio {stats['raw_bytes'] / max(1, stats['compressed_bytes']):.1f}x)")
+
+        start = time.perf_counter()
+        TicketArchive(directory).load()
+        print(f"  reconstruction de l'index au démarrage : {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        queries = [_random_text(rng, rng.randint(1, 3)) for _ in range(query_count)]
+        queries += [f"RB-{rng.randrange(ticket_count):04X}" for _ in range(query_count // 5)]
+        queries += [str(rng.choice(user_ids)) for _ in range(query_count // 5)]
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            archive.search(query, limit=10)
+            timings.append(time.perf_counter() - start)
+        _report(f"recherche ({len(queries)} requêtes)", timings)
+
+
+def _sample_profile_card(rng: random.Random, palette: dict) -> dict:
+    return {"palette": palette, "display_name": f"Membre{rng.randint(0, 9999)}", "level": rng.randint(1, 60),
+            "xp_in_level": rng.randint(0, 900), "xp_needed_for_level": 1000, "store_credit": rng.uniform(0, 500)}
+
+
+def _sample_avatar_png(size: int = 256) -> bytes:
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_mandelbrot((size, size), (-2, -1.5, 1, 1.5), 50).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def bench_profile_render(concurrent_requests: int = 40):
+    import asyncio
+    import json
+    from cogs.manager_cog import render_profile_card, make_avatar_thumbnail, ImageRenderPool
+
+    card_config = json.load(open("config.json", encoding="utf-8"))["PROFILE_CARD_CONFIG"]
+    rng = random.Random(42)
+    avatar = make_avatar_thumbnail(_sample_avatar_png())
+    cards = [_sample_profile_card(rng, card_config["DEFAULT_PALETTE"]) for _ in range(concurrent_requests)]
+
+    async def measure(render):
+        # Sonde : une tâche qui dort 1 ms en boucle ; tout retard au réveil est du temps où la boucle était bloquée
+        lags, running = [], True
+        async def probe():
+            while running:
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(max(0.0, time.perf_counter() - start - 0.001))
+        probe_task = asyncio.create_task(probe())
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await asyncio.gather(*(render(card) for card in cards))
+        total = time.perf_counter() - start
+        running = False
+        await probe_task
+        return total, lags
+
+    async def inline(card):
+        await asyncio.sleep(0)
+        return render_profile_card(card, avatar)
+
+    async def main():
+        pool = ImageRenderPool(max_workers=card_config.get("RENDER_WORKERS", 2), max_queue=concurrent_requests, queue_timeout=60)
+        print(f"Rendu de cartes de profil ({concurrent_requests} /profil simultanés)")
+        for label, render in (("dans la boucle", inline), ("pool de rendu", lambda card: pool.run(render_profile_card, card, avatar))):
+            total, lags = await measure(render)
+            print(f"  {label} : durée totale {total * 1000:.0f} ms | retard max de la boucle {max(lags) * 1000:.1f} ms")
+            _report(f"{label} - retard de la boucle", lags)
+        pool.shutdown()
+
+    asyncio.run(main())
+
+
+def bench_profile_assets(render_count: int = 300):
+    import json
+    from cogs.manager_cog import render_profile_card, PROFILE_CARD_ASSETS
+
+    card_config = json.load(open("config.json", encoding="utf-8"))["PROFILE_CARD_CONFIG"]
+    palettes = [card_config["DEFAULT_PALETTE"]] + [tier["palette"] for tier in card_config["LEVEL_PALETTES"]]
+    rng = random.Random(42)
+    cards = [_sample_profile_card(rng, rng.choice(palettes)) for _ in range(render_count)]
+
+    print(f"Ressources des cartes de profil ({render_count} rendus, {len(palettes)} palettes, sans avatar)")
+    if not os.path.exists("assets/Inter-Bold.ttf"):
+        print("  (polices Inter absentes : police par défaut, le gain du cache de polices est sous-estimé)")
+    for label, cached in (("sans cache (polices et fond recréés)", False), ("avec cache de ressources", True)):
+        timings = []
+        for card in cards:
+            if not cached:
+                PROFILE_CARD_ASSETS.clear()
+            start = time.perf_counter()
+            render_profile_card(card, None)
+            timings.append(time.perf_counter() - start)
+        _report(label, timings)
+
+
+def bench_product_autocomplete(product_count: int = 5_000, query_count: int = 2_000):
+    from cogs.catalogue_cog import ProductSearchIndex
+
+    rng = random.Random(42)
+    products = [{"id": f"{rng.choice(WORDS)}-{i}", "name": _random_text(rng, rng.randint(2, 5)).capitalize()} for i in range(product_count)]
+
+    start = time.perf_counter()
+    index = ProductSearchIndex(products)
+    print(f"ProductSearchIndex ({product_count} produits, {len(index.trigrams)} trigrammes)")
+    print(f"  construction : {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def typo(word: str) -> str:
+        position = rng.randrange(len(word))
+        return word[:position] + word[position + 1:] if len(word) > 3 else word
+
+    queries = []
+    for _ in range(query_count):
+        product = rng.choice(products)
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(product["id"][:rng.randint(1, 6)])
+        elif kind < 0.7:
+            queries.append(rng.choice(product["name"].split())[:rng.randint(2, 8)])
+        else:
+            queries.append(typo(rng.choice(product["name"].split())))
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query)
+        timings.append(time.perf_counter() - start)
+    _report(f"autocomplétion top-25 ({query_count} saisies : préfixes, mots, fautes de frappe)", timings)
+
+
+BENCHMARKS = {
+    "knowledge_index": bench_knowledge_index,
+    "ticket_archive": bench_ticket_archive,
+    "profile_render": bench_profile_render,
+    "profile_assets": bench_profile_assets,
+    "product_autocomplete": bench_product_autocomplete,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for bench_name in selected:
+        if bench_name not in BENCHMARKS:
+            print(f"Benchmark inconnu : {bench_name}. Disponibles : {', '.join(BENCHMARKS)}")
+            continue
+        BENCHMARKS[bench_name]()
@@ -1,13 +1,21 @@
 
 import discord
 from discord.ext import commands
+from discord import app_commands
 import json
 import os
-from typing import Dict, Any, Optional
+import asyncio
+from datetime import timedelta
+from typing import Dict, Any, Optional, Tuple, List
 import re
+import time
+import math
+import heapq
+import zlib
+from collections import Counter, defaultdict, OrderedDict, deque
 
 # Importation de ManagerCog pour l'autocomplétion
-from .manager_cog import ManagerCog
+from .manager_cog import ManagerCog, tokenize_text, fold_accents
 
 # Importation de la librairie Gemini
 try:
@@ -17,24 +25,320 @@ try:
 except ImportError:
     AI_AVAILABLE = False
 
+ASSISTANT_PERSONA = """Tu es "ResellBoost Assistant", un support IA pour le serveur Discord "ResellBoost". Ta mission est de répondre aux questions des utilisateurs en te basant sur les informations fournies."""
+
+ASSISTANT_RULES = """Instructions:
+1. Analyse la question de l'utilisateur.
+2. Si la réponse se trouve dans la base de connaissances, formule une réponse claire et amicale.
+3. Si la question est d'ordre personnel (problème de paiement, de compte) ou si tu ne trouves pas de réponse, escalade en suggérant de créer un ticket.
+4. Si un produit du catalogue est pertinent pour la question, mentionne-le par son nom.
+5. Termine toujours ta réponse par une suggestion de question de suivi naturelle."""
+
+ASSISTANT_INSTRUCTIONS = ASSISTANT_RULES + """
+
+Tu DOIS répondre au format JSON suivant. Ne mets rien d'autre que le JSON dans ta réponse.
+{
+  "response_type": "answer" | "escalate",
+  "content": "Ton texte de réponse ici. Pour une escalade, guide l'utilisateur vers la création d'un ticket avec la commande /ticket.",
+  "suggested_follow_up": "Une suggestion de question de suivi pertinente" | null
+}"""
+
+# Variante texte pour le mode streaming : un JSON partiel ne peut pas être affiché au fil de l'eau.
+ASSISTANT_STREAM_INSTRUCTIONS = ASSISTANT_RULES + """
+
+Tu DOIS répondre en texte brut (pas de JSON), exactement dans ce format :
+TYPE: answer ou escalate
+Ton texte de réponse ici. Pour une escalade, guide l'utilisateur vers la création d'un ticket avec la commande /ticket.
+SUIVI: Une suggestion de question de suivi pertinente"""
+
+STREAM_TYPE_PATTERN = re.compile(r'^\s*\**\s*TYPE\s*:\s*\**\s*(answer|escalate)\b\**\s*', re.IGNORECASE)
+STREAM_FOLLOW_UP_PATTERN = re.compile(r'^\s*\**\s*SUIVI\s*:\**', re.IGNORECASE | re.MULTILINE)
+SENTENCE_END_PATTERN = re.compile(r'[.!?…](?:\s|$)')
+
+# --- Index de recherche local (BM25) ---
+
+class KnowledgeIndex:
+    """Index BM25 en mémoire sur les FAQs et les produits, pour n'envoyer à l'IA que les extraits pertinents."""
+    def __init__(self, documents: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        # Chaque document : {"kind": "faq" | "product", "text": str, "payload": dict}
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+
+        for doc_id, document in enumerate(documents):
+            term_counts = Counter(tokenize_text(document["text"]))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self.postings[term].append((doc_id, count))
+
+        total_docs = len(documents)
+        self.avg_doc_length = (sum(self.doc_lengths) / total_docs) if total_docs else 0.0
+        self.doc_norms = [self.k1 * (1 - self.b + self.b * length / self.avg_doc_length) if self.avg_doc_length else self.k1 for length in self.doc_lengths]
+        self.idf = {
+            term: math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    @classmethod
+    def from_knowledge(cls, faqs: List[Dict[str, Any]], products: List[Dict[str, Any]]) -> 'KnowledgeIndex':
+        documents = []
+        for faq in faqs:
+            # La question est répétée pour peser plus lourd que la réponse
+            documents.append({"kind": "faq", "text": f"{faq.get('question', '')} {faq.get('question', '')} {faq.get('answer', '')}", "payload": faq})
+        for product in products:
+            text = f"{product.get('name', '')} {product.get('name', '')} {product.get('id', '')} {product.get('category', '')} {product.get('description', '')}"
+            documents.append({"kind": "product", "text": text, "payload": product})
+        return cls(documents)
+
+    def search(self, query: str, top_k: int = 5, kind: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize_text(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            weight = idf * (self.k1 + 1)
+            doc_norms = self.doc_norms
+            for doc_id, term_frequency in self.postings[term]:
+                scores[doc_id] += weight * term_frequency / (term_frequency + doc_norms[doc_id])
+
+        candidates = ((score, doc_id) for doc_id, score in scores.items() if kind is None or self.documents[doc_id]["kind"] == kind)
+        return [(score, self.documents[doc_id]) for score, doc_id in heapq.nlargest(top_k, candidates)]
+
+    def query_coverage(self, query: str, document: Dict[str, Any]) -> float:
+        """Proportion des termes de la question présents dans le document."""
+        query_terms = set(tokenize_text(query))
+        if not query_terms:
+            return 0.0
+        document_terms = set(tokenize_text(document["text"]))
+        return len(query_terms & document_terms) / len(query_terms)
+
+
+# --- Cache des réponses de l'assistant ---
+
+class AnswerCache:
+    """Cache LRU/TTL des réponses de l'IA, avec détection des questions quasi identiques par MinHash sur des shingles."""
+    SHINGLE_SIZE = 4
+    NEGATION_TOKENS = frozenset({"ne", "n", "pas", "jamais", "aucun", "aucune", "rien", "sans", "non"})
+
+    def __init__(self, max_size: int = 500, ttl_seconds: int = 86400, similarity_threshold: float = 0.8, num_hashes: int = 32, band_size: int = 4):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.num_hashes = num_hashes
+        self.band_size = band_size
+        self.version = None
+
+        self._entries: OrderedDict = OrderedDict()
+        self._bands: Dict[Tuple[int, Tuple[int, ...]], set] = defaultdict(set)
+        self.hits = 0
+        self.near_duplicate_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        # Mots vides conservés : sans eux, "... est accepté ?" et "... n'est pas accepté ?" auraient la même clé
+        return " ".join(tokenize_text(question, remove_stopwords=False))
+
+    def _shingles(self, normalized: str) -> set:
+        if len(normalized) <= self.SHINGLE_SIZE:
+            return {zlib.crc32(normalized.encode("utf-8"))}
+        return {zlib.crc32(normalized[i:i + self.SHINGLE_SIZE].encode("utf-8")) for i in range(len(normalized) - self.SHINGLE_SIZE + 1)}
+
+    def _band_keys(self, shingles: set) -> List[Tuple[int, Tuple[int, ...]]]:
+        # Signature MinHash : pour chaque graine, la plus petite valeur de hachage des shingles
+        signature = [min((shingle * (2 * seed + 1) + seed) & 0xFFFFFFFF for shingle in shingles) for seed in range(self.num_hashes)]
+        return [(i, tuple(signature[i:i + self.band_size])) for i in range(0, self.num_hashes, self.band_size)]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            for band_key in entry["band_keys"]:
+                self._bands[band_key].discard(key)
+                if not self._bands[band_key]:
+                    del self._bands[band_key]
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self._bands.clear()
+            self.version = version
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+
+    def get(self, question: str, version) -> Optional[Dict[str, Any]]:
+        self._check_version(version)
+        normalized = self.normalize_question(question)
+        if not normalized:
+            return None
+
+        entry_key = normalized if normalized in self._entries else None
+        near_duplicate = entry_key is None
+        if entry_key is None:
+            shingles = self._shingles(normalized)
+            candidates = set().union(*(self._bands.get(band_key, set()) for band_key in self._band_keys(shingles)))
+            best_similarity = 0.0
+            negations = self.NEGATION_TOKENS.intersection(normalized.split())
+            for candidate in candidates:
+                # Une question quasi identique mais de sens inverse ne doit pas recevoir la même réponse
+                if self.NEGATION_TOKENS.intersection(candidate.split()) != negations:
+                    continue
+                candidate_shingles = self._entries[candidate]["shingles"]
+                similarity = len(shingles & candidate_shingles) / len(shingles | candidate_shingles)
+                if similarity >= self.similarity_threshold and similarity > best_similarity:
+                    entry_key, best_similarity = candidate, similarity
+
+        entry = self._entries.get(entry_key) if entry_key else None
+        if entry is None or self._is_expired(entry):
+            if entry is not None:
+                self._remove(entry_key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(entry_key)
+        entry["hits"] += 1
+        self.hits += 1
+        if near_duplicate:
+            self.near_duplicate_hits += 1
+        return entry["response"]
+
+    def put(self, question: str, version, response: Dict[str, Any]):
+        self._check_version(version)
+        normalized = self.normalize_question(question)
+        if not normalized:
+            return
+        self._remove(normalized)
+
+        shingles = self._shingles(normalized)
+        band_keys = self._band_keys(shingles)
+        self._entries[normalized] = {
+            "question": question, "response": response, "created_at": time.monotonic(),
+            "hits": 0, "shingles": shingles, "band_keys": band_keys
+        }
+        for band_key in band_keys:
+            self._bands[band_key].add(normalized)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def most_requested(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Questions les plus servies depuis le cache : candidates à une promotion dans la FAQ."""
+        entries = [e for e in self._entries.values() if e["hits"] > 0]
+        return sorted(entries, key=lambda e: e["hits"], reverse=True)[:limit]
+
+
+# --- Regroupement des déclencheurs passifs ---
+
+class PassiveTriggerDebouncer:
+    """Attend un court silence par (salon, auteur) et fusionne les messages consécutifs en une seule question."""
+    def __init__(self, quiet_seconds: float, on_ready):
+        self.quiet_seconds = quiet_seconds
+        self.on_ready = on_ready # coroutine(message, question)
+        self._pending: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._in_flight: set = set()
+
+    @staticmethod
+    def _key(message: discord.Message) -> Tuple[int, int]:
+        return (message.channel.id, message.author.id)
+
+    def is_pending(self, message: discord.Message) -> bool:
+        return self._key(message) in self._pending
+
+    def is_in_flight(self, message: discord.Message) -> bool:
+        return self._key(message) in self._in_flight
+
+    def add(self, message: discord.Message, question: str):
+        key = self._key(message)
+        entry = self._pending.setdefault(key, {"parts": [], "message": message, "task": None})
+        entry["parts"].append(question)
+        entry["message"] = message # On répond au dernier message de la série
+        if entry["task"]:
+            entry["task"].cancel()
+        entry["task"] = asyncio.create_task(self._fire_after_quiet_period(key))
+
+    async def _fire_after_quiet_period(self, key: Tuple[int, int]):
+        await asyncio.sleep(self.quiet_seconds)
+        entry = self._pending.pop(key, None)
+        if not entry:
+            return
+        self._in_flight.add(key)
+        try:
+            await self.on_ready(entry["message"], " ".join(entry["parts"]))
+        except Exception as e:
+            print(f"Erreur lors de la réponse groupée de l'assistant: {e}")
+        finally:
+            self._in_flight.discard(key)
+
+    def cancel_all(self):
+        for entry in self._pending.values():
+            if entry["task"]:
+                entry["task"].cancel()
+        self._pending.clear()
+
+
 class AssistantCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
         self.model: Optional[genai.GenerativeModel] = None
 
+        # Prompt complet (FAQ + catalogue), recompilé uniquement quand ils changent. Ce n'est que le chemin de repli
+        # quand ASSISTANT_CONFIG.RETRIEVAL.ENABLED est désactivé (il alimente alors aussi le cache de contexte Gemini).
+        self._prompt_contexts: Dict[str, str] = {}
+        self._prompt_context_version: Optional[Tuple[int, int]] = None
+        self._cached_content = None
+        self._cached_model: Optional[genai.GenerativeModel] = None
+        self._cached_model_version: Optional[Tuple[int, int]] = None
+        self._cached_model_expires_at = 0.0
+        self._context_cache_lock = asyncio.Lock()
+
+        self._knowledge_index: Optional[KnowledgeIndex] = None
+        self._knowledge_index_version: Optional[Tuple[int, int]] = None
+        self.answer_cache: Optional[AnswerCache] = None
+        # (délai avant le premier affichage, durée totale) des dernières réponses de l'IA, par mode
+        self.latency_samples: Dict[str, deque] = {"standard": deque(maxlen=200), "streaming": deque(maxlen=200)}
+
+        self.debouncer: Optional[PassiveTriggerDebouncer] = None
+        self._keyword_pattern: Optional[re.Pattern] = None
+        self._keyword_pattern_source: Optional[Tuple[str, ...]] = None
+
     async def cog_load(self):
         # Cette méthode est appelée lors du chargement du cog.
         self.manager = self.bot.get_cog('ManagerCog')
         if not self.manager:
             return print("ERREUR CRITIQUE: AssistantCog n'a pas pu trouver le ManagerCog.")
         
+        cache_config = self.manager.config.get("ASSISTANT_CONFIG", {}).get("ANSWER_CACHE", {})
+        if cache_config.get("ENABLED", True):
+            self.answer_cache = AnswerCache(
+                max_size=cache_config.get("MAX_SIZE", 500),
+                ttl_seconds=cache_config.get("TTL_SECONDS", 86400),
+                similarity_threshold=cache_config.get("SIMILARITY_THRESHOLD", 0.8)
+            )
+
+        quiet_seconds = self.manager.config.get("ASSISTANT_CONFIG", {}).get("PASSIVE_DEBOUNCE_SECONDS", 2.5)
+        self.debouncer = PassiveTriggerDebouncer(quiet_seconds, self.answer_question)
+
         if AI_AVAILABLE and self.manager.model:
             self.model = self.manager.model
             print("✅ Assistant Cog: Modèle Gemini partagé par ManagerCog chargé.")
         else:
             print("⚠️ ATTENTION: AssistantCog désactivé car aucun modèle AI n'est disponible.")
 
+    def cog_unload(self):
+        if self.debouncer:
+            self.debouncer.cancel_all()
+
+    @commands.Cog.listener()
+    async def on_data_reload(self, name: str, version: int):
+        # FAQ et produits sont suivis par _context_version ; seule la config demande une mise à jour explicite
+        if name != "config" or not self.debouncer: return
+        self.debouncer.quiet_seconds = self.manager.config.get("ASSISTANT_CONFIG", {}).get("PASSIVE_DEBOUNCE_SECONDS", 2.5)
+
     async def _parse_gemini_json_response(self, text: str) -> Optional[Dict[str, Any]]:
         """Analyse de manière robuste une réponse JSON potentiellement mal formatée de l'IA."""
         # Regex pour trouver un bloc JSON, même s'il est entouré de texte ou de démarqueurs de code.
@@ -47,43 +351,130 @@ class AssistantCog(commands.Cog):
             print(f"Erreur de décodage JSON dans AssistantCog: {e}\nTexte reçu: {text}")
             return None
             
+    def _context_version(self) -> Tuple[int, int]:
+        return (self.manager.data_versions.get("knowledge_base", 0), self.manager.catalogue.version)
+
+    def get_prompt_context(self, instructions: str = ASSISTANT_INSTRUCTIONS) -> str:
+        """Retourne le prompt complet (persona, FAQ, produits, instructions), compilé une seule fois par version. Repli si RETRIEVAL est désactivé."""
+        version = self._context_version()
+        if self._prompt_context_version != version:
+            self._prompt_contexts.clear()
+            self._prompt_context_version = version
+
+        if instructions not in self._prompt_contexts:
+            knowledge_base_str = json.dumps(self.manager.knowledge_base.get("faqs", []), ensure_ascii=False)
+            products_list_str = json.dumps([{'id': p.get('id'), 'name': p.get('name'), 'category': p.get('category')} for p in self.manager.catalogue.products], ensure_ascii=False)
+            self._prompt_contexts[instructions] = (
+                f"{ASSISTANT_PERSONA}\n\n"
+                f"Base de connaissances (FAQs):\n{knowledge_base_str}\n\n"
+                f"Liste des produits disponibles (pour référence, ne donne pas les prix):\n{products_list_str}\n\n"
+                f"{instructions}"
+            )
+        return self._prompt_contexts[instructions]
+
+    def get_knowledge_index(self) -> KnowledgeIndex:
+        version = self._context_version()
+        if self._knowledge_index is None or self._knowledge_index_version != version:
+            self._knowledge_index = KnowledgeIndex.from_knowledge(self.manager.knowledge_base.get("faqs", []), self.manager.catalogue.products)
+            self._knowledge_index_version = version
+        return self._knowledge_index
+
+    def find_direct_faq_answer(self, question: str) -> Optional[Dict[str, Any]]:
+        """Répond sans appel à l'IA lorsque la question correspond sans ambiguïté à une FAQ."""
+        retrieval_config = self.manager.config.get("ASSISTANT_CONFIG", {}).get("RETRIEVAL", {})
+        index = self.get_knowledge_index()
+        results = index.search(question, top_k=2, kind="faq")
+        if not results:
+            return None
+
+        best_score, best_doc = results[0]
+        second_score = results[1][0] if len(results) > 1 else 0.0
+        if best_score < retrieval_config.get("DIRECT_ANSWER_MIN_SCORE", 2.0):
+            return None
+        if second_score > best_score * retrieval_config.get("DIRECT_ANSWER_MAX_RUNNER_UP_RATIO", 0.6):
+            return None
+        if index.query_coverage(question, best_doc) < retrieval_config.get("DIRECT_ANSWER_MIN_COVERAGE", 0.75):
+            return None
+
+        return {
+            "response_type": "answer",
+            "content": best_doc["payload"].get("answer"),
+            "suggested_follow_up": results[1][1]["payload"].get("question") if len(results) > 1 else None
+        }
+
+    def build_retrieval_prompt(self, question: str, instructions: str = ASSISTANT_INSTRUCTIONS) -> str:
+        """Construit un prompt ne contenant que les FAQs et produits les plus pertinents pour la question."""
+        top_k = self.manager.config.get("ASSISTANT_CONFIG", {}).get("RETRIEVAL", {}).get("TOP_K", 5)
+        results = self.get_knowledge_index().search(question, top_k=top_k)
+        faqs = [doc["payload"] for _, doc in results if doc["kind"] == "faq"]
+        products = [{'id': doc["payload"].get('id'), 'name': doc["payload"].get('name'), 'category': doc["payload"].get('category')} for _, doc in results if doc["kind"] == "product"]
+        return (
+            f"{ASSISTANT_PERSONA}\n\n"
+            f"Extraits pertinents de la base de connaissances (FAQs):\n{json.dumps(faqs, ensure_ascii=False)}\n\n"
+            f"Produits pertinents (pour référence, ne donne pas les prix):\n{json.dumps(products, ensure_ascii=False)}\n\n"
+            f"{instructions}\n\n"
+            f'Question de l\'utilisateur: "{question}"'
+        )
+
+    def build_prompt(self, question: str, instructions: str = ASSISTANT_INSTRUCTIONS) -> str:
+        if self.manager.config.get("ASSISTANT_CONFIG", {}).get("RETRIEVAL", {}).get("ENABLED", True):
+            return self.build_retrieval_prompt(question, instructions)
+        return f'{self.get_prompt_context(instructions)}\n\nQuestion de l\'utilisateur: "{question}"'
+
+    async def _get_context_cached_model(self) -> Optional[genai.GenerativeModel]:
+        """Crée (si activé) un cache de contexte Gemini contenant la partie statique du prompt."""
+        cache_config = self.manager.config.get("ASSISTANT_CONFIG", {}).get("CONTEXT_CACHE", {})
+        if not cache_config.get("ENABLED", False):
+            return None
+
+        async with self._context_cache_lock:
+            if self._cached_model_version == self._context_version() and time.monotonic() < self._cached_model_expires_at:
+                return self._cached_model
+            return await self._refresh_context_cache(cache_config)
+
+    async def _refresh_context_cache(self, cache_config: Dict[str, Any]) -> Optional[genai.GenerativeModel]:
+        version = self._context_version()
+        prompt_context = self.get_prompt_context()
+        ttl = timedelta(minutes=cache_config.get("TTL_MINUTES", 60))
+        old_cached_content = self._cached_content
+        self._cached_model, self._cached_model_version = None, version
+        # Marge d'une minute pour ne jamais utiliser un cache expiré côté Gemini
+        self._cached_model_expires_at = time.monotonic() + max(ttl.total_seconds() - 60, 0)
+        loop = asyncio.get_running_loop()
+        try:
+            self._cached_content = await loop.run_in_executor(None, lambda: genai.caching.CachedContent.create(
+                model=self.model.model_name,
+                display_name="resellboost-assistant-context",
+                system_instruction=prompt_context,
+                ttl=ttl
+            ))
+            self._cached_model = genai.GenerativeModel.from_cached_content(cached_content=self._cached_content)
+        except Exception as e:
+            # Le contexte est peut-être trop court ou le modèle ne supporte pas le cache : on reste sur le prompt complet.
+            self._cached_content = None
+            print(f"Cache de contexte Gemini indisponible, utilisation du prompt complet: {e}")
+
+        if old_cached_content:
+            try: await loop.run_in_executor(None, old_cached_content.delete)
+            except Exception: pass
+        return self._cached_model
+
     async def query_gemini_for_answer(self, question: str) -> Optional[Dict[str, Any]]:
         if not self.model or not self.manager:
             return None
 
-        knowledge_base_str = json.dumps(self.manager.knowledge_base.get("faqs", []))
-        products_list_str = json.dumps([{'id': p.get('id'), 'name': p.get('name'), 'category': p.get('category')} for p in self.manager.products])
+        retrieval_enabled = self.manager.config.get("ASSISTANT_CONFIG", {}).get("RETRIEVAL", {}).get("ENABLED", True)
+        cached_model = None if retrieval_enabled else await self._get_context_cached_model()
+        if cached_model:
+            model, prompt = cached_model, f'Question de l\'utilisateur: "{question}"'
+        else:
+            model, prompt = self.model, self.build_prompt(question)
 
-        prompt = f"""
-        Tu es "ResellBoost Assistant", un support IA pour le serveur Discord "ResellBoost". Ta mission est de répondre aux questions des utilisateurs en te basant sur les informations fournies.
-        
-        Question de l'utilisateur: "{question}"
-
-        Base de connaissances (FAQs):
-        {knowledge_base_str}
-
-        Liste des produits disponibles (pour référence, ne donne pas les prix):
-        {products_list_str}
-
-        Instructions:
-        1. Analyse la question de l'utilisateur.
-        2. Si la réponse se trouve dans la base de connaissances, formule une réponse claire et amicale.
-        3. Si la question est d'ordre personnel (problème de paiement, de compte) ou si tu ne trouves pas de réponse, escalade en suggérant de créer un ticket.
-        4. Si un produit du catalogue est pertinent pour la question, mentionne-le par son nom.
-        5. Termine toujours ta réponse par une suggestion de question de suivi naturelle.
-
-        Tu DOIS répondre au format JSON suivant. Ne mets rien d'autre que le JSON dans ta réponse.
-        {{
-          "response_type": "answer" | "escalate",
-          "content": "Ton texte de réponse ici. Pour une escalade, guide l'utilisateur vers la création d'un ticket avec la commande /ticket.",
-          "suggested_follow_up": "Une suggestion de question de suivi pertinente" | null
-        }}
-        """
         try:
             generation_config = GenerationConfig(
                 response_mime_type="application/json"
             )
-            response = await self.model.generate_content_async(
+            response = await model.generate_content_async(
                 contents=prompt,
                 generation_config=generation_config
             )
@@ -92,34 +483,162 @@ class AssistantCog(commands.Cog):
             print(f"Erreur Gemini (Assistant): {e}")
             return {"response_type": "escalate", "content": "Désolé, une erreur technique est survenue lors de l'analyse de votre question.", "suggested_follow_up": "Puis-je vous aider avec autre chose ?"}
 
+    def _get_keyword_pattern(self, keywords: List[str]) -> Optional[re.Pattern]:
+        """Compile (une fois par liste de mots-clés) une alternance regex insensible aux accents."""
+        source = tuple(keywords)
+        if self._keyword_pattern_source != source:
+            folded = sorted({fold_accents(k) for k in keywords if k}, key=len, reverse=True)
+            self._keyword_pattern = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in folded) + ")") if folded else None
+            self._keyword_pattern_source = source
+        return self._keyword_pattern
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author.bot or not self.manager or not self.manager.config.get("ASSISTANT_CONFIG", {}).get("ENABLED", False):
             return
         
         assistant_config = self.manager.config.get("ASSISTANT_CONFIG", {})
-        monitored_channels = self.manager.config.get("CHANNELS", {}).get("ASSISTANT_MONITORED", [])
+        monitored_channels = self.manager.config.get("CHANNELS", {}).get("ASSISTANT_MONITORED") or assistant_config.get("ASSISTANT_MONITORED", [])
         
-        is_monitored_channel = message.channel.name in monitored_channels
+        is_monitored_channel = getattr(message.channel, "name", None) in monitored_channels
         is_dm = isinstance(message.channel, discord.DMChannel)
         is_mention = self.bot.user.mentioned_in(message)
         
-        triggered = is_dm or is_mention
-        if not triggered and is_monitored_channel:
-            if any(keyword in message.content.lower() for keyword in assistant_config.get("PASSIVE_KEYWORDS", [])):
-                triggered = True
-
-        if triggered:
-            question = re.sub(r'<@!?\d+>', '', message.content).strip()
-            if not question: return
-            
+        question = re.sub(r'<@!?\d+>', '', message.content).strip()
+        if not question: return
+
+        if is_dm or is_mention:
+            return await self.answer_question(message, question)
+
+        if not is_monitored_channel or not self.debouncer:
+            return
+        if self.debouncer.is_in_flight(message):
+            return # Une réponse à cet auteur est déjà en cours de génération
+
+        # Un message qui suit une question en attente la complète, même sans mot-clé
+        keyword_pattern = self._get_keyword_pattern(assistant_config.get("PASSIVE_KEYWORDS", []))
+        if self.debouncer.is_pending(message) or (keyword_pattern and keyword_pattern.search(fold_accents(message.content))):
+            self.debouncer.add(message, question)
+
+    async def answer_question(self, message: discord.Message, question: str):
+        response_data = self.find_direct_faq_answer(question)
+        if not response_data and self.answer_cache:
+            response_data = self.answer_cache.get(question, self._context_version())
+        if response_data:
+            return await self.handle_ia_response(message, response_data)
+
+        if self.manager.config.get("ASSISTANT_CONFIG", {}).get("STREAMING", {}).get("ENABLED", False) and self.model:
+            response_data = await self.stream_answer(message, question)
+        else:
+            start = time.perf_counter()
             async with message.channel.typing():
                 response_data = await self.query_gemini_for_answer(question)
-            
             if response_data:
                 await self.handle_ia_response(message, response_data)
+                elapsed = time.perf_counter() - start
+                self.latency_samples["standard"].append((elapsed, elapsed))
+
+        # Une réponse interrompue ou sans en-tête TYPE n'est pas fiable : on ne la sert pas aux autres membres
+        if (self.answer_cache and response_data and response_data.get("response_type") == "answer"
+                and not response_data.get("partial") and not response_data.get("untyped")):
+            self.answer_cache.put(question, self._context_version(), response_data)
+
+    def _parse_stream_buffer(self, buffer: str) -> Tuple[Optional[str], str, Optional[str]]:
+        """Extrait (type, contenu, suivi) d'une réponse texte éventuellement incomplète."""
+        response_type = None
+        header = STREAM_TYPE_PATTERN.match(buffer)
+        if header:
+            response_type = header.group(1).lower()
+            buffer = buffer[header.end():]
+
+        follow_up = None
+        parts = STREAM_FOLLOW_UP_PATTERN.split(buffer, maxsplit=1)
+        content = parts[0]
+        if len(parts) > 1:
+            follow_up = parts[1].strip() or None
+        else:
+            # Ne pas afficher un marqueur "SUIVI:" en cours de réception
+            last_line = content.rsplit("\n", 1)[-1].strip().upper()
+            if last_line and "SUIVI:".startswith(last_line):
+                content = content[:content.rstrip().rfind("\n") + 1] if "\n" in content else ""
+        return response_type, content.strip(), follow_up
+
+    async def stream_answer(self, message: discord.Message, question: str) -> Optional[Dict[str, Any]]:
+        """Affiche la réponse dès la première phrase, puis l'enrichit par éditions espacées."""
+        edit_interval = self.manager.config.get("ASSISTANT_CONFIG", {}).get("STREAMING", {}).get("EDIT_INTERVAL_SECONDS", 1.2)
+        start = time.perf_counter()
+        first_display = None
+        reply: Optional[discord.Message] = None
+        last_edit, displayed_content = 0.0, ""
+        buffer = ""
+        stream_failed = False
+
+        try:
+            async with message.channel.typing():
+                response = await self.model.generate_content_async(contents=self.build_prompt(question, ASSISTANT_STREAM_INSTRUCTIONS), stream=True)
+                async for chunk in response:
+                    buffer += chunk.text
+                    response_type, content, _ = self._parse_stream_buffer(buffer)
+                    if not content or content == displayed_content:
+                        continue
+
+                    partial_data = {"response_type": response_type or "answer", "content": content + " …"}
+                    if reply is None:
+                        if not SENTENCE_END_PATTERN.search(content):
+                            continue
+                        reply = await message.reply(embed=self.build_response_embed(partial_data), mention_author=False)
+                        first_display = time.perf_counter() - start
+                        last_edit, displayed_content = time.monotonic(), content
+                    elif time.monotonic() - last_edit >= edit_interval:
+                        await reply.edit(embed=self.build_response_embed(partial_data))
+                        last_edit, displayed_content = time.monotonic(), content
+        except Exception as e:
+            print(f"Erreur Gemini (Assistant, streaming): {e}")
+            stream_failed = True
+            if not buffer:
+                buffer = "TYPE: escalate\nDésolé, une erreur technique est survenue lors de l'analyse de votre question.\nSUIVI: Puis-je vous aider avec autre chose ?"
+
+        response_type, content, follow_up = self._parse_stream_buffer(buffer)
+        response_data = {
+            "response_type": response_type or "answer", "content": content or "Désolé, je n'ai pas de réponse à cela.", "suggested_follow_up": follow_up,
+            "partial": stream_failed, "untyped": response_type is None
+        }
+        if reply is None:
+            await self.handle_ia_response(message, response_data)
+            first_display = time.perf_counter() - start
+        else:
+            await reply.edit(embed=self.build_response_embed(response_data))
+        self.latency_samples["streaming"].append((first_display, time.perf_counter() - start))
+        return response_data
+
+    @app_commands.command(name="assistant_stats", description="[Staff] Affiche le cache de l'assistant et les questions les plus fréquentes.")
+    @app_commands.default_permissions(manage_messages=True)
+    async def assistant_stats(self, interaction: discord.Interaction):
+        if not self.answer_cache:
+            return await interaction.response.send_message("Le cache de réponses de l'assistant est désactivé.", ephemeral=True)
+
+        cache = self.answer_cache
+        lookups = cache.hits + cache.misses
+        embed = discord.Embed(title="📊 Statistiques de l'Assistant", color=discord.Color.blurple())
+        embed.add_field(name="Réponses en cache", value=f"`{len(cache)}`", inline=True)
+        embed.add_field(name="Taux de succès", value=f"`{(cache.hits / lookups * 100) if lookups else 0:.1f}%` ({cache.hits}/{lookups})", inline=True)
+        embed.add_field(name="Quasi-doublons servis", value=f"`{cache.near_duplicate_hits}`", inline=True)
+
+        for mode, label in (("standard", "Réponse complète"), ("streaming", "Streaming")):
+            samples = self.latency_samples[mode]
+            if samples:
+                avg_first = sum(first for first, _ in samples) / len(samples)
+                avg_total = sum(total for _, total in samples) / len(samples)
+                embed.add_field(name=f"Latence ({label})", value=f"1er affichage : `{avg_first:.2f}s`\nRéponse complète : `{avg_total:.2f}s`\n({len(samples)} réponses)", inline=True)
+
+        top_questions = "\n".join(f"**{entry['hits']}×** {entry['question'][:80]}" for entry in cache.most_requested())
+        embed.add_field(name="Questions fréquentes (candidates pour la FAQ)", value=top_questions or "Aucune pour le moment.", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     async def handle_ia_response(self, message: discord.Message, response_data: Dict[str, Any]):
+        await message.reply(embed=self.build_response_embed(response_data), mention_author=False)
+
+    def build_response_embed(self, response_data: Dict[str, Any]) -> discord.Embed:
         response_type = response_data.get("response_type")
         content = response_data.get("content", "Désolé, je n'ai pas de réponse à cela.")
         follow_up = response_data.get("suggested_follow_up")
@@ -136,8 +655,7 @@ class AssistantCog(commands.Cog):
         embed.description = content
         if follow_up:
             embed.set_footer(text=f"Suggestion : {follow_up}")
-        
-        await message.reply(embed=embed, mention_author=False)
+        return embed
 
 
 async def setup(bot: commands.Bot):
@@ -7,9 +7,11 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 import uuid
 import re
+import heapq
+from collections import Counter
 
 # Importation pour l'autocomplétion et la vérification de type
-from .manager_cog import ManagerCog
+from .manager_cog import ManagerCog, fold_accents
 from .manager_cog import TicketCloseView, TicketCreationView
 
 
@@ -23,12 +25,13 @@ class PaymentVerificationView(discord.ui.View):
     async def _handle_action(self, interaction: discord.Interaction, action: str):
         await interaction.response.defer()
 
-        footer_text = interaction.message.embeds[0].footer.text
-        match = re.search(r"ID de Transaction: ([a-f0-9-]+)", footer_text)
-        if not match:
-            return await interaction.followup.send("ID de transaction introuvable dans le message.", ephemeral=True)
-        
-        transaction_id = match.group(1)
+        transaction_id = self.manager.get_ticket_transaction(interaction.channel.id)
+        if not transaction_id:
+            # Ticket ouvert avant le registre : l'ID n'est disponible que dans le pied de l'embed
+            match = re.search(r"ID de Transaction: ([a-f0-9-]+)", interaction.message.embeds[0].footer.text or "")
+            if not match:
+                return await interaction.followup.send("ID de transaction introuvable dans le message.", ephemeral=True)
+            transaction_id = match.group(1)
 
         async with self.manager.data_lock:
             transaction_data = self.manager.pending_actions["transactions"].get(transaction_id)
@@ -42,9 +45,9 @@ class PaymentVerificationView(discord.ui.View):
             
             if action == "confirm":
                 product = self.manager.get_product(transaction_data['product_id'])
-                option = None
-                if transaction_data.get('option_name') and product.get('options'):
-                    option = next((opt for opt in product['options'] if opt['name'] == transaction_data['option_name']), None)
+                if not product:
+                    return await interaction.followup.send("❌ Ce produit n'existe plus dans le catalogue.", ephemeral=True)
+                option = self.manager.get_product_option(product['id'], transaction_data.get('option_name'))
 
                 purchase_successful, message = await self.manager.record_purchase(
                     user_id=transaction_data['user_id'],
@@ -129,6 +132,17 @@ class ProductActionView(discord.ui.View):
         if base_price < 0:
              return await interaction.followup.send("Ce produit a un prix variable et ne peut être acheté directement. Veuillez contacter le staff.", ephemeral=True)
 
+        ticket_types = self.manager.config.get("TICKET_SYSTEM", {}).get("TICKET_TYPES", [])
+        purchase_ticket_type = next((tt for tt in ticket_types if tt.get("label") == "Achat de Produit"), None)
+
+        if not purchase_ticket_type:
+             return await interaction.followup.send("Erreur: Le type de ticket 'Achat de Produit' n'est pas configuré.", ephemeral=True)
+
+        existing_ticket, opening_pending = self.manager.find_ticket_over_limit(interaction.user.id, purchase_ticket_type)
+        if existing_ticket or opening_pending:
+            location = f" (<#{existing_ticket}>)" if existing_ticket else ""
+            return await interaction.followup.send(f"Vous avez déjà trop de commandes en attente{location}. Finalisez-les avant d'en ouvrir une nouvelle.", ephemeral=True)
+
         final_price = base_price
         is_subscription = product.get("type") == "subscription"
         currency = product.get("currency", "EUR")
@@ -168,18 +182,13 @@ class ProductActionView(discord.ui.View):
             await self.manager._save_json_data_async(self.manager.PENDING_ACTIONS_FILE, self.manager.pending_actions)
 
         # --- Create ticket ---
-        ticket_types = self.manager.config.get("TICKET_SYSTEM", {}).get("TICKET_TYPES", [])
-        purchase_ticket_type = next((tt for tt in ticket_types if tt.get("label") == "Achat de Produit"), None)
-
-        if not purchase_ticket_type:
-             return await interaction.followup.send("Erreur: Le type de ticket 'Achat de Produit' n'est pas configuré.", ephemeral=True)
-
         ticket_channel = await self.manager.create_ticket(
             user=interaction.user,
             guild=interaction.guild,
             ticket_type=purchase_ticket_type,
             embed=embed_ticket,
-            view=PaymentVerificationView(self.manager)
+            view=PaymentVerificationView(self.manager),
+            transaction_id=transaction_id
         )
         
         if ticket_channel:
@@ -187,25 +196,161 @@ class ProductActionView(discord.ui.View):
         else:
             await interaction.followup.send("Impossible de créer le ticket d'achat. Veuillez contacter un administrateur.", ephemeral=True)
 
+SELECT_MAX_OPTIONS = 25 # Limite Discord par menu déroulant
+
+def _normalize_search_text(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", fold_accents(text)))
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductSearchIndex:
+    """
+    Index de recherche des produits pour l'autocomplétion (accents repliés) :
+    - un trie des préfixes sur l'ID, le nom complet et chaque mot du nom ;
+    - un index de trigrammes pour tolérer les fautes de frappe.
+    Les correspondances de préfixe passent avant les correspondances approximatives.
+    Chaque nœud du trie garde sous la clé None ses TOP_K meilleurs produits, calculés à la construction.
+    """
+    MIN_TRIGRAM_COVERAGE = 0.5
+    TOP_K = SELECT_MAX_OPTIONS
+
+    def __init__(self, products: List[Dict[str, Any]], version: int = 0):
+        self.version = version
+        self.labels: Dict[str, str] = {}
+        self.trie: Dict[str, Any] = {}
+        self.trigrams: Dict[str, set] = {}
+        self.trigram_counts: Dict[str, int] = {}
+        for product in products:
+            product_id, name = product['id'], product.get('name', product['id'])
+            self.labels[product_id] = f"{name} ({product_id})"[:100]
+            folded_id, folded_name = _normalize_search_text(product_id), _normalize_search_text(name)
+            # Rang 0 : préfixe de l'ID, rang 1 : préfixe du nom ou d'un de ses mots
+            self._insert(folded_id, product_id, 0)
+            self._insert(folded_name, product_id, 1)
+            for word in folded_name.split()[1:]:
+                self._insert(word, product_id, 1)
+            product_trigrams = _trigrams(folded_id) | _trigrams(folded_name)
+            self.trigram_counts[product_id] = len(product_trigrams)
+            for trigram in product_trigrams:
+                self.trigrams.setdefault(trigram, set()).add(product_id)
+        self._build_top_matches()
+
+    def _insert(self, key: str, product_id: str, rank: int):
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault("", {})
+        node[""][product_id] = min(rank, node[""].get(product_id, rank))
+
+    def _build_top_matches(self):
+        """Calcule, des feuilles vers la racine, les TOP_K meilleurs produits de chaque sous-arbre.
+        Les entrées (rang, longueur de la clé, libellé, ID) sont partagées entre ancêtres : pour un préfixe
+        donné, trier par longueur de clé revient à trier par profondeur sous le préfixe."""
+        nodes, stack = [], [(self.trie, 0)]
+        while stack:
+            node, depth = stack.pop()
+            children = [child for char, child in node.items() if char] # écarte la clé "" (fin de clé)
+            nodes.append((node, depth, children))
+            stack += [(child, depth + 1) for child in children]
+        for node, depth, children in reversed(nodes):
+            sources = [child[None] for child in children]
+            terminal = node.get("")
+            if terminal:
+                sources.append(sorted((rank, depth, self.labels[product_id], product_id) for product_id, rank in terminal.items()))
+            elif len(sources) == 1:
+                # Chaîne sans embranchement (la plupart des nœuds) : même liste que l'unique enfant
+                node[None] = sources[0]
+                continue
+            top, seen = [], set()
+            # Une clé d'ID (rang 0) plus longue passe devant des mots de noms plus courts (rang 1)
+            for entry in heapq.merge(*sources):
+                if entry[3] in seen: continue
+                seen.add(entry[3])
+                top.append(entry)
+                if len(top) == self.TOP_K: break
+            node[None] = top
+
+    def _prefix_matches(self, prefix: str, limit: int) -> Dict[str, tuple]:
+        """Les `limit` (au plus TOP_K) meilleurs produits dont une clé commence par le préfixe, classés par (rang, profondeur, libellé)."""
+        node = self.trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return {}
+        return {product_id: (rank, key_length - len(prefix)) for rank, key_length, _, product_id in node[None][:limit]}
+
+    def search(self, query: str, limit: int = SELECT_MAX_OPTIONS) -> List[str]:
+        folded = _normalize_search_text(query)
+        if not folded:
+            return list(self.labels)[:limit]
+        prefix_matches = self._prefix_matches(folded, limit)
+        results = list(prefix_matches)
+        if len(results) >= limit:
+            return results
+
+        query_trigrams = _trigrams(folded)
+        overlaps = Counter()
+        for trigram in query_trigrams:
+            overlaps.update(self.trigrams.get(trigram, ()))
+        scored = []
+        for product_id, overlap in overlaps.items():
+            if product_id in prefix_matches: continue
+            # Part des trigrammes de la saisie retrouvés dans le produit ; à égalité, le produit le plus court
+            coverage = overlap / len(query_trigrams)
+            if coverage >= self.MIN_TRIGRAM_COVERAGE:
+                scored.append((coverage, -self.trigram_counts[product_id], product_id))
+        results += [product_id for _, _, product_id in heapq.nlargest(limit - len(results), scored)]
+        return results
+
+class CatalogueViewCache:
+    """
+    Composants du catalogue pré-calculés pour une version du catalogue : pages de catégories et de produits
+    (au plus 25 entrées par menu), options des produits et embeds produits. Naviguer ne coûte ensuite
+    qu'une copie de page, quelle que soit la taille du catalogue.
+    """
+    def __init__(self, cog: 'CatalogueCog', catalogue):
+        self.version = catalogue.version
+        # Les valeurs des menus sont des indices : un libellé tronqué à 100 caractères ne permettrait plus de retrouver l'entrée
+        self.categories: List[str] = list(catalogue.categories)
+        self.category_pages = self._paginate([discord.SelectOption(label=cat[:100], value=str(i)) for i, cat in enumerate(self.categories)])
+        self.product_pages: Dict[str, List[List[discord.SelectOption]]] = {}
+        self.option_choices: Dict[str, List[List[discord.SelectOption]]] = {}
+        self.product_embeds: Dict[str, discord.Embed] = {}
+        for category in catalogue.categories:
+            products = catalogue.products_in(category)
+            self.product_pages[category] = self._paginate([discord.SelectOption(label=p['name'][:100], value=p['id']) for p in products])
+            for product in products:
+                self.product_embeds[product['id']] = cog.create_product_embed(product)
+                if product.get("options"):
+                    self.option_choices[product['id']] = self.build_option_pages(product)
+
+    @classmethod
+    def build_option_pages(cls, product: Dict[str, Any]) -> List[List[discord.SelectOption]]:
+        currency = product.get("currency", "EUR")
+        return cls._paginate([
+            discord.SelectOption(label=f"{opt['name']} ({opt['price']:.2f} {currency})"[:100], value=str(i))
+            for i, opt in enumerate(product.get('options') or [])
+        ])
+
+    @staticmethod
+    def _paginate(options: List[discord.SelectOption]) -> List[List[discord.SelectOption]]:
+        return [options[i:i + SELECT_MAX_OPTIONS] for i in range(0, len(options), SELECT_MAX_OPTIONS)] or [[]]
+
 class OptionSelect(discord.ui.Select):
-    def __init__(self, product: Dict, manager: 'ManagerCog'):
+    def __init__(self, product: Dict, manager: 'ManagerCog', choices: List[discord.SelectOption], page: int = 0, page_count: int = 1):
         self.product = product
         self.manager = manager
-        currency = product.get("currency", "EUR")
-        
-        options = [
-            discord.SelectOption(
-                label=f"{opt['name']} ({opt['price']:.2f} {currency})",
-                value=opt['name']
-            )
-            for opt in product.get('options', [])
-        ]
-        super().__init__(placeholder="Choisissez une option...", options=options, custom_id=f"option_select:{product['id']}")
+        placeholder = f"Choisissez une option... (page {page + 1}/{page_count})" if page_count > 1 else "Choisissez une option..."
+        super().__init__(placeholder=placeholder, options=list(choices), custom_id=f"option_select:{product['id']}")
 
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
-        selected_option_name = self.values[0]
-        selected_option = next((opt for opt in self.product['options'] if opt['name'] == selected_option_name), None)
+        # L'indice désigne l'option affichée ; elle est revalidée par son nom dans le catalogue actuel
+        options = self.product.get('options') or []
+        index = int(self.values[0])
+        selected_option = self.manager.get_product_option(self.product['id'], options[index]['name']) if index < len(options) else None
 
         if not selected_option:
             return await interaction.followup.send("Option invalide.", ephemeral=True)
@@ -213,81 +358,131 @@ class OptionSelect(discord.ui.Select):
         action_view = ProductActionView(self.product, self.manager, interaction.user, option=selected_option)
         await action_view.start_purchase_flow(interaction)
 
-class ProductSelect(discord.ui.Select):
-    def __init__(self, cog: 'CatalogueCog', products: List[Dict]):
-        self.cog = cog
-        self.products = products
-        options = [discord.SelectOption(label=p['name'][:100], value=p['id']) for p in products]
-        super().__init__(placeholder="Choisissez un produit pour voir les détails...", options=options, custom_id="product_select_menu")
-
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer()
-        product_id = self.values[0]
-        product = self.cog.manager.get_product(product_id)
-        if not product:
-            return await interaction.edit_original_response(content="Ce produit n'existe plus.", view=None, embed=None)
-
-        embed = self.cog.create_product_embed(product)
-        view = self.view # Re-use the parent view
-        
-        # Remove old action view if it exists
-        action_view_item = next((item for item in view.children if isinstance(item, ProductActionView)), None)
-        if action_view_item:
-            view.remove_item(action_view_item)
-            
-        # Create and add the correct action view
-        if product.get("options"):
-            action_view = discord.ui.View(timeout=180)
-            action_view.add_item(OptionSelect(product, self.cog.manager))
-        else:
-            action_view = ProductActionView(product, self.cog.manager, interaction.user)
-            
-        # This is a bit tricky. We can't add a View to a View. We add its items.
-        for item in action_view.children:
-            view.add_item(item)
-            
-        await interaction.edit_original_response(embed=embed, view=view)
+def add_option_controls(view: discord.ui.View, product: Dict, manager: 'ManagerCog', pages: List[List[discord.SelectOption]], page: int, on_page, row: int):
+    """Ajoute le menu des options d'un produit (page `page`) et, au-delà de 25 options, les boutons de page."""
+    page = max(0, min(page, len(pages) - 1))
+    select = OptionSelect(product, manager, pages[page], page, len(pages))
+    select.row = row
+    view.add_item(select)
+    if len(pages) > 1:
+        for label, target, enabled in (("◀ Options", page - 1, page > 0), ("Options ▶", page + 1, page < len(pages) - 1)):
+            button = discord.ui.Button(label=label, style=discord.ButtonStyle.secondary, disabled=not enabled, row=row + 1)
+            async def go_to_page(interaction: discord.Interaction, target: int = target):
+                await on_page(interaction, target)
+            button.callback = go_to_page
+            view.add_item(button)
+
+class OptionSelectView(discord.ui.View):
+    """Choix de l'option d'un produit, paginé par 25."""
+    def __init__(self, product: Dict, manager: 'ManagerCog', pages: Optional[List[List[discord.SelectOption]]] = None, page: int = 0):
+        super().__init__(timeout=180)
+        self.product = product
+        self.manager = manager
+        self.pages = pages or CatalogueViewCache.build_option_pages(product)
+        add_option_controls(self, product, manager, self.pages, page, self.show_page, row=0)
 
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        await interaction.response.edit_message(view=OptionSelectView(self.product, self.manager, self.pages, page))
 
 class CatalogueBrowseView(discord.ui.View):
-    def __init__(self, cog: 'CatalogueCog', categories: List[str]):
+    """Navigation dans le catalogue : catégories et produits paginés par 25, puis fiche produit et achat."""
+    def __init__(self, cog: 'CatalogueCog', category_page: int = 0, category: Optional[str] = None, product_page: int = 0):
         super().__init__(timeout=300)
         self.cog = cog
         self.manager = cog.manager
-        
-        self.add_item(discord.ui.Select(
-            placeholder="Choisissez une catégorie...",
-            options=[discord.SelectOption(label=cat) for cat in categories],
-            custom_id="category_select_menu"
-        ))
-        
-    @discord.ui.select(custom_id="category_select_menu")
-    async def on_category_select(self, interaction: discord.Interaction, select: discord.ui.Select):
-        await interaction.response.defer()
-        category = select.values[0]
-        products_in_category = [p for p in self.manager.products if p.get('category') == category]
+        self.cache = cog.get_view_cache()
+        self.category_page = min(category_page, len(self.cache.category_pages) - 1)
+        self.category = category
+        self.product_page = product_page
+
+        category_select = discord.ui.Select(
+            placeholder=self._page_placeholder("Choisissez une catégorie...", self.category_page, len(self.cache.category_pages)),
+            options=list(self.cache.category_pages[self.category_page]) or [discord.SelectOption(label="Catalogue vide", value="__empty__")],
+            row=0
+        )
+        category_select.callback = self.on_category_select
+        self.add_item(category_select)
+
+        product_pages = self.cache.product_pages.get(category, [[]]) if category else [[]]
+        self.product_page = min(product_page, len(product_pages) - 1)
+        if category and product_pages[self.product_page]:
+            product_select = discord.ui.Select(
+                placeholder=self._page_placeholder("Choisissez un produit pour voir les détails...", self.product_page, len(product_pages)),
+                options=list(product_pages[self.product_page]),
+                row=1
+            )
+            product_select.callback = self.on_product_select
+            self.add_item(product_select)
+
+        if len(self.cache.category_pages) > 1:
+            self._add_page_button("◀ Catégories", self.category_page > 0, lambda: (self.category_page - 1, None, 0))
+            self._add_page_button("Catégories ▶", self.category_page < len(self.cache.category_pages) - 1, lambda: (self.category_page + 1, None, 0))
+        if len(product_pages) > 1:
+            self._add_page_button("◀ Produits", self.product_page > 0, lambda: (self.category_page, self.category, self.product_page - 1))
+            self._add_page_button("Produits ▶", self.product_page < len(product_pages) - 1, lambda: (self.category_page, self.category, self.product_page + 1))
+
+    @staticmethod
+    def _page_placeholder(text: str, page: int, page_count: int) -> str:
+        return f"{text} (page {page + 1}/{page_count})" if page_count > 1 else text
+
+    def _add_page_button(self, label: str, enabled: bool, target):
+        button = discord.ui.Button(label=label, style=discord.ButtonStyle.secondary, disabled=not enabled, row=2)
+        async def go_to_page(interaction: discord.Interaction):
+            category_page, category, product_page = target()
+            await self._show(interaction, CatalogueBrowseView(self.cog, category_page, category, product_page))
+        button.callback = go_to_page
+        self.add_item(button)
+
+    def _new_view(self) -> 'CatalogueBrowseView':
+        # Un rechargement du catalogue peut avoir supprimé la catégorie affichée
+        if self.category and self.category not in self.cog.get_view_cache().product_pages:
+            return CatalogueBrowseView(self.cog)
+        return CatalogueBrowseView(self.cog, self.category_page, self.category, self.product_page)
+
+    async def _show(self, interaction: discord.Interaction, view: 'CatalogueBrowseView', embed: Optional[discord.Embed] = None):
+        if embed is None:
+            embed = discord.Embed(
+                title=f"Catalogue - {view.category}" if view.category else "Bienvenue au Catalogue ResellBoost",
+                description=("Veuillez sélectionner un produit dans le menu ci-dessous pour afficher ses détails et l'acheter."
+                             if view.category else "Veuillez choisir une catégorie dans le menu déroulant pour commencer."),
+                color=discord.Color.blurple() if view.category else discord.Color.purple()
+            )
+        await interaction.response.edit_message(embed=embed, view=view)
 
-        # Create a new view for the next step
-        new_view = CatalogueBrowseView(self.cog, [opt.label for opt in select.options])
-        
-        # Remove old product select if it exists
-        product_select_item = next((item for item in new_view.children if isinstance(item, ProductSelect)), None)
-        if product_select_item:
-            new_view.remove_item(product_select_item)
+    async def on_category_select(self, interaction: discord.Interaction):
+        value = interaction.data["values"][0]
+        if value == "__empty__":
+            return await interaction.response.defer()
+        category = self.cache.categories[int(value)]
+        await self._show(interaction, CatalogueBrowseView(self.cog, self.category_page, category, 0))
+
+    async def on_product_select(self, interaction: discord.Interaction):
+        product = self.manager.get_product(interaction.data["values"][0])
+        if not product:
+            return await interaction.response.edit_message(content="Ce produit n'existe plus.", view=None, embed=None)
+        await self._show_product(interaction, product, 0)
+
+    async def _show_product(self, interaction: discord.Interaction, product: Dict[str, Any], option_page: int):
+        view = self._new_view()
+        if product.get("options"):
+            pages = view.cache.option_choices.get(product['id']) or CatalogueViewCache.build_option_pages(product)
+            async def show_option_page(page_interaction: discord.Interaction, page: int):
+                await view._show_product(page_interaction, product, page)
+            add_option_controls(view, product, self.manager, pages, option_page, show_option_page, row=3)
+        else:
+            # Les éléments d'achat gardent leurs callbacks liés à leur vue d'origine
+            for item in ProductActionView(product, self.manager, interaction.user).children:
+                item.row = 4
+                view.add_item(item)
             
-        new_view.add_item(ProductSelect(self.cog, products_in_category))
-        
-        embed = discord.Embed(
-            title=f"Catalogue - {category}",
-            description="Veuillez sélectionner un produit dans le menu ci-dessous pour afficher ses détails et l'acheter.",
-            color=discord.Color.blurple()
-        )
-        await interaction.edit_original_response(embed=embed, view=new_view)
-        
+        await self._show(interaction, view, self.cog.get_product_embed(product))
+
 class CatalogueCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
+        self._view_cache: Optional[CatalogueViewCache] = None
+        self._search_index: Optional[ProductSearchIndex] = None
 
     async def cog_load(self):
         self.manager = self.bot.get_cog('ManagerCog')
@@ -299,12 +494,10 @@ class CatalogueCog(commands.Cog):
     def get_display_price(self, product: Dict[str, Any]) -> str:
         currency = product.get("currency", "EUR")
         if "options" in product and product.get("options"):
-            try:
-                prices = [opt['price'] for opt in product['options']]
-                min_price = min(prices)
-                return f"À partir de `{min_price:.2f} {currency}`"
-            except (ValueError, TypeError):
+            min_price = self.manager.catalogue.min_price(product.get('id'))
+            if min_price is None:
                  return "`Prix variable`"
+            return f"À partir de `{min_price:.2f} {currency}`"
         elif "price_text" in product:
             return f"`{product['price_text']}`"
         else:
@@ -327,13 +520,19 @@ class CatalogueCog(commands.Cog):
         embed.add_field(name="Catégorie", value=product.get("category", "N/A"), inline=True)
         return embed
     
+    def get_view_cache(self) -> CatalogueViewCache:
+        if self._view_cache is None or self._view_cache.version != self.manager.catalogue.version:
+            self._view_cache = CatalogueViewCache(self, self.manager.catalogue)
+        return self._view_cache
+
+    def get_product_embed(self, product: Dict[str, Any]) -> discord.Embed:
+        return self.get_view_cache().product_embeds.get(product['id']) or self.create_product_embed(product)
+
     @app_commands.command(name="catalogue", description="Affiche les produits disponibles de manière interactive.")
     async def catalogue(self, interaction: discord.Interaction):
         if not self.manager: return await interaction.response.send_message("Erreur interne.", ephemeral=True)
         
-        categories = sorted(list(set(p['category'] for p in self.manager.products)))
-        
-        view = CatalogueBrowseView(self, categories)
+        view = CatalogueBrowseView(self)
         embed = discord.Embed(
             title="Bienvenue au Catalogue ResellBoost",
             description="Veuillez choisir une catégorie dans le menu déroulant pour commencer.",
@@ -342,6 +541,11 @@ class CatalogueCog(commands.Cog):
         await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 
+    def get_search_index(self) -> ProductSearchIndex:
+        if self._search_index is None or self._search_index.version != self.manager.catalogue.version:
+            self._search_index = ProductSearchIndex(self.manager.catalogue.products, self.manager.catalogue.version)
+        return self._search_index
+
     @app_commands.command(name="produit", description="Affiche les détails d'un produit par son ID.")
     @app_commands.describe(id="L'ID unique du produit (ex: vbucks)")
     async def produit(self, interaction: discord.Interaction, id: str):
@@ -349,17 +553,24 @@ class CatalogueCog(commands.Cog):
         
         product = self.manager.get_product(id)
         if not product:
-            return await interaction.response.send_message("Ce produit est introuvable.", ephemeral=True)
+            suggestions = self.get_search_index().search(id, limit=3)
+            hint = f" Vouliez-vous dire : {', '.join(f'`{product_id}`' for product_id in suggestions)} ?" if suggestions else ""
+            return await interaction.response.send_message(f"Ce produit est introuvable.{hint}", ephemeral=True)
 
-        embed = self.create_product_embed(product)
+        embed = self.get_product_embed(product)
         
         if product.get("options"):
-            view = discord.ui.View(timeout=180)
-            view.add_item(OptionSelect(product, self.manager))
+            view = OptionSelectView(product, self.manager, self.get_view_cache().option_choices.get(product['id']))
         else:
             view = ProductActionView(product, self.manager, interaction.user)
             
         await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
+    @produit.autocomplete('id')
+    async def produit_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        if not self.manager: return []
+        index = self.get_search_index()
+        return [app_commands.Choice(name=index.labels[product_id], value=product_id) for product_id in index.search(current)]
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(CatalogueCog(bot))
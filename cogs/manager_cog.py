@@ -11,8 +11,17 @@ import math
 import uuid
 from typing import List, Dict, Any, Optional
 import aiofiles
+import aiohttp
 import re
 import traceback
+import unicodedata
+import time
+import gzip
+from collections import deque, Counter, OrderedDict
+import heapq
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Dépendance pour la génération d'image
 try:
@@ -31,6 +40,925 @@ try:
 except ImportError:
     AI_AVAILABLE = False
 
+# --- Utilitaires de texte (partagés par les index de recherche) ---
+
+FRENCH_STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette dans de des du elle en est et etre eux il ils je la le les leur leurs lui ma mais me
+meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos
+votre vous y c d j l m n s t qu ca cela comment quoi quel quelle quels quelles est sont ai as avez ont faire fait
+peux peut puis veux veut voudrais svp stp bonjour salut merci
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def fold_accents(text: str) -> str:
+    """Supprime les accents et met en minuscules ("Problème" -> "probleme")."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize_text(text: str, remove_stopwords: bool = True) -> List[str]:
+    """Découpe un texte français en termes normalisés (accents repliés, mots vides et pluriels simples retirés)."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(fold_accents(text)):
+        if remove_stopwords and token in FRENCH_STOPWORDS:
+            continue
+        if len(token) > 4 and token[-1] in "sx":
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+# --- Catalogue produits ---
+
+class ProductCatalogue:
+    """
+    Vue indexée de products.json, construite une fois par chargement et jamais modifiée ensuite :
+    un rechargement construit un nouveau catalogue et remplace la référence d'un coup.
+    """
+    def __init__(self, products: List[Dict[str, Any]], version: int = 0):
+        self.products = products
+        self.version = version
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_category: Dict[str, List[Dict[str, Any]]] = {}
+        self.options: Dict[tuple, Dict[str, Any]] = {}
+        self.min_prices: Dict[str, Optional[float]] = {}
+        for product in products:
+            product_id = product.get('id')
+            if product_id is None: continue
+            self.by_id[product_id] = product
+            self.by_category.setdefault(product.get('category', 'Autre'), []).append(product)
+            for option in product.get('options') or []:
+                self.options[(product_id, option.get('name'))] = option
+            self.min_prices[product_id] = self._compute_min_price(product)
+        self.categories = sorted(self.by_category)
+
+    @staticmethod
+    def _compute_min_price(product: Dict[str, Any]) -> Optional[float]:
+        if product.get('options'):
+            try:
+                return min(opt['price'] for opt in product['options'])
+            except (KeyError, ValueError, TypeError):
+                return None
+        price = product.get('price')
+        return price if isinstance(price, (int, float)) and price >= 0 else None
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(product_id)
+
+    def get_option(self, product_id: str, option_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self.options.get((product_id, option_name))
+
+    def products_in(self, category: str) -> List[Dict[str, Any]]:
+        return self.by_category.get(category, [])
+
+    def min_price(self, product_id: str) -> Optional[float]:
+        return self.min_prices.get(product_id)
+
+# --- Commissions d'affiliation ---
+
+class AffiliateCommissionEngine:
+    """
+    Calcule le taux de commission effectif d'un parrain (palier de niveau + booster hebdo + bonus de fidélité + bonus VIP).
+    Les paliers triés sont mis en cache par version de config, et le taux de chaque parrain jusqu'à ce que
+    son niveau, son VIP ou son booster change (invalidate) ou que sa période de grâce VIP se termine.
+    Chaque commission versée est journalisée (une ligne JSON) avec les entrées du calcul, pour les audits.
+    """
+    def __init__(self, manager: 'ManagerCog', ledger_path: str):
+        self.manager = manager
+        self.ledger_path = ledger_path
+        self._tiers: tuple = (None, [], [])
+        self._rates: Dict[str, tuple] = {}
+        self.stats = Counter()
+
+    def _sorted_tiers(self) -> tuple:
+        version = self.manager.data_versions.get("config", 0)
+        if self._tiers[0] != version:
+            gamification = self.manager.config.get("GAMIFICATION_CONFIG", {})
+            commission_tiers = gamification.get("AFFILIATE_SYSTEM", {}).get("COMMISSION_TIERS", [])
+            vip_tiers = gamification.get("VIP_SYSTEM", {}).get("PREMIUM", {}).get("COMMISSION_BONUS_TIERS", [])
+            self._tiers = (
+                version,
+                sorted(commission_tiers, key=lambda x: x['level'], reverse=True),
+                sorted(vip_tiers, key=lambda x: x['consecutive_months'], reverse=True)
+            )
+            self._rates.clear()
+        return self._tiers
+
+    @staticmethod
+    def rate_inputs(referrer_data: Dict[str, Any], now_ts: float) -> tuple[Dict[str, Any], float]:
+        """Extrait les données qui déterminent le taux, et l'instant jusqu'auquel elles restent valables."""
+        inputs = {
+            "level": referrer_data.get('level', 1),
+            "booster": referrer_data.get('affiliate_booster', 0.0),
+            "loyalty": bool(referrer_data.get("permanent_affiliate_bonus")),
+            "vip": None,
+            "consecutive_weeks": 0
+        }
+        valid_until = float('inf')
+        vip_info = referrer_data.get("vip_premium")
+        if vip_info:
+            status = vip_info.get("status", "expired")
+            grace_end = vip_info.get("grace_end_timestamp") or 0
+            if status == "active":
+                inputs["vip"] = "active"
+            elif status == "grace" and now_ts < grace_end:
+                inputs["vip"] = "grace"
+                valid_until = grace_end
+            if inputs["vip"]:
+                inputs["consecutive_weeks"] = vip_info.get("consecutive_weeks", 1)
+        return inputs, valid_until
+
+    def compute_rate(self, inputs: Dict[str, Any]) -> Dict[str, float]:
+        """Décompose le taux pour des entrées données, avec les paliers de la config courante."""
+        _, commission_tiers, vip_tiers = self._sorted_tiers()
+        gamification = self.manager.config.get("GAMIFICATION_CONFIG", {})
+        affiliate_config = gamification.get("AFFILIATE_SYSTEM", {})
+        vip_config = gamification.get("VIP_SYSTEM", {}).get("PREMIUM", {})
+
+        base_rate = 0.0
+        for tier in commission_tiers:
+            if inputs["level"] >= tier['level']:
+                base_rate = tier['rate']
+                break
+
+        loyalty = affiliate_config.get("PERMANENT_LOYALTY_BONUS", {}).get("RATE", 0.0) if inputs["loyalty"] else 0.0
+
+        vip_bonus = 0.0
+        if inputs["vip"]:
+            consecutive_months = (inputs["consecutive_weeks"] // 4) + 1
+            for tier in vip_tiers:
+                if consecutive_months >= tier['consecutive_months']:
+                    vip_bonus = tier['bonus']
+                    break
+            if inputs["vip"] == "grace":
+                vip_bonus *= vip_config.get("GRACE_PERIOD_BENEFIT_MULTIPLIER", 0.5)
+
+        booster = inputs["booster"]
+        return {"base": base_rate, "booster": booster, "loyalty": loyalty, "vip": vip_bonus, "total": base_rate + booster + loyalty + vip_bonus}
+
+    def effective_rate(self, referrer_id: str, now_ts: Optional[float] = None) -> tuple[Dict[str, float], Dict[str, Any]]:
+        """Taux effectif (décomposé) d'un parrain et les entrées utilisées, servis depuis le cache tant qu'ils sont valables."""
+        now_ts = now_ts if now_ts is not None else datetime.now(timezone.utc).timestamp()
+        self._sorted_tiers()
+        cached = self._rates.get(referrer_id)
+        if cached and now_ts < cached[2]:
+            self.stats["hits"] += 1
+            return cached[0], cached[1]
+        self.stats["misses"] += 1
+        inputs, valid_until = self.rate_inputs(self.manager.user_data.get(referrer_id, {}), now_ts)
+        breakdown = self.compute_rate(inputs)
+        self._rates[referrer_id] = (breakdown, inputs, valid_until)
+        return breakdown, inputs
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """À appeler quand le niveau, le VIP ou le booster d'un membre change (sans argument : tous les membres)."""
+        if user_id is None:
+            self._rates.clear()
+        else:
+            self._rates.pop(str(user_id), None)
+
+    def append_ledger(self, record: Dict[str, Any]):
+        """Journalise une commission versée (opération bloquante : à lancer hors de la boucle d'événements)."""
+        os.makedirs(os.path.dirname(self.ledger_path) or ".", exist_ok=True)
+        with open(self.ledger_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def recompute_period(self, start_ts: float, end_ts: float) -> Dict[str, Any]:
+        """
+        Recalcule en masse les commissions journalisées sur une période avec les paliers de la config courante
+        et les compare aux montants versés, par parrain (opération bloquante).
+        """
+        per_referrer: Dict[str, Dict[str, float]] = {}
+        entries = 0
+        if os.path.exists(self.ledger_path):
+            with open(self.ledger_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # Ligne tronquée (arrêt brutal pendant une écriture)
+                    if not (start_ts <= record.get("timestamp", 0) < end_ts):
+                        continue
+                    entries += 1
+                    expected = record["commissionable_amount"] * self.compute_rate(record["inputs"])["total"]
+                    totals = per_referrer.setdefault(record["referrer_id"], {"sales": 0, "paid": 0.0, "recomputed": 0.0})
+                    totals["sales"] += 1
+                    totals["paid"] += record["commission"]
+                    totals["recomputed"] += expected
+        for totals in per_referrer.values():
+            totals["delta"] = totals["recomputed"] - totals["paid"]
+        return {
+            "entries": entries,
+            "paid": sum(t["paid"] for t in per_referrer.values()),
+            "recomputed": sum(t["recomputed"] for t in per_referrer.values()),
+            "per_referrer": per_referrer
+        }
+
+# --- Graphe de parrainage ---
+
+class ReferralGraph:
+    """
+    Index bidirectionnel du parrainage (parrain -> filleuls) construit depuis le champ 'referrer' des membres,
+    avec des agrégats tenus à jour au fil de l'eau : histogramme des niveaux des filleuls, dépenses cumulées
+    et nombre de filleuls actifs (ayant fait au moins un achat).
+    """
+    def __init__(self):
+        self.children: Dict[str, set] = {}
+        self.aggregates: Dict[str, Dict[str, Any]] = {}
+
+    def _aggregate(self, referrer_id: str) -> Dict[str, Any]:
+        return self.aggregates.setdefault(referrer_id, {"levels": Counter(), "spend": 0.0, "active": 0})
+
+    def _apply(self, referrer_id: str, child_data: Dict[str, Any], sign: int):
+        aggregate = self._aggregate(referrer_id)
+        level = child_data.get("level", 1)
+        aggregate["levels"][level] += sign
+        if aggregate["levels"][level] <= 0:
+            del aggregate["levels"][level]
+        aggregate["spend"] += sign * child_data.get("purchase_total_value", 0.0)
+        if child_data.get("purchase_count", 0) > 0:
+            aggregate["active"] += sign
+
+    def rebuild(self, user_data: Dict[str, Dict[str, Any]]):
+        self.children.clear()
+        self.aggregates.clear()
+        for child_id, child_data in user_data.items():
+            referrer_id = child_data.get("referrer")
+            if referrer_id:
+                self.children.setdefault(referrer_id, set()).add(child_id)
+                self._apply(referrer_id, child_data, 1)
+
+    def link(self, child_id: str, referrer_id: str, child_data: Dict[str, Any], previous_referrer: Optional[str] = None):
+        """Rattache un filleul à son parrain (et le retire de l'ancien s'il avait déjà été parrainé)."""
+        if previous_referrer and child_id in self.children.get(previous_referrer, ()):
+            self.children[previous_referrer].discard(child_id)
+            self._apply(previous_referrer, child_data, -1)
+        if child_id not in self.children.setdefault(referrer_id, set()):
+            self.children[referrer_id].add(child_id)
+            self._apply(referrer_id, child_data, 1)
+
+    def on_child_update(self, referrer_id: str, field: str, old_value: float, new_value: float):
+        """Répercute la modification d'un compteur d'un filleul (niveau, achats) sur les agrégats de son parrain."""
+        aggregate = self._aggregate(referrer_id)
+        if field == "level":
+            aggregate["levels"][old_value] -= 1
+            if aggregate["levels"][old_value] <= 0:
+                del aggregate["levels"][old_value]
+            aggregate["levels"][new_value] += 1
+        elif field == "purchase_total_value":
+            aggregate["spend"] += new_value - old_value
+        elif field == "purchase_count" and (old_value > 0) != (new_value > 0):
+            aggregate["active"] += 1 if new_value > 0 else -1
+
+    def children_of(self, referrer_id: str) -> set:
+        return self.children.get(referrer_id, set())
+
+    def count_at_least(self, referrer_id: str, level: int) -> int:
+        """Nombre de filleuls ayant atteint un niveau donné (coût proportionnel au nombre de niveaux distincts)."""
+        levels = self.aggregates.get(referrer_id, {}).get("levels", {})
+        return sum(count for child_level, count in levels.items() if child_level >= level)
+
+    def summary(self, referrer_id: str) -> Dict[str, Any]:
+        aggregate = self.aggregates.get(referrer_id, {"spend": 0.0, "active": 0})
+        return {"children": len(self.children_of(referrer_id)), "spend": aggregate["spend"], "active": aggregate["active"]}
+
+# --- Attribution des invitations ---
+
+class InviteAttributionService:
+    """
+    Attribue les arrivées aux invitations utilisées. Seuls des entiers sont conservés par code
+    (utilisations, ID de l'auteur, utilisations max, expiration). Les arrivées sont regroupées par fenêtre de rafale :
+    une seule lecture des invitations (appel REST) par rafale, dont le diff attribue toutes les arrivées du lot.
+    Les créations/suppressions d'invitations sont appliquées depuis les événements, sans relecture.
+    """
+    def __init__(self, burst_window: float = 2.0):
+        self.burst_window = burst_window
+        self.invites: Dict[int, Dict[str, tuple]] = {}
+        # Invitations à usage limité supprimées à leur dernière utilisation : (auteur, instant de suppression)
+        self._consumed: Dict[int, List[tuple]] = {}
+        self._pending: Dict[int, List[tuple]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.stats = Counter()
+
+    @staticmethod
+    def _entry(invite: discord.Invite) -> tuple:
+        expires_at = int(invite.created_at.timestamp() + invite.max_age) if invite.max_age and invite.created_at else 0
+        return (invite.uses or 0, invite.inviter.id if invite.inviter else 0, invite.max_uses or 0, expires_at)
+
+    async def refresh(self, guild: discord.Guild) -> Optional[Dict[str, tuple]]:
+        """Relit toutes les invitations de la guilde (un appel REST) et renvoie le nouvel état, ou None sans permission."""
+        self.stats["api_calls"] += 1
+        try:
+            invites = await guild.invites()
+        except discord.Forbidden:
+            print(f"Permissions manquantes pour lister les invitations dans la guilde {guild.name}")
+            return None
+        self.invites[guild.id] = {invite.code: self._entry(invite) for invite in invites}
+        return self.invites[guild.id]
+
+    def on_invite_create(self, invite: discord.Invite):
+        if invite.guild and invite.guild.id in self.invites:
+            self.invites[invite.guild.id][invite.code] = self._entry(invite)
+
+    def on_invite_delete(self, invite: discord.Invite):
+        if not invite.guild: return
+        uses, inviter_id, max_uses, expires_at = self.invites.get(invite.guild.id, {}).pop(invite.code, (0, 0, 0, 0))
+        # Candidat "dernière utilisation" seulement s'il restait exactement une utilisation et qu'il n'a pas expiré ;
+        # il ne comptera que pour une rafale proche que le diff des invitations n'explique pas entièrement.
+        if max_uses and inviter_id and uses + 1 == max_uses and not (expires_at and time.time() >= expires_at):
+            self._consumed.setdefault(invite.guild.id, []).append((inviter_id, time.monotonic()))
+
+    async def attribute(self, member: discord.Member) -> Optional[int]:
+        """ID de l'auteur de l'invitation utilisée par ce membre, ou None si elle ne peut pas être déterminée avec certitude."""
+        guild = member.guild
+        self.stats["joins"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(guild.id, []).append((member.id, future, time.monotonic()))
+        worker = self._workers.get(guild.id)
+        if worker is None or worker.done():
+            self._workers[guild.id] = asyncio.create_task(self._drain(guild))
+        return await future
+
+    async def _drain(self, guild: discord.Guild):
+        while self._pending.get(guild.id):
+            await asyncio.sleep(self.burst_window)
+            batch = self._pending.pop(guild.id, [])
+            attributions = [None] * len(batch)
+            try:
+                attributions = await self._attribute_batch(guild, len(batch), batch[0][2])
+            except Exception as e:
+                print(f"Erreur lors de l'attribution des invitations : {e}")
+            finally:
+                # Même en cas d'annulation, aucune arrivée ne doit rester en attente
+                for (_, future, _), inviter_id in zip(batch, attributions):
+                    if not future.done():
+                        future.set_result(inviter_id)
+
+    async def _attribute_batch(self, guild: discord.Guild, join_count: int, first_join_at: float) -> List[Optional[int]]:
+        old = self.invites.get(guild.id)
+        new = await self.refresh(guild)
+        self.stats["batches"] += 1
+        if old is None or new is None:
+            self.stats["unattributed"] += join_count
+            return [None] * join_count
+
+        gained = Counter()
+        for code, (uses, inviter_id, _, _) in new.items():
+            # Code inconnu (création non reçue) : on ignore ses utilisations plutôt que de les compter toutes
+            delta = uses - old[code][0] if code in old else 0
+            if delta > 0 and inviter_id:
+                gained[inviter_id] += delta
+        # Une suppression ne compte comme utilisation que si elle a eu lieu pendant la rafale
+        # et pour les arrivées que le diff n'explique pas (révocations et expirations sont ignorées sinon).
+        unexplained = join_count - sum(gained.values())
+        for inviter_id, deleted_at in self._consumed.pop(guild.id, []):
+            if unexplained > 0 and deleted_at >= first_join_at - self.burst_window:
+                gained[inviter_id] += 1
+                unexplained -= 1
+
+        # Sans lien entre un membre et un code, l'attribution n'est sûre que si toutes les utilisations
+        # de la rafale viennent d'un même auteur : sinon, aucune attribution plutôt qu'une mauvaise.
+        if len(gained) == 1 and sum(gained.values()) >= join_count:
+            inviter_id = next(iter(gained))
+            self.stats["attributed"] += join_count
+            result = [inviter_id] * join_count
+        else:
+            if gained:
+                self.stats["ambiguous"] += join_count
+            else:
+                self.stats["unattributed"] += join_count
+            result = [None] * join_count
+        print(f"Invitations : {join_count} arrivée(s) traitée(s) avec 1 appel API "
+              f"({self.stats['api_calls'] / max(1, self.stats['joins']):.2f} appel/arrivée en moyenne).")
+        return result
+
+    def cancel(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        for batch in self._pending.values():
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_result(None)
+        self._pending.clear()
+
+# --- Validation des fichiers rechargeables à chaud ---
+
+def validate_config_data(data: Any):
+    if not isinstance(data, dict):
+        raise ValueError("config.json doit contenir un objet JSON.")
+    for section in ("CHANNELS", "ROLES", "GAMIFICATION_CONFIG", "TICKET_SYSTEM"):
+        if not isinstance(data.get(section), dict):
+            raise ValueError(f"Section '{section}' manquante ou invalide dans config.json.")
+    xp_config = data["GAMIFICATION_CONFIG"].get("XP_SYSTEM", {})
+    if not isinstance(xp_config, dict):
+        raise ValueError("GAMIFICATION_CONFIG.XP_SYSTEM doit être un objet.")
+    for key in ("LEVEL_UP_FORMULA_BASE_XP", "LEVEL_UP_FORMULA_MULTIPLIER"):
+        if not isinstance(xp_config.get(key), (int, float)):
+            raise ValueError(f"GAMIFICATION_CONFIG.XP_SYSTEM.{key} doit être un nombre.")
+
+def validate_products_data(data: Any):
+    if not isinstance(data, list):
+        raise ValueError("products.json doit contenir une liste de produits.")
+    seen_ids = set()
+    for index, product in enumerate(data):
+        if not isinstance(product, dict) or not product.get("id") or not product.get("name"):
+            raise ValueError(f"Produit n°{index + 1} invalide : 'id' et 'name' sont obligatoires.")
+        if product["id"] in seen_ids:
+            raise ValueError(f"ID de produit en double : '{product['id']}'.")
+        seen_ids.add(product["id"])
+        if not isinstance(product.get("options") or [], list):
+            raise ValueError(f"Options invalides pour le produit '{product['id']}' : une liste est attendue.")
+        for option in product.get("options") or []:
+            if not isinstance(option, dict) or not isinstance(option.get("price"), (int, float)) or not option.get("name"):
+                raise ValueError(f"Option invalide pour le produit '{product['id']}' : 'name' et 'price' sont obligatoires.")
+
+def validate_knowledge_base_data(data: Any):
+    if not isinstance(data, dict) or not isinstance(data.get("faqs", []), list):
+        raise ValueError("knowledge_base.json doit contenir un objet avec une liste 'faqs'.")
+    for index, faq in enumerate(data.get("faqs", [])):
+        if not isinstance(faq, dict) or not faq.get("question") or not faq.get("answer"):
+            raise ValueError(f"FAQ n°{index + 1} invalide : 'question' et 'answer' sont obligatoires.")
+
+# --- Archive des transcriptions de tickets ---
+
+TRANSACTION_CODE_PATTERN = re.compile(r"\bRB-[0-9A-Z]{4,}\b", re.IGNORECASE)
+USER_ID_PATTERN = re.compile(r"\b\d{17,20}\b")
+
+class TicketArchive:
+    """
+    Archive locale des tickets fermés : une transcription compressée (gzip) par ticket et un index inversé
+    sur les termes, les IDs utilisateurs ("user:<id>") et les codes de transaction ("rb-xxxx").
+    L'index est journalisé (une ligne JSON par ticket) et reconstruit en mémoire au chargement.
+    """
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.tickets: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, set] = {}
+        # Les écritures se font dans des threads : deux fermetures simultanées ne doivent pas entrelacer le journal
+        self._journal_lock = threading.Lock()
+
+    @staticmethod
+    def extract_terms(transcript: str, meta: Dict[str, Any]) -> set:
+        terms = set(tokenize_text(transcript))
+        terms.update(code.lower() for code in TRANSACTION_CODE_PATTERN.findall(transcript))
+        terms.update(f"user:{user_id}" for user_id in USER_ID_PATTERN.findall(transcript))
+        if meta.get("user_id"):
+            terms.add(f"user:{meta['user_id']}")
+        return terms
+
+    @staticmethod
+    def parse_query(query: str) -> List[str]:
+        """Transforme une recherche ("RB-1A2B", "<@123...>", mots libres) en termes de l'index."""
+        terms = [code.lower() for code in TRANSACTION_CODE_PATTERN.findall(query)]
+        query = TRANSACTION_CODE_PATTERN.sub(" ", query)
+        terms += [f"user:{user_id}" for user_id in USER_ID_PATTERN.findall(query)]
+        query = USER_ID_PATTERN.sub(" ", query)
+        return terms + tokenize_text(query)
+
+    def index(self, ticket_id: str, meta: Dict[str, Any], terms):
+        """Ajoute un ticket à l'index en mémoire (à appeler depuis la boucle d'événements, comme search/stats)."""
+        self.tickets[ticket_id] = meta
+        for term in terms:
+            self.postings.setdefault(term, set()).add(ticket_id)
+
+    def load(self) -> int:
+        """Reconstruit l'index en mémoire depuis le journal. Renvoie le nombre de tickets chargés."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.tickets.clear()
+        self.postings.clear()
+        index_path = os.path.join(self.directory, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return 0
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Ligne tronquée (arrêt brutal pendant une écriture)
+                self.index(record["id"], record["meta"], record["terms"])
+        return len(self.tickets)
+
+    def write(self, ticket_id: str, transcript: str, meta: Dict[str, Any]) -> tuple[Dict[str, Any], set]:
+        """
+        Compresse une transcription, extrait ses termes et les journalise (opération bloquante : à lancer hors
+        de la boucle d'événements). L'index en mémoire n'est pas touché : appeler index() ensuite sur la boucle.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        raw = transcript.encode("utf-8")
+        with gzip.open(os.path.join(self.directory, f"{ticket_id}.txt.gz"), "wb", compresslevel=9) as f:
+            f.write(raw)
+        meta = dict(meta, raw_bytes=len(raw))
+        terms = self.extract_terms(transcript, meta)
+        line = json.dumps({"id": ticket_id, "meta": meta, "terms": sorted(terms)}, ensure_ascii=False) + "\n"
+        with self._journal_lock:
+            with open(os.path.join(self.directory, self.INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(line)
+        return meta, terms
+
+    def add(self, ticket_id: str, transcript: str, meta: Dict[str, Any]):
+        """Version synchrone de write() + index(), pour un usage hors de la boucle d'événements."""
+        meta, terms = self.write(ticket_id, transcript, meta)
+        self.index(ticket_id, meta, terms)
+
+    def read(self, ticket_id: str) -> Optional[str]:
+        path = os.path.join(self.directory, f"{ticket_id}.txt.gz")
+        if ticket_id not in self.tickets or not os.path.exists(path):
+            return None
+        with gzip.open(path, "rb") as f:
+            return f.read().decode("utf-8")
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Tickets contenant tous les termes de la recherche, du plus récent au plus ancien."""
+        terms = self.parse_query(query)
+        if not terms:
+            return []
+        term_postings = sorted((self.postings.get(term, set()) for term in terms), key=len)
+        matches = set(term_postings[0])
+        for posting in term_postings[1:]:
+            matches &= posting
+            if not matches:
+                return []
+        ranked = heapq.nlargest(limit, matches, key=lambda ticket_id: self.tickets[ticket_id].get("closed_at", ""))
+        return [dict(self.tickets[ticket_id], id=ticket_id) for ticket_id in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        compressed = 0
+        for ticket_id in self.tickets:
+            try:
+                compressed += os.path.getsize(os.path.join(self.directory, f"{ticket_id}.txt.gz"))
+            except OSError:
+                pass
+        raw = sum(meta.get("raw_bytes", 0) for meta in self.tickets.values())
+        return {"tickets": len(self.tickets), "terms": len(self.postings), "raw_bytes": raw, "compressed_bytes": compressed}
+
+# --- Rendu des cartes de profil (hors de la boucle d'événements) ---
+
+PROFILE_CARD_SIZE = (900, 300)
+AVATAR_SIZE = (128, 128)
+
+PROFILE_CARD_FONTS = {"bold": "assets/Inter-Bold.ttf", "regular": "assets/Inter-Regular.ttf"}
+PROGRESS_BAR_BOX = (220, 180, 620, 30) # x, y, largeur, hauteur
+
+class ProfileCardAssets:
+    """
+    Ressources de rendu partagées par tous les rendus de cartes : polices chargées une fois par taille
+    et image de base pré-dessinée par palette (fond, surface arrondie, barre de progression vide).
+    Utilisée depuis les threads du pool de rendu, d'où le verrou.
+    """
+    def __init__(self):
+        self._fonts: Dict[tuple, Any] = {}
+        self._bases: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def font(self, style: str, size: int):
+        key = (style, size)
+        font = self._fonts.get(key)
+        if font is None:
+            with self._lock:
+                try:
+                    font = ImageFont.truetype(PROFILE_CARD_FONTS[style], size)
+                except IOError:
+                    font = ImageFont.load_default()
+                self._fonts[key] = font
+        return font
+
+    def base_image(self, palette: Dict[str, str]):
+        """Renvoie une copie de l'image de base de la palette (à dessiner librement)."""
+        key = tuple(sorted(palette.items()))
+        base = self._bases.get(key)
+        if base is None:
+            with self._lock:
+                W, H = PROFILE_CARD_SIZE
+                base = Image.new('RGB', (W, H), color=palette['background'])
+                draw = ImageDraw.Draw(base, 'RGBA')
+                draw.rounded_rectangle((20, 20, W-20, H-20), radius=20, fill=palette['surface'])
+                bar_x, bar_y, bar_w, bar_h = PROGRESS_BAR_BOX
+                draw.rounded_rectangle((bar_x, bar_y, bar_x + bar_w, bar_y + bar_h), radius=15, fill=palette['background'])
+                self._bases[key] = base
+        return base.copy()
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._bases.clear()
+
+PROFILE_CARD_ASSETS = ProfileCardAssets()
+
+class AvatarCache:
+    """
+    Cache des avatars indexé par `display_avatar.key` (la clé change quand le membre change d'avatar) :
+    - octets bruts en mémoire et sur disque, chacun en LRU borné en octets ;
+    - miniatures masquées (AVATAR_SIZE, RGBA) en mémoire, bornées en nombre.
+    Les téléchargements passent par une session HTTP dédiée avec timeout, et les demandes simultanées
+    d'un même avatar partagent un seul téléchargement.
+    """
+    def __init__(self, directory: str, memory_max_bytes: int, disk_max_bytes: int, max_thumbnails: int = 500, fetch_timeout: float = 5.0):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.max_thumbnails = max_thumbnails
+        self.fetch_timeout = fetch_timeout
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict() # clé -> taille, du moins au plus récemment utilisé
+        self._disk_bytes = 0
+        self._thumbnails: "OrderedDict[str, Any]" = OrderedDict()
+        self._thumbnail_lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = Counter()
+
+    def load_disk_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            entries.append((os.path.getmtime(path), file_name[:-len(".bin")], os.path.getsize(path)))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._prune_disk()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _remember(self, key: str, data: bytes):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _prune_disk(self):
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.fetch_timeout),
+                connector=aiohttp.TCPConnector(limit=8, ttl_dns_cache=300)
+            )
+        return self._session
+
+    async def get_bytes(self, asset: discord.Asset) -> Optional[bytes]:
+        key = asset.key
+        if key in self._memory:
+            self.stats["memory_hits"] += 1
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await self._load_or_fetch(key, asset)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            print(f"Impossible de charger l'avatar {key}: {e}")
+            return None
+        finally:
+            if not future.done():
+                future.set_result(None)
+            del self._inflight[key]
+
+    async def _load_or_fetch(self, key: str, asset: discord.Asset) -> Optional[bytes]:
+        if key in self._disk:
+            try:
+                async with aiofiles.open(self._disk_path(key), 'rb') as f:
+                    data = await f.read()
+                self.stats["disk_hits"] += 1
+                self._disk.move_to_end(key)
+                os.utime(self._disk_path(key))
+                self._remember(key, data)
+                return data
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+
+        self.stats["downloads"] += 1
+        session = await self._get_session()
+        async with session.get(asset.with_format("png").with_size(256).url) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.read()
+        self._remember(key, data)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            async with aiofiles.open(self._disk_path(key), 'wb') as f:
+                await f.write(data)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            self._prune_disk()
+        except OSError as e:
+            print(f"Impossible d'écrire l'avatar {key} sur le disque: {e}")
+        return data
+
+    def get_thumbnail(self, key: str):
+        with self._thumbnail_lock:
+            thumbnail = self._thumbnails.get(key)
+            if thumbnail is not None:
+                self._thumbnails.move_to_end(key)
+            return thumbnail
+
+    def build_thumbnail(self, key: str, data: bytes):
+        """Construit et mémorise la miniature masquée (bloquant : à lancer dans le pool de rendu)."""
+        thumbnail = make_avatar_thumbnail(data)
+        with self._thumbnail_lock:
+            self._thumbnails[key] = thumbnail
+            while len(self._thumbnails) > self.max_thumbnails:
+                self._thumbnails.popitem(last=False)
+        return thumbnail
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+class RenderQueueFull(Exception):
+    """Levée quand la file du pool de rendu est saturée : l'appelant se rabat sur un affichage sans image."""
+
+def make_avatar_thumbnail(avatar_data: bytes):
+    """Décode un avatar et le découpe en disque RGBA de AVATAR_SIZE, prêt à être collé sur la carte."""
+    avatar = Image.open(io.BytesIO(avatar_data)).convert("RGBA")
+    mask = Image.new('L', AVATAR_SIZE, 0)
+    draw_mask = ImageDraw.Draw(mask)
+    draw_mask.ellipse((0, 0) + AVATAR_SIZE, fill=255)
+    avatar = ImageOps.fit(avatar, mask.size, centering=(0.5, 0.5))
+    avatar.putalpha(mask)
+    return avatar
+
+def render_profile_card(card: Dict[str, Any], avatar=None, image_format: str = "png") -> bytes:
+    """
+    Dessine la carte de profil et l'encode (voir encode_image). Bloquant : à exécuter dans le pool de rendu.
+    `avatar` est une miniature déjà masquée (voir make_avatar_thumbnail), partagée en lecture seule.
+    """
+    palette = card["palette"]
+    W, H = PROFILE_CARD_SIZE
+    # Fond, surface et barre vide sont pré-dessinés : seules les parties dynamiques sont tracées ici
+    img = PROFILE_CARD_ASSETS.base_image(palette)
+    draw = ImageDraw.Draw(img, 'RGBA')
+
+    font_bold = PROFILE_CARD_ASSETS.font("bold", 36)
+    font_small = PROFILE_CARD_ASSETS.font("regular", 18)
+
+    if avatar is not None:
+        img.paste(avatar, (60, (H - AVATAR_SIZE[1]) // 2), avatar)
+
+    draw.text((220, 50), card["display_name"], font=font_bold, fill=palette['text'])
+
+    xp_in_level, xp_needed_for_level = card["xp_in_level"], card["xp_needed_for_level"]
+    progress = xp_in_level / xp_needed_for_level if xp_needed_for_level > 0 else 1
+    progress = min(max(progress, 0), 1)
+
+    draw.text((W - 60, 55), f"LVL {card['level']}", font=font_bold, fill=palette['accent'], anchor="ra")
+    
+    bar_x, bar_y, bar_w, bar_h = PROGRESS_BAR_BOX
+    if progress > 0:
+        draw.rounded_rectangle((bar_x, bar_y, bar_x + (bar_w * progress), bar_y + bar_h), radius=15, fill=palette['accent'])
+
+    xp_text = f"{xp_in_level} / {xp_needed_for_level} XP"
+    draw.text((225, 225), xp_text, font=font_small, fill=palette['text'])
+    
+    credits_text = f"Crédits: {card['store_credit']:.2f}"
+    draw.text((W - 60, 225), credits_text, font=font_small, fill=palette['text'], anchor="ra")
+    
+    return encode_image(img, image_format)
+
+LEADERBOARD_ROW_HEIGHT = 64
+LEADERBOARD_AVATAR_SIZE = (48, 48)
+
+def render_leaderboard_card(rows: List[Dict[str, Any]], avatars: Dict[str, Any], palette: Dict[str, str], image_format: str = "png") -> bytes:
+    """
+    Dessine le top XP hebdomadaire (rang, avatar, nom, niveau, XP) avec les ressources des cartes de profil.
+    `avatars` associe une clé d'avatar à sa miniature masquée. Bloquant : à exécuter dans le pool de rendu.
+    """
+    W = PROFILE_CARD_SIZE[0]
+    H = 110 + LEADERBOARD_ROW_HEIGHT * max(len(rows), 1)
+    img = Image.new('RGB', (W, H), color=palette['background'])
+    draw = ImageDraw.Draw(img, 'RGBA')
+    draw.rounded_rectangle((20, 20, W-20, H-20), radius=20, fill=palette['surface'])
+
+    font_title = PROFILE_CARD_ASSETS.font("bold", 32)
+    font_row = PROFILE_CARD_ASSETS.font("bold", 24)
+    font_small = PROFILE_CARD_ASSETS.font("regular", 18)
+    draw.text((50, 40), "Top XP de la semaine", font=font_title, fill=palette['text'])
+
+    for rank, row in enumerate(rows):
+        y = 95 + rank * LEADERBOARD_ROW_HEIGHT
+        if rank % 2 == 0:
+            draw.rounded_rectangle((40, y, W - 40, y + LEADERBOARD_ROW_HEIGHT - 8), radius=12, fill=palette['background'])
+        center_y = y + (LEADERBOARD_ROW_HEIGHT - 8) // 2
+        draw.text((80, center_y), f"#{rank + 1}", font=font_row, fill=palette['accent'] if rank < 3 else palette['text'], anchor="mm")
+        avatar = avatars.get(row.get("avatar_key"))
+        if avatar is not None:
+            small_avatar = avatar.resize(LEADERBOARD_AVATAR_SIZE, Image.LANCZOS)
+            img.paste(small_avatar, (120, center_y - LEADERBOARD_AVATAR_SIZE[1] // 2), small_avatar)
+        draw.text((185, center_y), row["display_name"][:28], font=font_row, fill=palette['text'], anchor="lm")
+        draw.text((W - 230, center_y), f"LVL {row['level']}", font=font_small, fill=palette['text'], anchor="rm")
+        draw.text((W - 60, center_y), f"{row['weekly_xp']} XP", font=font_row, fill=palette['accent'], anchor="rm")
+
+    if not rows:
+        draw.text((W // 2, 95 + LEADERBOARD_ROW_HEIGHT // 2), "Aucune activité cette semaine.", font=font_small, fill=palette['text'], anchor="mm")
+    return encode_image(img, image_format)
+
+IMAGE_FORMAT_EXTENSIONS = {"png": "png", "png_optimized": "png", "webp_lossless": "webp"}
+
+def encode_image(img, image_format: str = "png") -> bytes:
+    """Encode une image : "png" (rapide), "png_optimized" (plus petit, plus lent) ou "webp_lossless"."""
+    buffer = io.BytesIO()
+    if image_format == "png_optimized":
+        img.save(buffer, format='PNG', optimize=True)
+    elif image_format == "webp_lossless":
+        img.save(buffer, format='WEBP', lossless=True, quality=80, method=4)
+    else:
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class RenderedImageCache:
+    """Cache LRU d'images déjà encodées, borné en nombre d'entrées et en octets, indexé par empreinte du contenu."""
+    def __init__(self, max_entries: int = 500, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += len(data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes: return
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self._bytes += len(data)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0, "bytes_saved": self.bytes_saved
+        }
+
+class ImageRenderPool:
+    """
+    Pool de threads dédié au rendu d'images (Pillow relâche le GIL pendant le dessin et l'encodage).
+    La file est bornée : au-delà de max_workers + max_queue rendus en cours, les appels attendent
+    au plus queue_timeout secondes puis lèvent RenderQueueFull.
+    """
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, queue_timeout: float = 5.0):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self.queue_timeout = queue_timeout
+        self.rendered = 0
+        self.rejected = 0
+        self.render_times = deque(maxlen=200)
+
+    async def run(self, func, *args):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RenderQueueFull()
+        try:
+            start = time.perf_counter()
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            self.render_times.append(time.perf_counter() - start)
+            self.rendered += 1
+            return result
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 # --- Classes pour les Vues d'Interaction ---
 
 class MissionView(discord.ui.View):
@@ -250,6 +1178,11 @@ class TicketTypeSelect(discord.ui.View):
         selected_label = self.select_menu.values[0]
         ticket_type = next(tt for tt in self.manager.config["TICKET_SYSTEM"]["TICKET_TYPES"] if tt['label'] == selected_label)
 
+        existing_ticket, opening_pending = self.manager.find_ticket_over_limit(interaction.user.id, ticket_type)
+        if existing_ticket or opening_pending:
+            location = f" : <#{existing_ticket}>" if existing_ticket else "."
+            return await interaction.followup.send(f"Vous avez déjà un ticket « {ticket_type['label']} » ouvert{location}", ephemeral=True)
+
         initial_embed = discord.Embed(title=f"Ticket : {ticket_type['label']}", description="Veuillez décrire votre problème en détail. Un membre du staff sera bientôt avec vous.", color=discord.Color.blue())
         initial_embed.set_footer(text=f"Ticket créé par {interaction.user.display_name}")
 
@@ -283,9 +1216,16 @@ class TicketCloseView(discord.ui.View):
         button.disabled = True
         await interaction.message.edit(view=self)
 
-        await self.manager.log_ticket_closure(interaction, channel)
+        self.manager.begin_ticket_closure(channel.id)
+        logging_task = None
+        if str(channel.id) in self.manager.ticket_registry:
+            # La transcription est déjà sur disque : le log (et le résumé IA) se fait en arrière-plan.
+            logging_task = self.manager.create_background_task(self.manager.log_ticket_closure(interaction, channel), f"log de fermeture du ticket {channel.id}")
+        else:
+            # Ticket antérieur à la capture incrémentale : l'historique doit être lu avant suppression.
+            await self.manager.log_ticket_closure(interaction, channel)
         
-        await channel.delete(reason=f"Ticket fermé par {interaction.user}")
+        await self.manager.release_ticket_channel(channel, interaction.user, logging_task)
 
 # --- Le Cog Principal ---
 
@@ -298,6 +1238,19 @@ class ManagerCog(commands.Cog):
     KNOWLEDGE_BASE_FILE = 'knowledge_base.json'
     CURRENT_CHALLENGE_FILE = 'data/current_challenge.json'
     PENDING_ACTIONS_FILE = 'data/pending_actions.json'
+    COACHING_PROGRESS_FILE = 'data/coaching_progress.json'
+    TICKET_REGISTRY_FILE = 'data/ticket_registry.json'
+    TICKET_POOL_FILE = 'data/ticket_pool.json'
+    TRANSCRIPTS_DIR = 'data/transcripts'
+    TICKET_ARCHIVE_DIR = 'data/ticket_archive'
+    AVATAR_CACHE_DIR = 'data/avatar_cache'
+    COMMISSION_LEDGER_FILE = 'data/commission_ledger.jsonl'
+    # Fichiers rechargeables sans redémarrage : nom de l'attribut -> (fichier, validation)
+    HOT_RELOAD_FILES = {
+        "config": (CONFIG_FILE, validate_config_data),
+        "products": (PRODUCTS_FILE, validate_products_data),
+        "knowledge_base": (KNOWLEDGE_BASE_FILE, validate_knowledge_base_data)
+    }
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -305,12 +1258,34 @@ class ManagerCog(commands.Cog):
         
         self.config = {}
         self.products = []
+        self.catalogue = ProductCatalogue([])
         self.achievements = []
         self.knowledge_base = {}
         self.user_data = {}
-        self.invites_cache = {}
+        self.invite_attribution = InviteAttributionService()
         self.current_challenge: Optional[Dict[str, Any]] = None
         self.pending_actions = {}
+        self.ticket_registry: Dict[str, Dict[str, Any]] = {}
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
+        self._background_tasks: set = set()
+        self.ticket_archive = TicketArchive(self.TICKET_ARCHIVE_DIR)
+        # Index secondaires du registre (reconstruits au chargement) : membre -> type -> salons, transaction -> salon
+        self._open_tickets_by_user: Dict[int, Dict[str, set]] = {}
+        self._ticket_by_transaction: Dict[str, str] = {}
+        self._pending_ticket_openings: Counter = Counter()
+        # File FIFO : un salon recyclé repasse en fin de file, les renommages se répartissent sur toute la réserve
+        self.ticket_pool: deque = deque()
+        self._pooled_channel_ids: set = set()
+        self._pool_discovered = False
+        self.ticket_claim_latencies = {"pool": deque(maxlen=200), "create": deque(maxlen=200)}
+        self._sorted_palettes: tuple = (None, [])
+        self._leaderboard_renders: Dict[str, asyncio.Future] = {}
+        self._watched_mtimes: Dict[str, float] = {}
+        self._reload_lock = asyncio.Lock()
+        # Incrémenté à chaque (re)chargement d'un fichier pour invalider les caches dérivés
+        self.data_versions: Dict[str, int] = {}
+        self.commission_engine = AffiliateCommissionEngine(self, self.COMMISSION_LEDGER_FILE)
+        self.referral_graph = ReferralGraph()
         
         if not IMAGING_AVAILABLE:
             print("⚠️ ATTENTION: La librairie 'Pillow' est manquante. La commande /profil utilisera un embed standard.")
@@ -330,6 +1305,30 @@ class ManagerCog(commands.Cog):
     async def cog_load(self):
         print("Chargement des données du ManagerCog...")
         await self._load_all_data()
+        self._rebuild_ticket_indexes()
+        self.referral_graph.rebuild(self.user_data)
+        card_config = self.config.get("PROFILE_CARD_CONFIG", {})
+        self.render_pool = ImageRenderPool(
+            max_workers=card_config.get("RENDER_WORKERS", 2),
+            max_queue=card_config.get("RENDER_QUEUE_SIZE", 8),
+            queue_timeout=card_config.get("RENDER_QUEUE_TIMEOUT_SECONDS", 5)
+        )
+        avatar_config = card_config.get("AVATAR_CACHE", {})
+        self.avatar_cache = AvatarCache(
+            self.AVATAR_CACHE_DIR,
+            memory_max_bytes=int(avatar_config.get("MEMORY_MAX_MB", 32) * 1024 * 1024),
+            disk_max_bytes=int(avatar_config.get("DISK_MAX_MB", 200) * 1024 * 1024),
+            max_thumbnails=avatar_config.get("MAX_THUMBNAILS", 500),
+            fetch_timeout=avatar_config.get("FETCH_TIMEOUT_SECONDS", 5)
+        )
+        await asyncio.to_thread(self.avatar_cache.load_disk_index)
+        render_cache_config = card_config.get("RENDER_CACHE", {})
+        self.profile_card_cache = RenderedImageCache(
+            max_entries=render_cache_config.get("MAX_ENTRIES", 500),
+            max_bytes=int(render_cache_config.get("MAX_MB", 64) * 1024 * 1024)
+        )
+        archived_count = await asyncio.to_thread(self.ticket_archive.load)
+        print(f"Archive des tickets chargée : {archived_count} tickets indexés.")
         self.bot.add_view(VerificationView(self))
         self.bot.add_view(TicketCreationView(self))
         self.bot.add_view(TicketCloseView(self))
@@ -339,12 +1338,21 @@ class ManagerCog(commands.Cog):
         self.mission_assignment_task.start()
         self.check_vip_status_task.start()
         self.weekly_coaching_report_task.start()
+        self.ticket_pool_refill_task.start()
+        self.data_file_watch_task.change_interval(seconds=self.config.get("HOT_RELOAD", {}).get("POLL_INTERVAL_SECONDS", 10))
+        self.data_file_watch_task.start()
+        self.invite_attribution.burst_window = self.config.get("INVITE_TRACKING", {}).get("BURST_WINDOW_SECONDS", 2)
 
     def cog_unload(self):
         self.weekly_leaderboard_task.cancel()
         self.mission_assignment_task.cancel()
         self.check_vip_status_task.cancel()
         self.weekly_coaching_report_task.cancel()
+        self.ticket_pool_refill_task.cancel()
+        self.data_file_watch_task.cancel()
+        self.render_pool.shutdown()
+        self.invite_attribution.cancel()
+        self.create_background_task(self.avatar_cache.close(), "fermeture du cache d'avatars")
         print("ManagerCog déchargé.")
 
     @commands.Cog.listener()
@@ -357,8 +1365,20 @@ class ManagerCog(commands.Cog):
 
         guild = self.bot.get_guild(int(guild_id_str))
         if guild:
-            await self._update_invite_cache(guild)
+            await self.invite_attribution.refresh(guild)
             print(f"Cache des invitations mis à jour pour la guilde : {guild.name}")
+            # Tickets dont le salon a disparu (ou dont la fermeture a été interrompue) pendant que le bot était hors ligne
+            for channel_id_str in [cid for cid, entry in self.ticket_registry.items() if entry.get("closing") or not guild.get_channel(int(cid))]:
+                channel = guild.get_channel(int(channel_id_str))
+                if channel:
+                    # Fermeture interrompue avant la purge : le salon contient encore la conversation du client,
+                    # il est retiré de la réserve et supprimé plutôt que réattribué.
+                    await self._retire_pooled_channel(channel.id)
+                    try:
+                        await channel.delete(reason="Fermeture de ticket interrompue par un redémarrage")
+                    except discord.HTTPException as e:
+                        print(f"Impossible de supprimer le salon de ticket {channel.id}: {e}")
+                await self.archive_registered_ticket(channel_id_str)
         else:
             print(f"ATTENTION: Guilde avec l'ID {guild_id_str} non trouvée.")
 
@@ -374,7 +1394,7 @@ class ManagerCog(commands.Cog):
             default_content = '{}'
             if 'pending_actions' in file_path:
                 default_content = '{"transactions": {}, "cashouts": {}}'
-            elif 'user_data' in file_path or 'challenge' in file_path:
+            elif 'user_data' in file_path or 'challenge' in file_path or 'progress' in file_path or 'registry' in file_path:
                 default_content = '{}'
             else:
                 default_content = '[]'
@@ -412,7 +1432,8 @@ class ManagerCog(commands.Cog):
             "knowledge_base": self._load_json_data_async(self.KNOWLEDGE_BASE_FILE),
             "user_data": self._load_json_data_async(self.USER_DATA_FILE),
             "current_challenge": self._load_json_data_async(self.CURRENT_CHALLENGE_FILE),
-            "pending_actions": self._load_json_data_async(self.PENDING_ACTIONS_FILE)
+            "pending_actions": self._load_json_data_async(self.PENDING_ACTIONS_FILE),
+            "ticket_registry": self._load_json_data_async(self.TICKET_REGISTRY_FILE)
         }
         results = await asyncio.gather(*tasks.values(), return_exceptions=True)
         
@@ -422,16 +1443,109 @@ class ManagerCog(commands.Cog):
             if isinstance(result, Exception):
                 print(f"Erreur critique lors du chargement du fichier pour '{name}': {result}")
                 default_val = []
-                if name in ['user_data', 'current_challenge', 'pending_actions', 'knowledge_base']:
+                if name in ['user_data', 'current_challenge', 'pending_actions', 'knowledge_base', 'ticket_registry']:
                     default_val = {}
                 setattr(self, name, default_val)
             else:
                  setattr(self, name, result)
+            self.data_versions[name] = self.data_versions.get(name, 0) + 1
 
+        self.catalogue = ProductCatalogue(self.products if isinstance(self.products, list) else [], self.data_versions["products"])
+        for name, (file_path, _) in self.HOT_RELOAD_FILES.items():
+            self._watched_mtimes[name] = self._get_mtime(file_path)
         print("Toutes les données de configuration ont été chargées.")
+
+    # --- Rechargement à chaud ---
+
+    @staticmethod
+    def _get_mtime(file_path: str) -> float:
+        try:
+            return os.stat(file_path).st_mtime
+        except OSError:
+            return 0.0
+
+    async def reload_data_file(self, name: str) -> Dict[str, Any]:
+        """
+        Relit un fichier rechargeable, le valide puis le substitue d'un bloc. En cas d'erreur, l'ancienne
+        version reste en place. Les caches dépendants sont prévenus par la version incrémentée
+        (self.data_versions) et par l'événement `on_data_reload(name, version)`.
+        """
+        file_path, validator = self.HOT_RELOAD_FILES[name]
+        result = {"name": name, "file": file_path, "ok": False}
+        async with self._reload_lock:
+            start = time.perf_counter()
+            mtime = self._get_mtime(file_path)
+            try:
+                async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.loads(await f.read())
+                parsed_at = time.perf_counter()
+                validator(data)
+                validated_at = time.perf_counter()
+                new_catalogue = ProductCatalogue(data, self.data_versions.get(name, 0) + 1) if name == "products" else None
+            except Exception as e:
+                # Toute erreur (y compris une forme de données imprévue) rejette le fichier sans arrêter la surveillance
+                result["error"] = str(e) if isinstance(e, (OSError, json.JSONDecodeError, ValueError)) else f"{type(e).__name__}: {e}"
+                # On ne réessaie pas tant que le fichier n'a pas été modifié à nouveau
+                self._watched_mtimes[name] = mtime
+                return result
+
+            setattr(self, name, data)
+            self.data_versions[name] = self.data_versions.get(name, 0) + 1
+            if new_catalogue:
+                self.catalogue = new_catalogue
+            self._watched_mtimes[name] = mtime
+            swapped_at = time.perf_counter()
+
+        self.bot.dispatch("data_reload", name, self.data_versions[name])
+        result.update({
+            "ok": True, "version": self.data_versions[name],
+            "parse_ms": (parsed_at - start) * 1000, "validate_ms": (validated_at - parsed_at) * 1000,
+            "swap_ms": (swapped_at - validated_at) * 1000
+        })
+        print(f"Rechargement à chaud de {file_path} (version {result['version']}) en {(swapped_at - start) * 1000:.1f} ms.")
+        return result
+
+    @tasks.loop(seconds=10)
+    async def data_file_watch_task(self):
+        if not self.config.get("HOT_RELOAD", {}).get("ENABLED", True): return
+        for name, (file_path, _) in self.HOT_RELOAD_FILES.items():
+            if self._get_mtime(file_path) != self._watched_mtimes.get(name):
+                result = await self.reload_data_file(name)
+                if not result["ok"]:
+                    print(f"Rechargement de {file_path} refusé, l'ancienne version est conservée : {result['error']}")
+
+    @data_file_watch_task.before_loop
+    async def before_data_file_watch(self):
+        await self.bot.wait_until_ready()
+
+    @app_commands.command(name="recharger_donnees", description="[Admin] Recharge config.json, products.json et/ou knowledge_base.json sans redémarrage.")
+    @app_commands.describe(fichier="Fichier à recharger (tous par défaut)")
+    @app_commands.choices(fichier=[
+        app_commands.Choice(name="Configuration (config.json)", value="config"),
+        app_commands.Choice(name="Produits (products.json)", value="products"),
+        app_commands.Choice(name="FAQ (knowledge_base.json)", value="knowledge_base")
+    ])
+    @app_commands.default_permissions(administrator=True)
+    async def recharger_donnees(self, interaction: discord.Interaction, fichier: Optional[app_commands.Choice[str]] = None):
+        await interaction.response.defer(ephemeral=True)
+        names = [fichier.value] if fichier else list(self.HOT_RELOAD_FILES)
+        embed = discord.Embed(title="🔄 Rechargement des données", color=discord.Color.blurple())
+        for name in names:
+            result = await self.reload_data_file(name)
+            if result["ok"]:
+                value = (f"✅ Version {result['version']} | lecture {result['parse_ms']:.1f} ms | "
+                         f"validation {result['validate_ms']:.1f} ms | substitution {result['swap_ms']:.2f} ms")
+            else:
+                embed.color = discord.Color.red()
+                value = f"❌ Ancienne version conservée : {result['error'][:900]}"
+            embed.add_field(name=result["file"], value=value, inline=False)
+        await interaction.followup.send(embed=embed, ephemeral=True)
     
     def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
-        return next((p for p in self.products if p.get('id') == product_id), None)
+        return self.catalogue.get(product_id)
+
+    def get_product_option(self, product_id: str, option_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self.catalogue.get_option(product_id, option_name)
 
     async def _parse_gemini_json_response(self, text: str) -> Optional[Dict[str, Any]]:
         """Analyse de manière robuste une réponse JSON potentiellement mal formatée de l'IA."""
@@ -475,17 +1589,14 @@ class ManagerCog(commands.Cog):
                     print(f"Permissions manquantes pour assigner le rôle '{unverified_role_name}' à {member.name}")
 
         self.initialize_user_data(str(member.id))
-        old_invites = self.invites_cache.get(member.guild.id, {})
-        new_invites = await member.guild.invites()
-        inviter = None
-        for invite in new_invites:
-            if invite.code in old_invites and invite.uses > old_invites[invite.code].uses:
-                inviter = invite.inviter
-                break
+        inviter_id = await self.invite_attribution.attribute(member)
+        inviter = (member.guild.get_member(inviter_id) or self.bot.get_user(inviter_id)) if inviter_id else None
         if inviter and inviter.id != member.id:
             user_id_str = str(member.id)
             self.initialize_user_data(str(inviter.id))
+            previous_referrer = self.user_data[user_id_str].get("referrer")
             self.user_data[user_id_str]["referrer"] = str(inviter.id)
+            self.referral_graph.link(user_id_str, str(inviter.id), self.user_data[user_id_str], previous_referrer)
             
             await self.add_transaction(
                 str(inviter.id),
@@ -495,15 +1606,13 @@ class ManagerCog(commands.Cog):
             print(f"{member.name} a été invité par {inviter.name}")
             await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
 
-        await self._update_invite_cache(member.guild)
-
     @commands.Cog.listener()
     async def on_invite_create(self, invite: discord.Invite):
-        await self._update_invite_cache(invite.guild)
+        self.invite_attribution.on_invite_create(invite)
 
     @commands.Cog.listener()
     async def on_invite_delete(self, invite: discord.Invite):
-        await self._update_invite_cache(invite.guild)
+        self.invite_attribution.on_invite_delete(invite)
 
     def initialize_user_data(self, user_id: str):
         if user_id not in self.user_data:
@@ -530,25 +1639,38 @@ class ManagerCog(commands.Cog):
             print(f"Nouvel utilisateur initialisé : {user_id}")
     
     async def add_transaction(self, user_id: str, type: str, amount: float, description: str):
+        await self.add_ledger_entry(user_id, {type: amount}, description, type=type, amount=amount)
+
+    async def add_ledger_entry(self, user_id: str, changes: Dict[str, float], description: str, type: str, amount: float):
+        """Applique plusieurs compteurs d'un coup et les journalise en une seule entrée (ex. une commission)."""
         self.initialize_user_data(user_id)
         user_data = self.user_data[user_id]
-        
-        if type in user_data:
-            user_data[type] += amount
-        else:
-             user_data[type] = amount
-        
+        referrer_id = user_data.get("referrer")
+
+        for field, delta in changes.items():
+            old_value = user_data.get(field, 0)
+            if field in user_data:
+                user_data[field] += delta
+            else:
+                user_data[field] = delta
+            if referrer_id and field in ("level", "purchase_total_value", "purchase_count"):
+                self.referral_graph.on_child_update(referrer_id, field, old_value, user_data[field])
+        if "level" in changes:
+            self.commission_engine.invalidate(user_id)
+
         if "transaction_log" not in user_data:
             user_data["transaction_log"] = []
-            
+
         log_entry = {
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "type": type,
             "amount": amount,
             "description": description
         }
+        if len(changes) > 1:
+            log_entry["changes"] = changes
         user_data["transaction_log"].append(log_entry)
-        
+
         max_log_size = self.config.get("TRANSACTION_LOG_CONFIG", {}).get("MAX_USER_LOG_SIZE", 50)
         if len(user_data["transaction_log"]) > max_log_size:
             user_data["transaction_log"] = user_data["transaction_log"][-max_log_size:]
@@ -798,49 +1920,22 @@ class ManagerCog(commands.Cog):
                 if product.get('margin_type') == 'net' and purchase_cost >= 0:
                     commissionable_amount = max(0, price - purchase_cost)
                 
-                affiliate_config = self.config["GAMIFICATION_CONFIG"]["AFFILIATE_SYSTEM"]
-                referrer_data = self.user_data[referrer_id_str]
-                referrer_level = referrer_data.get('level', 1)
-                
-                base_rate = 0.0
-                for tier in sorted(affiliate_config["COMMISSION_TIERS"], key=lambda x: x['level'], reverse=True):
-                    if referrer_level >= tier['level']:
-                        base_rate = tier['rate']
-                        break
-                
-                total_rate = base_rate + referrer_data.get('affiliate_booster', 0.0)
-                
-                if referrer_data.get("permanent_affiliate_bonus"):
-                    total_rate += affiliate_config.get("PERMANENT_LOYALTY_BONUS", {}).get("RATE", 0.0)
-
-                vip_config = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {})
-                vip_info = referrer_data.get("vip_premium")
-                if vip_info:
-                    status = vip_info.get("status", "expired")
-                    now_ts = datetime.now(timezone.utc).timestamp()
-                    is_active = status == "active"
-                    is_in_grace = status == "grace" and now_ts < vip_info.get("grace_end_timestamp", 0)
-
-                    if is_active or is_in_grace:
-                        consecutive_weeks = vip_info.get("consecutive_weeks", 1)
-                        consecutive_months = (consecutive_weeks // 4) + 1
-                        
-                        bonus = 0.0
-                        for tier in sorted(vip_config.get("COMMISSION_BONUS_TIERS",[]), key=lambda x: x['consecutive_months'], reverse=True):
-                            if consecutive_months >= tier['consecutive_months']:
-                                bonus = tier['bonus']
-                                break
-                        
-                        if is_in_grace:
-                            bonus *= vip_config.get("GRACE_PERIOD_BENEFIT_MULTIPLIER", 0.5)
-                        
-                        total_rate += bonus
+                now_ts = datetime.now(timezone.utc).timestamp()
+                rate, rate_inputs = self.commission_engine.effective_rate(referrer_id_str, now_ts)
+                total_rate = rate["total"]
 
                 commission_earned = commissionable_amount * total_rate
-                await self.add_transaction(referrer_id_str, "store_credit", commission_earned, f"Commission sur achat de {member.display_name}")
-                await self.add_transaction(referrer_id_str, "affiliate_earnings", commission_earned, f"Commission sur achat de {member.display_name}")
-                await self.add_transaction(referrer_id_str, "weekly_affiliate_earnings", commission_earned, f"Commission sur achat de {member.display_name}")
-                await self.add_transaction(referrer_id_str, "affiliate_sale_count", 1, f"Vente via {member.display_name}")
+                await self.add_ledger_entry(
+                    referrer_id_str,
+                    {"store_credit": commission_earned, "affiliate_earnings": commission_earned, "weekly_affiliate_earnings": commission_earned, "affiliate_sale_count": 1},
+                    f"Commission sur achat de {member.display_name}",
+                    type="commission", amount=commission_earned
+                )
+                await asyncio.to_thread(self.commission_engine.append_ledger, {
+                    "timestamp": now_ts, "referrer_id": referrer_id_str, "buyer_id": user_id_str,
+                    "transaction_code": transaction_code, "commissionable_amount": commissionable_amount,
+                    "inputs": rate_inputs, "rate": rate, "commission": commission_earned
+                })
                 
                 await self.log_public_transaction(
                     guild,
@@ -853,8 +1948,7 @@ class ManagerCog(commands.Cog):
                     await referrer.send(f"🎉 Bonne nouvelle ! Votre filleul {member.display_name} a fait un achat. Vous avez gagné **{commission_earned:.2f} crédits** (Taux: {total_rate*100:.1f}%)!")
                 except discord.Forbidden: pass
                 await self.check_achievements(referrer)
-                await self.update_mission_progress(referrer, "affiliate_sale", 1)
-                await self.update_mission_progress(referrer, "affiliate_earn", commission_earned)
+                await self.update_missions_progress(referrer, {"affiliate_sale": 1, "affiliate_earn": commission_earned})
 
         
         await self.check_achievements(member)
@@ -895,6 +1989,7 @@ class ManagerCog(commands.Cog):
             "grace_end_timestamp": None,
             "renewal_end_timestamp": None
         }
+        self.commission_engine.invalidate(user_id_str)
         
         if user_data.get("referrer"):
             referrer_id = user_data["referrer"]
@@ -1017,14 +2112,18 @@ class ManagerCog(commands.Cog):
         print("Tâche d'assignation des missions terminée.")
 
     async def update_mission_progress(self, user: discord.Member, action_id: str, value: float):
+        await self.update_missions_progress(user, {action_id: value})
+
+    async def update_missions_progress(self, user: discord.Member, progress: Dict[str, float]):
+        """Fait avancer plusieurs types de missions (action -> valeur) avec une seule sauvegarde."""
         user_id_str = str(user.id)
         if user_id_str not in self.user_data: return
 
         missions_to_check = ["current_daily_mission", "current_weekly_mission"]
         for mission_key in missions_to_check:
             mission = self.user_data[user_id_str].get(mission_key)
-            if mission and not mission.get("completed") and mission.get("id") == action_id:
-                mission["progress"] = min(mission["progress"] + value, mission["target"])
+            if mission and not mission.get("completed") and mission.get("id") in progress:
+                mission["progress"] = min(mission["progress"] + progress[mission["id"]], mission["target"])
                 if mission["progress"] >= mission["target"]:
                     mission["completed"] = True
                     await self.grant_xp(user, mission["reward_xp"], f"Mission complétée: {mission['description']}")
@@ -1070,6 +2169,7 @@ class ManagerCog(commands.Cog):
             sorted_aff_leaderboard = sorted(aff_leaderboard_data.items(), key=lambda item: item[1], reverse=True)
             
             for uid in self.user_data: self.user_data[uid]['affiliate_booster'] = 0.0
+            self.commission_engine.invalidate()
 
             boosters = {1: aff_config["WEEKLY_BOOSTERS"]["TOP_1_BOOST"], 2: aff_config["WEEKLY_BOOSTERS"]["TOP_2_BOOST"], 3: aff_config["WEEKLY_BOOSTERS"]["TOP_3_BOOST"]}
             for i, (user_id, earnings) in enumerate(sorted_aff_leaderboard[:3]):
@@ -1131,6 +2231,7 @@ class ManagerCog(commands.Cog):
                 
                 vip_info["grace_end_timestamp"] = grace_end_time.timestamp()
                 vip_info["renewal_end_timestamp"] = renewal_end_time.timestamp()
+                self.commission_engine.invalidate(user_id_str)
                 
                 try:
                     await member.send(f"⚠️ Votre abonnement VIP Premium a expiré. Vous entrez dans une période de grâce de {grace_duration.days} jours avec des avantages réduits. Renouvelez avant la fin pour ne pas briser votre série !")
@@ -1138,11 +2239,16 @@ class ManagerCog(commands.Cog):
             
             elif status == "grace" and now_ts > vip_info.get("renewal_end_timestamp", 0):
                 vip_info["status"] = "expired"
+                grants_loyalty = bool(loyalty_role and vip_info.get("consecutive_weeks", 0) > 0 and not user_data.get("permanent_affiliate_bonus"))
+                if grants_loyalty:
+                    user_data["permanent_affiliate_bonus"] = True
+                # Toutes les entrées du taux sont à jour avant le premier await : une commission versée pendant
+                # les appels à Discord ne peut pas mettre en cache un état intermédiaire.
+                self.commission_engine.invalidate(user_id_str)
                 if premium_role in member.roles:
                     await member.remove_roles(premium_role, reason="Abonnement VIP Premium expiré.")
                 
-                if loyalty_role and vip_info.get("consecutive_weeks", 0) > 0 and not user_data.get("permanent_affiliate_bonus"):
-                    user_data["permanent_affiliate_bonus"] = True
+                if grants_loyalty:
                     await member.add_roles(loyalty_role, reason="Fin d'abonnement VIP Premium.")
                     try:
                         await member.send("Votre abonnement VIP Premium est terminé. En remerciement de votre soutien, vous avez obtenu le rôle **Bonus de Fidélité**, vous octroyant un bonus de commission permanent !")
@@ -1161,33 +2267,132 @@ class ManagerCog(commands.Cog):
 
         guild = self.bot.get_guild(int(self.config["GUILD_ID"]))
         if not guild: return
-        print("Début de la tâche de coaching hebdomadaire...")
         
         prompt_template = self.config.get("AI_PROCESSING_CONFIG", {}).get("AI_WEEKLY_COACH_PROMPT")
         if not prompt_template: return print("Prompt de coaching hebdo manquant.")
 
-        for user_id_str, user_data in list(self.user_data.items()):
-            if user_data.get("weekly_xp", 0) == 0 and user_data.get("weekly_affiliate_earnings", 0) == 0:
-                continue
+        # Un run par semaine ISO : après un redémarrage, on reprend là où on s'était arrêté.
+        run_id = datetime.now(timezone.utc).strftime("%G-W%V")
+        progress = await self._load_json_data_async(self.COACHING_PROGRESS_FILE)
+        if not isinstance(progress, dict) or progress.get("run_id") != run_id:
+            users = {}
+            for user_id_str, user_data in list(self.user_data.items()):
+                if user_data.get("weekly_xp", 0) == 0 and user_data.get("weekly_affiliate_earnings", 0) == 0:
+                    continue
+                member = guild.get_member(int(user_id_str))
+                if not member or member.bot: continue
+                users[user_id_str] = {
+                    "username": member.display_name,
+                    "weekly_xp": int(user_data.get('weekly_xp', 0)),
+                    "weekly_affiliate_earnings": f"{user_data.get('weekly_affiliate_earnings', 0.0):.2f}"
+                }
+            progress = {"run_id": run_id, "users": users, "reports": {}, "delivered": [], "completed": False}
+            await self._save_json_data_async(self.COACHING_PROGRESS_FILE, progress)
+        elif progress.get("completed"):
+            return print(f"Rapports de coaching déjà envoyés pour la semaine {run_id}.")
+
+        print(f"Début de la tâche de coaching hebdomadaire ({run_id}, {len(progress['users'])} membres)...")
+        stats = await self._run_coaching_pipeline(guild, progress)
+        print(
+            f"Tâche de coaching hebdomadaire terminée en {stats['wall_time']:.1f}s : "
+            f"{stats['generated']} rapports générés avec {stats['requests']} requêtes IA, "
+            f"{stats['delivered']} envoyés, {stats['failed']} échecs."
+        )
 
-            member = guild.get_member(int(user_id_str))
-            if not member or member.bot: continue
+    async def _run_coaching_pipeline(self, guild: discord.Guild, progress: Dict[str, Any]) -> Dict[str, Any]:
+        """Génère les rapports par lots en parallèle (concurrence bornée) et les envoie via une file indépendante."""
+        pipeline_config = self.config.get("AI_PROCESSING_CONFIG", {}).get("WEEKLY_COACH_PIPELINE", {})
+        batch_size = pipeline_config.get("BATCH_SIZE", 10)
+        semaphore = asyncio.Semaphore(pipeline_config.get("MAX_CONCURRENT_REQUESTS", 4))
+        dm_interval = pipeline_config.get("DM_INTERVAL_SECONDS", 0.5)
+
+        start = time.perf_counter()
+        stats = {"requests": 0, "generated": 0, "delivered": 0, "failed": 0}
+        delivered = set(progress["delivered"])
+        delivery_queue: asyncio.Queue = asyncio.Queue()
+
+        # Rapports générés avant un redémarrage mais jamais envoyés
+        for user_id_str, report in progress["reports"].items():
+            if user_id_str not in delivered:
+                delivery_queue.put_nowait((user_id_str, report))
+
+        to_generate = [uid for uid in progress["users"] if uid not in progress["reports"] and uid not in delivered]
+        batches = [to_generate[i:i + batch_size] for i in range(0, len(to_generate), batch_size)]
+
+        async def generate(batch: List[str]):
+            async with semaphore:
+                reports, requests_used = await self._generate_coaching_reports({uid: progress["users"][uid] for uid in batch})
+            stats["requests"] += requests_used
+            stats["generated"] += len(reports)
+            stats["failed"] += len(batch) - len(reports)
+            progress["reports"].update(reports)
+            for user_id_str, report in reports.items():
+                delivery_queue.put_nowait((user_id_str, report))
+            await self._save_json_data_async(self.COACHING_PROGRESS_FILE, progress)
+
+        async def deliver():
+            while True:
+                user_id_str, report = await delivery_queue.get()
+                if user_id_str is None:
+                    break
+                member = guild.get_member(int(user_id_str))
+                try:
+                    if member:
+                        await member.send(report)
+                        stats["delivered"] += 1
+                except (discord.Forbidden, discord.HTTPException):
+                    stats["failed"] += 1
+                    print(f"Impossible d'envoyer le rapport de coaching à {member.display_name}")
+                progress["delivered"].append(user_id_str)
+                progress["reports"].pop(user_id_str, None)
+                # Sauvegarde après chaque envoi : un redémarrage ne renvoie jamais un rapport déjà reçu
+                await self._save_json_data_async(self.COACHING_PROGRESS_FILE, progress)
+                await asyncio.sleep(dm_interval) # To avoid rate limits
+
+        delivery_task = asyncio.create_task(deliver())
+        try:
+            await asyncio.gather(*(generate(batch) for batch in batches))
+        finally:
+            # Même si un lot échoue, les rapports déjà générés sont envoyés et la tâche d'envoi se termine
+            delivery_queue.put_nowait((None, None))
+            await delivery_task
+
+        stats["wall_time"] = time.perf_counter() - start
+        progress["completed"] = True
+        progress["stats"] = stats
+        await self._save_json_data_async(self.COACHING_PROGRESS_FILE, progress)
+        return stats
+
+    async def _generate_coaching_reports(self, users: Dict[str, Dict[str, Any]]) -> tuple[Dict[str, str], int]:
+        """Retourne ({user_id: rapport}, nombre de requêtes IA utilisées) pour un lot de membres."""
+        ai_config = self.config.get("AI_PROCESSING_CONFIG", {})
+        batch_prompt = ai_config.get("AI_WEEKLY_COACH_BATCH_PROMPT")
+        reports: Dict[str, str] = {}
+        requests_used = 0
+
+        if batch_prompt and len(users) > 1:
+            try:
+                requests_used += 1
+                prompt = batch_prompt.replace("{users_json}", json.dumps(users, ensure_ascii=False))
+                generation_config = GenerationConfig(response_mime_type="application/json")
+                response = await self.model.generate_content_async(prompt, generation_config=generation_config)
+                parsed = json.loads(response.text)
+                if isinstance(parsed, dict):
+                    reports = {uid: text for uid, text in parsed.items() if uid in users and isinstance(text, str) and text.strip()}
+            except Exception as e:
+                print(f"Erreur Gemini (Coaching groupé): {e}")
 
+        # Rattrapage individuel pour les membres absents de la réponse groupée
+        prompt_template = ai_config.get("AI_WEEKLY_COACH_PROMPT")
+        for user_id_str, user_stats in users.items():
+            if user_id_str in reports: continue
             try:
-                prompt = prompt_template.format(
-                    username=member.display_name,
-                    weekly_xp=int(user_data.get('weekly_xp', 0)),
-                    weekly_affiliate_earnings=f"{user_data.get('weekly_affiliate_earnings', 0.0):.2f}"
-                )
-                response = await self.model.generate_content_async(prompt)
-                await member.send(response.text)
-                await asyncio.sleep(1) # To avoid rate limits
-            except (discord.Forbidden, discord.HTTPException):
-                print(f"Impossible d'envoyer le rapport de coaching à {member.display_name}")
+                requests_used += 1
+                response = await self.model.generate_content_async(prompt_template.format(**user_stats))
+                reports[user_id_str] = response.text
             except Exception as e:
-                print(f"Erreur Gemini (Coaching) pour {member.display_name}: {e}")
-        
-        print("Tâche de coaching hebdomadaire terminée.")
+                print(f"Erreur Gemini (Coaching) pour {user_stats['username']}: {e}")
+        return reports, requests_used
 
     @weekly_leaderboard_task.before_loop
     @mission_assignment_task.before_loop
@@ -1350,6 +2555,8 @@ class ManagerCog(commands.Cog):
             try:
                 img = await self.generate_profile_image(target_user, user_data)
                 return await interaction.followup.send(file=img)
+            except RenderQueueFull:
+                print("File de rendu des cartes de profil saturée, affichage de l'embed.")
             except Exception as e:
                 print(f"Erreur lors de la génération de l'image de profil: {e}\n{traceback.format_exc()}")
         
@@ -1369,104 +2576,161 @@ class ManagerCog(commands.Cog):
         
         await interaction.followup.send(embed=embed)
 
-    async def generate_profile_image(self, user: discord.Member, user_data: dict) -> discord.File:
-        card_config = self.config.get("PROFILE_CARD_CONFIG")
-        
-        def get_palette_for_level(level, config):
-            if not config: return None
-            selected_palette = config.get('DEFAULT_PALETTE')
-            sorted_palettes = sorted(config.get('LEVEL_PALETTES', []), key=lambda x: x['level'], reverse=True)
-            for tier in sorted_palettes:
-                if level >= tier['level']:
-                    selected_palette = tier['palette']
-                    break
-            return selected_palette
-
-        palette = get_palette_for_level(user_data.get('level', 1), card_config)
-
-        W, H = (900, 300)
-        img = Image.new('RGB', (W, H), color=palette['background'])
-        draw = ImageDraw.Draw(img, 'RGBA')
-
-        draw.rounded_rectangle((20, 20, W-20, H-20), radius=20, fill=palette['surface'])
+    def get_palette_for_level(self, level: int) -> Optional[Dict[str, str]]:
+        config_version = self.data_versions.get("config", 0)
+        if self._sorted_palettes[0] != config_version:
+            card_config = self.config.get("PROFILE_CARD_CONFIG", {})
+            self._sorted_palettes = (config_version, sorted(card_config.get('LEVEL_PALETTES', []), key=lambda x: x['level'], reverse=True))
+            PROFILE_CARD_ASSETS.clear() # Les palettes ont pu changer
+        for tier in self._sorted_palettes[1]:
+            if level >= tier['level']:
+                return tier['palette']
+        return self.config.get("PROFILE_CARD_CONFIG", {}).get('DEFAULT_PALETTE')
 
-        try:
-            font_bold = ImageFont.truetype("assets/Inter-Bold.ttf", 36)
-            font_regular = ImageFont.truetype("assets/Inter-Regular.ttf", 24)
-            font_small = ImageFont.truetype("assets/Inter-Regular.ttf", 18)
-        except IOError:
-            font_bold = ImageFont.load_default()
-            font_regular = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-
-        try:
-            async with self.bot.http._session.get(user.display_avatar.with_format("png").url) as resp:
-                if resp.status == 200:
-                    avatar_data = await resp.read()
-                    avatar = Image.open(io.BytesIO(avatar_data)).convert("RGBA")
-                    size = (128, 128)
-                    mask = Image.new('L', size, 0)
-                    draw_mask = ImageDraw.Draw(mask)
-                    draw_mask.ellipse((0, 0) + size, fill=255)
-                    avatar = ImageOps.fit(avatar, mask.size, centering=(0.5, 0.5))
-                    avatar.putalpha(mask)
-                    img.paste(avatar, (60, (H - size[1]) // 2), avatar)
-        except Exception as e:
-            print(f"Impossible de charger l'avatar: {e}")
-
-        draw.text((220, 50), user.display_name, font=font_bold, fill=palette['text'])
-        
+    async def generate_profile_image(self, user: discord.Member, user_data: dict) -> discord.File:
         xp_config = self.config["GAMIFICATION_CONFIG"]["XP_SYSTEM"]
         current_xp = int(user_data.get('xp', 0))
         level = user_data.get('level', 1)
         xp_for_next_level = int(xp_config["LEVEL_UP_FORMULA_BASE_XP"] * (xp_config["LEVEL_UP_FORMULA_MULTIPLIER"] ** level))
         xp_for_current_level = int(xp_config["LEVEL_UP_FORMULA_BASE_XP"] * (xp_config["LEVEL_UP_FORMULA_MULTIPLIER"] ** (level - 1))) if level > 1 else 0
-        
-        xp_in_level = current_xp - xp_for_current_level
-        xp_needed_for_level = xp_for_next_level - xp_for_current_level
-        
-        progress = xp_in_level / xp_needed_for_level if xp_needed_for_level > 0 else 1
-        progress = min(max(progress, 0), 1)
 
-        draw.text((W - 60, 55), f"LVL {level}", font=font_bold, fill=palette['accent'], anchor="ra")
-        
-        bar_x, bar_y, bar_w, bar_h = 220, 180, 620, 30
-        draw.rounded_rectangle((bar_x, bar_y, bar_x + bar_w, bar_y + bar_h), radius=15, fill=palette['background'])
-        if progress > 0:
-            draw.rounded_rectangle((bar_x, bar_y, bar_x + (bar_w * progress), bar_y + bar_h), radius=15, fill=palette['accent'])
+        card = {
+            "palette": self.get_palette_for_level(level),
+            "display_name": user.display_name,
+            "level": level,
+            "xp_in_level": current_xp - xp_for_current_level,
+            "xp_needed_for_level": xp_for_next_level - xp_for_current_level,
+            "store_credit": user_data.get('store_credit', 0.0)
+        }
 
-        xp_text = f"{xp_in_level} / {xp_needed_for_level} XP"
-        draw.text((225, 225), xp_text, font=font_small, fill=palette['text'])
-        
-        credits_text = f"Crédits: {user_data.get('store_credit', 0.0):.2f}"
-        draw.text((W - 60, 225), credits_text, font=font_small, fill=palette['text'], anchor="ra")
-        
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        return discord.File(buffer, filename=f"profile_{user.id}.png")
+        avatar_key = user.display_avatar.key
+        card_config = self.config.get("PROFILE_CARD_CONFIG", {})
+        image_format = card_config.get("OUTPUT_FORMAT", "png")
+        filename = f"profile_{user.id}.{IMAGE_FORMAT_EXTENSIONS.get(image_format, 'png')}"
+        # Même contenu => même carte : la version de la config couvre les changements de formule d'XP ou de palettes
+        cache_key = RenderedImageCache.make_key(
+            card["display_name"], card["level"], current_xp, card["store_credit"], card["palette"],
+            avatar_key, image_format, self.data_versions.get("config", 0)
+        )
+        cached_image = self.profile_card_cache.get(cache_key)
+        if cached_image is not None:
+            return discord.File(io.BytesIO(cached_image), filename=filename)
+
+        avatar = self.avatar_cache.get_thumbnail(avatar_key)
+        if avatar is None:
+            avatar_data = await self.avatar_cache.get_bytes(user.display_avatar)
+            if avatar_data:
+                try:
+                    avatar = await self.render_pool.run(self.avatar_cache.build_thumbnail, avatar_key, avatar_data)
+                except RenderQueueFull:
+                    raise
+                except Exception as e:
+                    print(f"Impossible de décoder l'avatar: {e}")
+
+        # Le dessin et l'encodage PNG bloquent : ils tournent dans le pool de rendu, pas dans la boucle d'événements
+        image_bytes = await self.render_pool.run(render_profile_card, card, avatar, image_format)
+        # Avatar indisponible (téléchargement ou décodage en échec, souvent passager) : carte servie mais pas mise en cache
+        if avatar is not None:
+            self.profile_card_cache.put(cache_key, image_bytes)
+        return discord.File(io.BytesIO(image_bytes), filename=filename)
+
+    @app_commands.command(name="rendu_stats", description="[Staff] Statistiques du rendu des cartes de profil (pool, caches).")
+    @app_commands.default_permissions(manage_messages=True)
+    async def rendu_stats(self, interaction: discord.Interaction):
+        embed = discord.Embed(title="🖼️ Rendu des cartes de profil", color=discord.Color.blurple())
+
+        render_times = sorted(self.render_pool.render_times)
+        median = f"{render_times[len(render_times) // 2] * 1000:.0f} ms" if render_times else "N/A"
+        embed.add_field(name="Pool de rendu", value=f"{self.render_pool.rendered} rendus | {self.render_pool.rejected} refusés (file pleine) | médiane {median}", inline=False)
+
+        card_stats = self.profile_card_cache.stats()
+        embed.add_field(
+            name="Cache des cartes",
+            value=(f"{card_stats['entries']} cartes ({card_stats['bytes'] / 1024:.0f} Ko) | "
+                   f"taux de succès {card_stats['hit_ratio']:.0%} ({card_stats['hits']}/{card_stats['hits'] + card_stats['misses']}) | "
+                   f"{card_stats['bytes_saved'] / 1024:.0f} Ko servis sans rendu"),
+            inline=False
+        )
+
+        avatar_stats = self.avatar_cache.stats
+        embed.add_field(
+            name="Cache des avatars",
+            value=(f"Mémoire : {avatar_stats['memory_hits']} | Disque : {avatar_stats['disk_hits']} | "
+                   f"Téléchargements : {avatar_stats['downloads']} | Regroupés : {avatar_stats['coalesced']}"),
+            inline=False
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="invitations_stats", description="[Staff] Statistiques de l'attribution des invitations (appels API par arrivée).")
+    @app_commands.default_permissions(manage_guild=True)
+    async def invitations_stats(self, interaction: discord.Interaction):
+        stats = self.invite_attribution.stats
+        embed = discord.Embed(title="📨 Attribution des invitations", color=discord.Color.blurple())
+        embed.add_field(name="Arrivées", value=str(stats["joins"]))
+        embed.add_field(name="Appels API", value=f"{stats['api_calls']} ({stats['api_calls'] / max(1, stats['joins']):.2f} par arrivée)")
+        embed.add_field(name="Rafales", value=str(stats["batches"]))
+        embed.add_field(
+            name="Résultat",
+            value=f"Attribuées : {stats['attributed']} | Ambiguës : {stats['ambiguous']} | Sans invitation suivie : {stats['unattributed']}",
+            inline=False
+        )
+        embed.set_footer(text=f"Fenêtre de rafale : {self.invite_attribution.burst_window} s")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="commissions_recalcul", description="[Admin] Recalcule les commissions d'une période avec les paliers actuels (audit).")
+    @app_commands.describe(jours="Nombre de jours à auditer (7 par défaut)")
+    @app_commands.default_permissions(administrator=True)
+    async def commissions_recalcul(self, interaction: discord.Interaction, jours: app_commands.Range[int, 1, 365] = 7):
+        await interaction.response.defer(ephemeral=True)
+        end_ts = datetime.now(timezone.utc).timestamp()
+        start_time = time.perf_counter()
+        report = await asyncio.to_thread(self.commission_engine.recompute_period, end_ts - jours * 86400, end_ts)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+        embed = discord.Embed(title=f"🧮 Audit des commissions ({jours} jours)", color=discord.Color.purple())
+        embed.add_field(name="Ventes", value=str(report["entries"]))
+        embed.add_field(name="Versé", value=f"{report['paid']:.2f} crédits")
+        embed.add_field(name="Recalculé", value=f"{report['recomputed']:.2f} crédits")
+        discrepancies = heapq.nlargest(10, report["per_referrer"].items(), key=lambda item: abs(item[1]["delta"]))
+        lines = [
+            f"<@{uid}> : {t['sales']} ventes, versé {t['paid']:.2f}, recalculé {t['recomputed']:.2f} ({t['delta']:+.2f})"
+            for uid, t in discrepancies if abs(t["delta"]) >= 0.01
+        ]
+        embed.add_field(name="Écarts", value="\n".join(lines) if lines else "Aucun écart avec les paliers actuels.", inline=False)
+        rate_stats = self.commission_engine.stats
+        embed.set_footer(text=f"Calculé en {elapsed_ms:.0f} ms | cache des taux : {rate_stats['hits']} succès / {rate_stats['misses']} calculs")
+        await interaction.followup.send(embed=embed, ephemeral=True)
 
     @app_commands.command(name="classement", description="Affiche les classements hebdomadaires.")
     async def classement(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
-        xp_leaderboard = sorted(
-            [ (uid, data.get('weekly_xp', 0)) for uid, data in self.user_data.items() if data.get('weekly_xp', 0) > 0 ],
-            key=lambda x: x[1], reverse=True
-        )[:10]
+        xp_leaderboard = heapq.nlargest(
+            10, [ (uid, data.get('weekly_xp', 0)) for uid, data in self.user_data.items() if data.get('weekly_xp', 0) > 0 ],
+            key=lambda x: x[1]
+        )
 
-        aff_leaderboard = sorted(
-            [ (uid, data.get('weekly_affiliate_earnings', 0)) for uid, data in self.user_data.items() if data.get('weekly_affiliate_earnings', 0) > 0 ],
-            key=lambda x: x[1], reverse=True
-        )[:10]
+        aff_leaderboard = heapq.nlargest(
+            10, [ (uid, data.get('weekly_affiliate_earnings', 0)) for uid, data in self.user_data.items() if data.get('weekly_affiliate_earnings', 0) > 0 ],
+            key=lambda x: x[1]
+        )
 
         embed = discord.Embed(title="🏆 Classements de la Semaine", color=discord.Color.gold())
         
-        xp_desc = []
-        for rank, (uid, xp) in enumerate(xp_leaderboard):
-            member = interaction.guild.get_member(int(uid))
-            xp_desc.append(f"{'🥇🥈🥉'[rank] if rank < 3 else rank+1} {member.display_name if member else 'Utilisateur Inconnu'} - **{int(xp)} XP**")
-        embed.add_field(name="Top XP", value="\n".join(xp_desc) if xp_desc else "Aucune activité cette semaine.", inline=False)
+        leaderboard_file = None
+        if IMAGING_AVAILABLE and self.config.get("PROFILE_CARD_CONFIG"):
+            try:
+                leaderboard_file = await self.get_leaderboard_image(interaction.guild, xp_leaderboard)
+                embed.set_image(url=f"attachment://{leaderboard_file.filename}")
+            except Exception as e:
+                print(f"Erreur lors de la génération de l'image du classement: {e}")
+
+        if not leaderboard_file:
+            xp_desc = []
+            for rank, (uid, xp) in enumerate(xp_leaderboard):
+                member = interaction.guild.get_member(int(uid))
+                xp_desc.append(f"{'🥇🥈🥉'[rank] if rank < 3 else rank+1} {member.display_name if member else 'Utilisateur Inconnu'} - **{int(xp)} XP**")
+            embed.add_field(name="Top XP", value="\n".join(xp_desc) if xp_desc else "Aucune activité cette semaine.", inline=False)
         
         aff_desc = []
         for rank, (uid, earnings) in enumerate(aff_leaderboard):
@@ -1474,7 +2738,66 @@ class ManagerCog(commands.Cog):
             aff_desc.append(f"{'🥇🥈🥉'[rank] if rank < 3 else rank+1} {member.display_name if member else 'Utilisateur Inconnu'} - **{earnings:.2f} crédits**")
         embed.add_field(name="Top Affiliation", value="\n".join(aff_desc) if aff_desc else "Aucune commission gagnée cette semaine.", inline=False)
         
-        await interaction.followup.send(embed=embed)
+        if leaderboard_file:
+            await interaction.followup.send(embed=embed, file=leaderboard_file)
+        else:
+            await interaction.followup.send(embed=embed)
+
+    async def get_leaderboard_image(self, guild: discord.Guild, xp_leaderboard: List[tuple]) -> discord.File:
+        """
+        Image du top XP, rendue une seule fois par état du classement : tant que les lignes (membre, nom,
+        niveau, XP, avatar) ne changent pas, tout le monde reçoit les mêmes octets, et les demandes
+        simultanées attendent le même rendu.
+        """
+        members = {uid: guild.get_member(int(uid)) for uid, _ in xp_leaderboard}
+        rows = [{
+            "user_id": uid,
+            "display_name": members[uid].display_name if members[uid] else "Utilisateur Inconnu",
+            "level": self.user_data[uid].get('level', 1),
+            "weekly_xp": int(xp),
+            "avatar_key": members[uid].display_avatar.key if members[uid] else None
+        } for uid, xp in xp_leaderboard]
+
+        card_config = self.config.get("PROFILE_CARD_CONFIG", {})
+        image_format = card_config.get("OUTPUT_FORMAT", "png")
+        filename = f"classement.{IMAGE_FORMAT_EXTENSIONS.get(image_format, 'png')}"
+        cache_key = RenderedImageCache.make_key("leaderboard", rows, image_format, self.data_versions.get("config", 0))
+
+        image_bytes = self.profile_card_cache.get(cache_key)
+        if image_bytes is None:
+            pending = self._leaderboard_renders.get(cache_key)
+            if pending is None:
+                pending = asyncio.ensure_future(self._render_leaderboard(rows, members, image_format, cache_key))
+                self._leaderboard_renders[cache_key] = pending
+                pending.add_done_callback(lambda _: self._leaderboard_renders.pop(cache_key, None))
+            image_bytes = await asyncio.shield(pending)
+        return discord.File(io.BytesIO(image_bytes), filename=filename)
+
+    async def _render_leaderboard(self, rows: List[Dict[str, Any]], members: Dict[str, Optional[discord.Member]], image_format: str, cache_key: str) -> bytes:
+        avatars = {}
+        missing = []
+        for member in members.values():
+            if not member: continue
+            thumbnail = self.avatar_cache.get_thumbnail(member.display_avatar.key)
+            if thumbnail is not None:
+                avatars[member.display_avatar.key] = thumbnail
+            else:
+                missing.append(member.display_avatar)
+        # Téléchargements en parallèle ; les avatars déjà en cache mémoire ou disque ne sont pas refaits
+        missing_data = await asyncio.gather(*(self.avatar_cache.get_bytes(asset) for asset in missing))
+        pending_thumbnails = {asset.key: data for asset, data in zip(missing, missing_data) if data}
+
+        def render():
+            for avatar_key, data in pending_thumbnails.items():
+                try:
+                    avatars[avatar_key] = self.avatar_cache.build_thumbnail(avatar_key, data)
+                except Exception as e:
+                    print(f"Impossible de décoder l'avatar: {e}")
+            return render_leaderboard_card(rows, avatars, self.config["PROFILE_CARD_CONFIG"]["DEFAULT_PALETTE"], image_format)
+
+        image_bytes = await self.render_pool.run(render)
+        self.profile_card_cache.put(cache_key, image_bytes)
+        return image_bytes
 
     @app_commands.command(name="missions", description="Consultez vos missions en cours.")
     async def missions(self, interaction: discord.Interaction):
@@ -1568,9 +2891,54 @@ class ManagerCog(commands.Cog):
             description=challenge['description'],
             color=discord.Color.dark_gold()
         )
+        referral_progress = self.get_prestige_referral_progress(user_id_str, challenge)
+        if referral_progress:
+            current, required, level = referral_progress
+            embed.add_field(name="Progression", value=f"{min(current, required)}/{required} filleuls au niveau {level} ou plus")
         embed.set_footer(text="Utilisez /soumettre_defi pour valider.")
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    def get_prestige_referral_progress(self, user_id_str: str, challenge: Dict[str, Any]) -> Optional[tuple[int, int, int]]:
+        """(filleuls qualifiés, nombre requis, niveau requis) si le défi porte sur les filleuls, sinon None."""
+        requirement = challenge.get("referral_requirement")
+        if not requirement:
+            # Défis attribués avant l'ajout de 'referral_requirement' : on retrouve le palier par son nom
+            prestige_config = self.config.get("GAMIFICATION_CONFIG", {}).get("PRESTIGE_LEVELS", {})
+            requirement = next((c.get("referral_requirement") for c in prestige_config.values() if c.get("name") == challenge.get("name")), None)
+        if not requirement:
+            return None
+        return self.referral_graph.count_at_least(user_id_str, requirement["level"]), requirement["count"], requirement["level"]
+
+    @app_commands.command(name="filleuls", description="Affiche vos filleuls et leur progression.")
+    async def filleuls(self, interaction: discord.Interaction):
+        user_id_str = str(interaction.user.id)
+        summary = self.referral_graph.summary(user_id_str)
+        embed = discord.Embed(title=f"🤝 Filleuls de {interaction.user.display_name}", color=discord.Color.purple())
+        embed.add_field(name="Filleuls", value=str(summary["children"]))
+        embed.add_field(name="Actifs (ont acheté)", value=str(summary["active"]))
+        embed.add_field(name="Dépenses cumulées", value=f"{summary['spend']:.2f} €")
+        embed.add_field(
+            name="Progression",
+            value=f"Niveau 5+ : **{self.referral_graph.count_at_least(user_id_str, 5)}** | Niveau 10+ : **{self.referral_graph.count_at_least(user_id_str, 10)}**",
+            inline=False
+        )
+        top_children = heapq.nlargest(
+            10, self.referral_graph.children_of(user_id_str),
+            key=lambda child_id: (self.user_data.get(child_id, {}).get("level", 1), self.user_data.get(child_id, {}).get("xp", 0))
+        )
+        if top_children:
+            embed.add_field(
+                name="Meilleurs filleuls",
+                value="\n".join(
+                    f"<@{child_id}> — niveau {self.user_data[child_id].get('level', 1)}, {self.user_data[child_id].get('purchase_total_value', 0.0):.2f} € d'achats"
+                    for child_id in top_children
+                ),
+                inline=False
+            )
+        else:
+            embed.description = "Vous n'avez pas encore de filleul. Partagez votre lien d'invitation !"
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="soumettre_defi", description="Soumettez une preuve pour votre défi (prestige ou personnalisé).")
     async def submit_challenge(self, interaction: discord.Interaction):
         user_id_str = str(interaction.user.id)
@@ -1579,6 +2947,13 @@ class ManagerCog(commands.Cog):
         challenge_type = None
         if user_data.get("xp_gated"):
             challenge_type = "prestige"
+            referral_progress = self.get_prestige_referral_progress(user_id_str, user_data.get("current_prestige_challenge") or {})
+            if referral_progress and referral_progress[0] < referral_progress[1]:
+                current, required, level = referral_progress
+                return await interaction.response.send_message(
+                    f"Votre défi n'est pas encore rempli : {current}/{required} filleuls ont atteint le niveau {level}. Utilisez `/filleuls` pour suivre leur progression.",
+                    ephemeral=True
+                )
         elif user_data.get("current_personalized_challenge"):
             challenge_type = "personalized"
         else:
@@ -1589,6 +2964,43 @@ class ManagerCog(commands.Cog):
     @app_commands.command(name="cashout", description="Faites une demande de retrait de vos crédits.")
     async def cashout(self, interaction: discord.Interaction):
         await interaction.response.send_modal(CashoutModal(self))
+
+    @app_commands.command(name="ticket_recherche", description="[Staff] Recherche dans les tickets archivés (mots, code RB-XXXX, membre).")
+    @app_commands.describe(requete="Mots-clés, code de transaction ou ID/mention d'un membre", membre="Limiter aux tickets de ce membre")
+    @app_commands.default_permissions(manage_messages=True)
+    async def ticket_recherche(self, interaction: discord.Interaction, requete: Optional[str] = None, membre: Optional[discord.Member] = None):
+        query = f"{requete or ''} {membre.id if membre else ''}".strip()
+        if not query:
+            return await interaction.response.send_message("Précisez une recherche ou un membre.", ephemeral=True)
+
+        start = time.perf_counter()
+        results = self.ticket_archive.search(query, limit=10)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        embed = discord.Embed(title=f"🔎 Tickets archivés : {query}", color=discord.Color.blurple())
+        if not results:
+            embed.description = "Aucun ticket ne correspond à cette recherche."
+        for result in results:
+            owner = f"<@{result['user_id']}>" if result.get("user_id") else "Inconnu"
+            closed_at = result.get("closed_at", "")[:10]
+            embed.add_field(
+                name=f"{result.get('channel_name', result['id'])} — {result.get('type') or 'Ticket'} ({closed_at})",
+                value=f"ID : `{result['id']}` | Membre : {owner}\n{(result.get('summary') or 'Pas de résumé.')[:200]}",
+                inline=False
+            )
+        embed.set_footer(text=f"{len(results)} résultat(s) sur {len(self.ticket_archive.tickets)} tickets archivés en {elapsed_ms:.1f} ms. /ticket_transcript pour lire un ticket.")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="ticket_transcript", description="[Staff] Récupère la transcription complète d'un ticket archivé.")
+    @app_commands.describe(ticket_id="ID du ticket (affiché par /ticket_recherche)")
+    @app_commands.default_permissions(manage_messages=True)
+    async def ticket_transcript(self, interaction: discord.Interaction, ticket_id: str):
+        transcript = await asyncio.to_thread(self.ticket_archive.read, ticket_id.strip())
+        if transcript is None:
+            return await interaction.response.send_message("Ticket introuvable dans l'archive.", ephemeral=True)
+        meta = self.ticket_archive.tickets[ticket_id.strip()]
+        transcript_file = discord.File(io.BytesIO(transcript.encode('utf-8')), filename=f"transcript-{meta.get('channel_name', ticket_id)}.txt")
+        await interaction.response.send_message(f"Transcription du ticket `{ticket_id}` :", file=transcript_file, ephemeral=True)
     
     async def handle_challenge_submission(self, interaction: discord.Interaction, submission_text: str, challenge_type: str):
         await interaction.response.defer(ephemeral=True)
@@ -1658,12 +3070,6 @@ class ManagerCog(commands.Cog):
                 await channel.send(embed=embed)
 
 
-    async def _update_invite_cache(self, guild: discord.Guild):
-        try:
-            self.invites_cache[guild.id] = {invite.code: invite for invite in await guild.invites()}
-        except discord.Forbidden:
-            print(f"Permissions manquantes pour lister les invitations dans la guilde {guild.name}")
-
     async def log_public_transaction(self, guild: discord.Guild, title: str, description: str, color: discord.Color):
         if not self.config.get("TRANSACTION_LOG_CONFIG",{}).get("ENABLED"): return
         channel_name = self.config["CHANNELS"]["TRANSACTION_LOGS"]
@@ -1672,9 +3078,8 @@ class ManagerCog(commands.Cog):
             embed = discord.Embed(title=title, description=description, color=color, timestamp=datetime.now(timezone.utc))
             await channel.send(embed=embed)
     
-    async def create_ticket(self, user: discord.Member, guild: discord.Guild, ticket_type: dict, embed: discord.Embed, view: discord.ui.View):
-        ticket_config = self.config["TICKET_SYSTEM"]
-        category_name = ticket_config["TICKET_CATEGORY_NAME"]
+    async def _get_ticket_category(self, guild: discord.Guild) -> Optional[discord.CategoryChannel]:
+        category_name = self.config["TICKET_SYSTEM"]["TICKET_CATEGORY_NAME"]
         category = discord.utils.get(guild.categories, name=category_name)
         if not category:
             try:
@@ -1687,10 +3092,9 @@ class ManagerCog(commands.Cog):
             except discord.Forbidden:
                  print("Impossible de créer la catégorie de ticket.")
                  return None
+        return category
 
-        ping_role_name = ticket_type.get("ping_role")
-        ping_role = discord.utils.get(guild.roles, name=ping_role_name) if ping_role_name else None
-        
+    def _build_ticket_overwrites(self, guild: discord.Guild, user: discord.Member) -> Dict[Any, discord.PermissionOverwrite]:
         overwrites = {
             guild.default_role: discord.PermissionOverwrite(read_messages=False),
             user: discord.PermissionOverwrite(read_messages=True, send_messages=True, attach_files=True, embed_links=True),
@@ -1701,42 +3105,296 @@ class ManagerCog(commands.Cog):
             role = discord.utils.get(guild.roles, name=role_name)
             if role:
                 overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
+        return overwrites
+
+    async def create_ticket(self, user: discord.Member, guild: discord.Guild, ticket_type: dict, embed: discord.Embed, view: discord.ui.View, transaction_id: Optional[str] = None):
+        existing_ticket, opening_pending = self.find_ticket_over_limit(user.id, ticket_type)
+        if existing_ticket or opening_pending:
+            return None
+        # Réservation immédiate : un double clic ne peut pas ouvrir deux salons pendant la création du premier
+        reservation = (user.id, ticket_type['label'])
+        self._pending_ticket_openings[reservation] += 1
+        try:
+            ticket_channel = await self._open_ticket_channel(user, guild, ticket_type)
+            if not ticket_channel:
+                return None
+            await self.register_ticket(ticket_channel, user, ticket_type, transaction_id)
+        finally:
+            self._pending_ticket_openings[reservation] -= 1
+            if self._pending_ticket_openings[reservation] <= 0:
+                del self._pending_ticket_openings[reservation]
+
+        ping_role_name = ticket_type.get("ping_role")
+        ping_role = discord.utils.get(guild.roles, name=ping_role_name) if ping_role_name else None
+        ping_content = ping_role.mention if ping_role else ""
         
+        await ticket_channel.send(content=f"Bienvenue {user.mention} ! {ping_content}", embed=embed, view=view)
+        return ticket_channel
+
+    async def _open_ticket_channel(self, user: discord.Member, guild: discord.Guild, ticket_type: dict) -> Optional[discord.TextChannel]:
+        overwrites = self._build_ticket_overwrites(guild, user)
         channel_name = f"{ticket_type['label'].lower().replace(' ', '-')}-{user.name}"
+        topic = f"Ticket pour {user.name} ({user.id}). Type: {ticket_type['label']}"
         
+        start = time.perf_counter()
+        ticket_channel = await self._claim_pooled_ticket_channel(guild, channel_name, topic, overwrites)
+        if ticket_channel:
+            self.ticket_claim_latencies["pool"].append(time.perf_counter() - start)
+            return ticket_channel
+
+        category = await self._get_ticket_category(guild)
+        if not category:
+            return None
         try:
             ticket_channel = await guild.create_text_channel(
                 channel_name, category=category, overwrites=overwrites,
-                topic=f"Ticket pour {user.name} ({user.id}). Type: {ticket_type['label']}",
+                topic=topic,
                 reason=f"Création de ticket pour {user.name}"
             )
         except discord.Forbidden:
             print("Impossible de créer le canal de ticket.")
             return None
-        
-        ping_content = ping_role.mention if ping_role else ""
-        
-        await ticket_channel.send(content=f"Bienvenue {user.mention} ! {ping_content}", embed=embed, view=view)
+        self.ticket_claim_latencies["create"].append(time.perf_counter() - start)
         return ticket_channel
 
+    # --- Registre des tickets ouverts ---
+
+    def _rebuild_ticket_indexes(self):
+        self._open_tickets_by_user.clear()
+        self._ticket_by_transaction.clear()
+        for channel_id_str, entry in self.ticket_registry.items():
+            if not entry.get("closing"):
+                self._index_ticket(channel_id_str, entry)
+
+    def _index_ticket(self, channel_id_str: str, entry: Dict[str, Any]):
+        self._open_tickets_by_user.setdefault(entry["user_id"], {}).setdefault(entry["type"], set()).add(channel_id_str)
+        if entry.get("transaction_id"):
+            self._ticket_by_transaction[entry["transaction_id"]] = channel_id_str
+
+    def _unindex_ticket(self, channel_id_str: str, entry: Dict[str, Any]):
+        user_tickets = self._open_tickets_by_user.get(entry["user_id"], {})
+        user_tickets.get(entry["type"], set()).discard(channel_id_str)
+        if not user_tickets.get(entry["type"]):
+            user_tickets.pop(entry["type"], None)
+        if not user_tickets:
+            self._open_tickets_by_user.pop(entry["user_id"], None)
+        if self._ticket_by_transaction.get(entry.get("transaction_id")) == channel_id_str:
+            del self._ticket_by_transaction[entry["transaction_id"]]
+
+    def get_open_tickets(self, user_id: int, ticket_type: Optional[str] = None) -> List[str]:
+        user_tickets = self._open_tickets_by_user.get(user_id, {})
+        if ticket_type:
+            return list(user_tickets.get(ticket_type, ()))
+        return [channel_id for channels in user_tickets.values() for channel_id in channels]
+
+    def get_ticket_for_transaction(self, transaction_id: str) -> Optional[str]:
+        return self._ticket_by_transaction.get(transaction_id)
+
+    def get_ticket_transaction(self, channel_id: int) -> Optional[str]:
+        return self.ticket_registry.get(str(channel_id), {}).get("transaction_id")
+
+    def find_ticket_over_limit(self, user_id: int, ticket_type: dict) -> tuple[Optional[str], bool]:
+        """Si la limite de ce type de ticket est atteinte, renvoie (un ticket déjà ouvert, False),
+        ou (None, True) quand seule une ouverture encore en cours occupe la place. Sinon (None, False)."""
+        limit = ticket_type.get("max_open", self.config.get("TICKET_SYSTEM", {}).get("MAX_OPEN_TICKETS_PER_TYPE", 1))
+        open_tickets = self.get_open_tickets(user_id, ticket_type['label'])
+        if len(open_tickets) + self._pending_ticket_openings.get((user_id, ticket_type['label']), 0) < limit:
+            return None, False
+        return (open_tickets[0], False) if open_tickets else (None, True)
+
+    def begin_ticket_closure(self, channel_id: int):
+        """Libère immédiatement la place du membre ; l'entrée reste le temps d'archiver la transcription."""
+        entry = self.ticket_registry.get(str(channel_id))
+        if entry and not entry.get("closing"):
+            entry["closing"] = True
+            self._unindex_ticket(str(channel_id), entry)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        if channel.id in self._pooled_channel_ids:
+            await self._retire_pooled_channel(channel.id)
+        entry = self.ticket_registry.get(str(channel.id))
+        if entry and not entry.get("closing"):
+            # Salon supprimé à la main sans passer par le bouton de fermeture : la transcription est tout de même archivée
+            await self.archive_registered_ticket(str(channel.id))
+
+    @app_commands.command(name="tickets_ouverts", description="[Staff] Liste les tickets ouverts, éventuellement pour un membre.")
+    @app_commands.default_permissions(manage_messages=True)
+    async def tickets_ouverts(self, interaction: discord.Interaction, membre: Optional[discord.Member] = None):
+        if membre:
+            channel_ids = self.get_open_tickets(membre.id)
+        else:
+            channel_ids = [cid for cid, entry in self.ticket_registry.items() if not entry.get("closing")]
+        channel_ids.sort(key=lambda cid: self.ticket_registry[cid].get("opened_at", ""))
+
+        embed = discord.Embed(title=f"🎫 Tickets ouverts ({len(channel_ids)})", color=discord.Color.blurple())
+        lines = []
+        for channel_id_str in channel_ids[:25]:
+            entry = self.ticket_registry[channel_id_str]
+            transaction = f" | Transaction `{entry['transaction_id'][:8]}`" if entry.get("transaction_id") else ""
+            lines.append(f"<#{channel_id_str}> — {entry['type']} — <@{entry['user_id']}> — {entry.get('opened_at', '')[:16].replace('T', ' ')}{transaction}")
+        embed.description = "\n".join(lines) or "Aucun ticket ouvert."
+        if len(channel_ids) > 25:
+            embed.set_footer(text=f"… et {len(channel_ids) - 25} autres.")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    # --- Transcriptions de tickets (capturées au fil de l'eau) ---
+
+    def _transcript_path(self, channel_id_str: str) -> str:
+        # Un salon de la réserve héberge plusieurs tickets successifs : la transcription suit l'ID du ticket
+        entry = self.ticket_registry.get(channel_id_str) or {}
+        return os.path.join(self.TRANSCRIPTS_DIR, f"{entry.get('ticket_id', channel_id_str)}.txt")
+
+    async def register_ticket(self, channel: discord.TextChannel, user: discord.Member, ticket_type: dict, transaction_id: Optional[str] = None):
+        if str(channel.id) in self.ticket_registry:
+            # Entrée d'un ticket précédent de ce salon restée en place (fermeture interrompue)
+            await self.archive_registered_ticket(str(channel.id))
+        entry = {
+            "ticket_id": f"{channel.id}-{uuid.uuid4().hex[:8]}",
+            "user_id": user.id,
+            "type": ticket_type['label'],
+            "transaction_id": transaction_id,
+            "channel_name": channel.name,
+            "opened_at": datetime.now(timezone.utc).isoformat(),
+            "rolling_summary": "",
+            "summarized_bytes": 0
+        }
+        self.ticket_registry[str(channel.id)] = entry
+        self._index_ticket(str(channel.id), entry)
+        os.makedirs(self.TRANSCRIPTS_DIR, exist_ok=True)
+        await self._append_transcript(channel.id, f"Ticket « {ticket_type['label']} » ouvert par {user.name} ({user.id})")
+        await self._save_json_data_async(self.TICKET_REGISTRY_FILE, self.ticket_registry)
+
+    async def _append_transcript(self, channel_id: int, line: str, timestamp: Optional[datetime] = None):
+        timestamp = timestamp or datetime.now(timezone.utc)
+        try:
+            async with aiofiles.open(self._transcript_path(str(channel_id)), 'a', encoding='utf-8') as f:
+                await f.write(f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')}] {line}\n")
+        except OSError as e:
+            print(f"Impossible d'écrire la transcription du ticket {channel_id}: {e}")
+            return
+        self._maybe_schedule_rolling_summary(str(channel_id))
+
+    @staticmethod
+    def _format_transcript_message(message: discord.Message) -> str:
+        parts = [message.content] if message.content else []
+        for embed in message.embeds:
+            parts.append(f"[embed] {embed.title or ''} {embed.description or ''}".strip())
+        for attachment in message.attachments:
+            parts.append(f"[pièce jointe] {attachment.filename} {attachment.url}")
+        return " | ".join(parts)
+
+    @commands.Cog.listener('on_message')
+    async def capture_ticket_message(self, message: discord.Message):
+        if str(message.channel.id) not in self.ticket_registry: return
+        await self._append_transcript(message.channel.id, f"{message.author.display_name}: {self._format_transcript_message(message)}", message.created_at)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if str(payload.channel_id) not in self.ticket_registry: return
+        content = payload.data.get("content")
+        if content is None: return # Mise à jour sans changement de texte (ex: embed résolu)
+        author = payload.data.get("author", {}).get("username", "Inconnu")
+        await self._append_transcript(payload.channel_id, f"[modifié] {author} (message {payload.message_id}): {content}")
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if str(payload.channel_id) not in self.ticket_registry: return
+        await self._append_transcript(payload.channel_id, f"[supprimé] message {payload.message_id}")
+
+    def create_background_task(self, coro, description: str) -> asyncio.Task:
+        """Lance une tâche en arrière-plan en gardant une référence jusqu'à sa fin et en journalisant ses erreurs."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+
+        def on_done(done: asyncio.Task):
+            self._background_tasks.discard(done)
+            if not done.cancelled() and done.exception():
+                print(f"Erreur dans la tâche en arrière-plan ({description}): {done.exception()!r}")
+        task.add_done_callback(on_done)
+        return task
+
+    def _maybe_schedule_rolling_summary(self, channel_id_str: str):
+        entry = self.ticket_registry.get(channel_id_str)
+        if not entry or not self.model or channel_id_str in self._summary_tasks: return
+        chunk_size = self.config.get("TICKET_SYSTEM", {}).get("ROLLING_SUMMARY_CHUNK_BYTES", 3000)
+        try:
+            pending_bytes = os.path.getsize(self._transcript_path(channel_id_str)) - entry.get("summarized_bytes", 0)
+        except OSError:
+            return
+        if pending_bytes >= chunk_size:
+            task = self.create_background_task(self._update_rolling_summary(channel_id_str), f"résumé du ticket {channel_id_str}")
+            self._summary_tasks[channel_id_str] = task
+            task.add_done_callback(lambda _: self._summary_tasks.pop(channel_id_str, None))
+
+    async def _update_rolling_summary(self, channel_id_str: str, final: bool = False):
+        """Intègre les nouveaux échanges du ticket au résumé courant, morceau par morceau."""
+        entry = self.ticket_registry.get(channel_id_str)
+        prompt_template = self.config.get("TICKET_SYSTEM", {}).get("AI_ROLLING_SUMMARY_PROMPT")
+        if not entry or not prompt_template: return
+        chunk_size = self.config.get("TICKET_SYSTEM", {}).get("ROLLING_SUMMARY_CHUNK_BYTES", 3000)
+
+        path = self._transcript_path(channel_id_str)
+        while True:
+            offset = entry.get("summarized_bytes", 0)
+            async with aiofiles.open(path, 'rb') as f:
+                await f.seek(offset)
+                chunk = await f.read(chunk_size)
+            # On ne coupe qu'à une fin de ligne, sauf pour le dernier morceau lors de la fermeture
+            if not chunk or (not final and len(chunk) < chunk_size):
+                break
+            cut = (chunk.rfind(b"\n") + 1 or len(chunk)) if len(chunk) == chunk_size else len(chunk)
+            chunk = chunk[:cut]
+
+            prompt = prompt_template.replace("{previous_summary}", entry.get("rolling_summary") or "(aucun)").replace("{transcript_chunk}", chunk.decode('utf-8', errors='replace'))
+            try:
+                response = await self.model.generate_content_async(contents=prompt)
+                entry["rolling_summary"] = response.text.strip()
+            except Exception as e:
+                print(f"Erreur Gemini (Résumé de ticket): {e}")
+                break
+            entry["summarized_bytes"] = offset + cut
+            await self._save_json_data_async(self.TICKET_REGISTRY_FILE, self.ticket_registry)
+
     async def log_ticket_closure(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        channel_id_str = str(channel.id)
+        entry = self.ticket_registry.get(channel_id_str)
+        # Le salon peut déjà avoir été renommé pour sa remise en réserve
+        channel_name = entry.get("channel_name", channel.name) if entry else channel.name
+        transcript_path = self._transcript_path(channel_id_str)
+
         log_channel_name = self.config["CHANNELS"]["TICKET_LOGS"]
         log_channel = discord.utils.get(interaction.guild.text_channels, name=log_channel_name)
-        if not log_channel: return
-        
-        transcript_messages = []
-        async for msg in channel.history(limit=100, oldest_first=True):
-            transcript_messages.append(f"[{msg.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {msg.author.display_name}: {msg.content}")
-        
-        transcript = "\n".join(transcript_messages)
-        transcript_file = discord.File(io.StringIO(transcript), filename=f"transcript-{channel.name}.txt")
+
+        if entry and os.path.exists(transcript_path):
+            async with aiofiles.open(transcript_path, 'r', encoding='utf-8') as f:
+                transcript = await f.read()
+        else:
+            # Ticket ouvert avant la capture incrémentale : repli sur l'historique du salon
+            transcript_messages = []
+            async for msg in channel.history(limit=None, oldest_first=True):
+                transcript_messages.append(f"[{msg.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {msg.author.display_name}: {msg.content}")
+            transcript = "\n".join(transcript_messages)
+
+        if not log_channel:
+            await self.archive_ticket(channel_id_str, channel_name, interaction.user.id, transcript, "")
+            return await self._unregister_ticket(channel_id_str)
+        transcript_file = discord.File(io.StringIO(transcript), filename=f"transcript-{channel_name}.txt")
         
         ai_summary_text = "IA non disponible pour le résumé."
         if self.model:
             summary_prompt = self.config.get("TICKET_SYSTEM", {}).get("AI_SUMMARY_PROMPT", "")
             if summary_prompt and transcript:
                 try:
-                    prompt = summary_prompt.format(transcript=transcript[-3000:])
+                    summary_input = transcript[-3000:]
+                    if entry:
+                        if channel_id_str in self._summary_tasks:
+                            await self._summary_tasks[channel_id_str]
+                        await self._update_rolling_summary(channel_id_str, final=True)
+                        if entry.get("rolling_summary"):
+                            summary_input = f"Résumé de l'ensemble des échanges :\n{entry['rolling_summary']}"
+                    # Le prompt contient des accolades JSON littérales : str.format n'est pas utilisable.
+                    prompt = summary_prompt.replace("{transcript}", summary_input)
                     response = await self.model.generate_content_async(contents=prompt)
                     ai_summary_text = response.text
                 except Exception as e:
@@ -1744,11 +3402,170 @@ class ManagerCog(commands.Cog):
             else:
                 ai_summary_text = "Prompt de résumé IA non configuré ou transcript vide."
         
-        embed = discord.Embed(title=f"Log de Ticket Fermé : {channel.name}", color=discord.Color.greyple())
+        embed = discord.Embed(title=f"Log de Ticket Fermé : {channel_name}", color=discord.Color.greyple())
         embed.add_field(name="Fermé par", value=interaction.user.mention, inline=True)
         embed.add_field(name="Résumé IA", value=f"```json\n{ai_summary_text[:1000]}\n```", inline=False)
         
         await log_channel.send(embed=embed, file=transcript_file)
+        await self.archive_ticket(channel_id_str, channel_name, interaction.user.id, transcript, ai_summary_text)
+        await self._unregister_ticket(channel_id_str)
+
+    async def archive_ticket(self, channel_id_str: str, channel_name: str, closed_by_id: Optional[int], transcript: str, summary: str):
+        entry = self.ticket_registry.get(channel_id_str, {})
+        # Tickets antérieurs aux IDs de ticket : on en fabrique un pour ne pas écraser l'archive d'un autre ticket du même salon
+        ticket_id = entry.get("ticket_id") or f"{channel_id_str}-{int(time.time())}"
+        meta = {
+            "channel_id": channel_id_str,
+            "channel_name": entry.get("channel_name", channel_name),
+            "user_id": entry.get("user_id"),
+            "type": entry.get("type"),
+            "opened_at": entry.get("opened_at"),
+            "closed_at": datetime.now(timezone.utc).isoformat(),
+            "closed_by": closed_by_id,
+            "summary": summary[:300]
+        }
+        try:
+            meta, terms = await asyncio.to_thread(self.ticket_archive.write, ticket_id, transcript, meta)
+        except OSError as e:
+            print(f"Impossible d'archiver le ticket {ticket_id}: {e}")
+            return
+        self.ticket_archive.index(ticket_id, meta, terms)
+
+    async def archive_registered_ticket(self, channel_id_str: str, closed_by_id: Optional[int] = None):
+        """Archive la transcription sur disque d'un ticket du registre puis le retire (fermeture interrompue, salon disparu)."""
+        entry = self.ticket_registry.get(channel_id_str)
+        if entry is None: return
+        try:
+            async with aiofiles.open(self._transcript_path(channel_id_str), 'r', encoding='utf-8') as f:
+                transcript = await f.read()
+        except OSError:
+            transcript = ""
+        if transcript:
+            await self.archive_ticket(channel_id_str, entry.get("channel_name", channel_id_str), closed_by_id, transcript, entry.get("rolling_summary", ""))
+        await self._unregister_ticket(channel_id_str)
+
+    # --- Réserve de salons de tickets pré-créés ---
+
+    def _pool_config(self) -> Dict[str, Any]:
+        return self.config.get("TICKET_SYSTEM", {}).get("CHANNEL_POOL", {})
+
+    def _pool_overwrites(self, guild: discord.Guild) -> Dict[Any, discord.PermissionOverwrite]:
+        # Salon en réserve : invisible pour tous sauf le bot
+        return {
+            guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True, manage_messages=True)
+        }
+
+    async def _claim_pooled_ticket_channel(self, guild: discord.Guild, name: str, topic: str, overwrites: Dict[Any, discord.PermissionOverwrite]) -> Optional[discord.TextChannel]:
+        """Attribue un salon de la réserve : un seul appel API (nom, sujet et permissions) au lieu d'une création."""
+        if not self._pool_config().get("ENABLED"): return None
+        while self.ticket_pool:
+            channel = guild.get_channel(self.ticket_pool.popleft())
+            if not channel: continue # Supprimé manuellement entre-temps
+            try:
+                channel = await channel.edit(name=name, topic=topic, overwrites=overwrites, reason="Attribution d'un salon de ticket de la réserve") or channel
+            except discord.HTTPException as e:
+                print(f"Impossible d'attribuer le salon de réserve {channel.id}: {e}")
+                continue
+            self._pooled_channel_ids.add(channel.id)
+            return channel
+        return None
+
+    async def release_ticket_channel(self, channel: discord.TextChannel, closed_by: discord.abc.User, logging_task: Optional[asyncio.Task] = None):
+        """Remet un salon de ticket fermé dans la réserve (après purge) s'il y a de la place, sinon le supprime."""
+        pool_config = self._pool_config()
+        recyclable = (pool_config.get("ENABLED") and channel.id in self._pooled_channel_ids
+                      and len(self.ticket_pool) < pool_config.get("SIZE", 5))
+        if recyclable:
+            try:
+                # On masque le salon par ses permissions seulement : Discord limite les renommages à 2 par salon
+                # et par 10 minutes, le seul renommage a lieu à l'attribution.
+                await channel.edit(overwrites=self._pool_overwrites(channel.guild), reason=f"Ticket fermé par {closed_by}")
+                if logging_task: await logging_task # La transcription doit être archivée avant la purge
+                await channel.purge(limit=None, reason="Remise en réserve du salon de ticket")
+                self.ticket_pool.append(channel.id)
+                return
+            except discord.HTTPException as e:
+                print(f"Impossible de recycler le salon {channel.id}, suppression: {e}")
+        if channel.id in self._pooled_channel_ids:
+            await self._retire_pooled_channel(channel.id)
+        await channel.delete(reason=f"Ticket fermé par {closed_by}")
+
+    async def _retire_pooled_channel(self, channel_id: int):
+        """Retire définitivement un salon de la réserve (mémoire et fichier), y compris avant sa découverte au démarrage."""
+        self._pooled_channel_ids.discard(channel_id)
+        if channel_id in self.ticket_pool:
+            self.ticket_pool.remove(channel_id)
+        if self._pool_discovered:
+            pooled_ids = self._pooled_channel_ids
+        else:
+            saved_ids = await self._load_json_data_async(self.TICKET_POOL_FILE)
+            if channel_id not in saved_ids: return
+            pooled_ids = set(saved_ids) - {channel_id}
+        await self._save_json_data_async(self.TICKET_POOL_FILE, sorted(pooled_ids))
+
+    @tasks.loop(minutes=1)
+    async def ticket_pool_refill_task(self):
+        pool_config = self._pool_config()
+        if not pool_config.get("ENABLED"): return
+        guild = self.bot.get_guild(int(self.config.get("GUILD_ID", 0) or 0))
+        if not guild: return
+        category = await self._get_ticket_category(guild)
+        if not category: return
+
+        pool_name = pool_config.get("CHANNEL_NAME", "ticket-disponible")
+        if not self._pool_discovered:
+            # Après un redémarrage : les salons de la réserve sont retrouvés par leur ID (leur nom est celui du dernier ticket)
+            saved_ids = await self._load_json_data_async(self.TICKET_POOL_FILE)
+            # Un salon dont la fermeture a été interrompue n'y revient pas : le balayage de on_ready le supprime
+            self._pooled_channel_ids = {cid for cid in saved_ids if isinstance(guild.get_channel(cid), discord.TextChannel)
+                                        and not self.ticket_registry.get(str(cid), {}).get("closing")}
+            # Salons créés avant le suivi par ID : encore au nom de la réserve
+            self._pooled_channel_ids.update(c.id for c in category.text_channels if c.name == pool_name and str(c.id) not in self.ticket_registry)
+            await self._save_json_data_async(self.TICKET_POOL_FILE, sorted(self._pooled_channel_ids))
+            self.ticket_pool = deque(cid for cid in self._pooled_channel_ids if str(cid) not in self.ticket_registry)
+            self._pool_discovered = True
+
+        while len(self.ticket_pool) < pool_config.get("SIZE", 5):
+            try:
+                channel = await guild.create_text_channel(pool_name, category=category, overwrites=self._pool_overwrites(guild), reason="Réserve de salons de tickets")
+            except discord.HTTPException as e:
+                print(f"Impossible de remplir la réserve de tickets: {e}")
+                break
+            self.ticket_pool.append(channel.id)
+            self._pooled_channel_ids.add(channel.id)
+            await self._save_json_data_async(self.TICKET_POOL_FILE, sorted(self._pooled_channel_ids))
+            await asyncio.sleep(pool_config.get("REFILL_DELAY_SECONDS", 2)) # Reste sous la limite de création de salons
+
+    @ticket_pool_refill_task.before_loop
+    async def before_ticket_pool_refill(self):
+        await self.bot.wait_until_ready()
+
+    @app_commands.command(name="ticket_pool", description="[Staff] Affiche l'état de la réserve de salons de tickets et les latences d'ouverture.")
+    @app_commands.default_permissions(manage_channels=True)
+    async def ticket_pool(self, interaction: discord.Interaction):
+        pool_config = self._pool_config()
+        embed = discord.Embed(title="🎫 Réserve de salons de tickets", color=discord.Color.blurple())
+        embed.add_field(name="Réserve", value=f"{len(self.ticket_pool)}/{pool_config.get('SIZE', 5)} salons prêts ({'activée' if pool_config.get('ENABLED') else 'désactivée'})", inline=False)
+        for path, label in (("pool", "Attribution depuis la réserve"), ("create", "Création à la demande")):
+            samples = sorted(self.ticket_claim_latencies[path])
+            if samples:
+                value = f"{len(samples)} ouvertures | médiane {samples[len(samples) // 2] * 1000:.0f} ms | max {samples[-1] * 1000:.0f} ms"
+            else:
+                value = "Aucune mesure."
+            embed.add_field(name=label, value=value, inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    async def _unregister_ticket(self, channel_id_str: str):
+        if channel_id_str not in self.ticket_registry: return
+        transcript_path = self._transcript_path(channel_id_str)
+        entry = self.ticket_registry.pop(channel_id_str)
+        self._unindex_ticket(channel_id_str, entry)
+        try:
+            os.remove(transcript_path)
+        except OSError:
+            pass
+        await self._save_json_data_async(self.TICKET_REGISTRY_FILE, self.ticket_registry)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ManagerCog(bot))
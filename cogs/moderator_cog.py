@@ -1,11 +1,18 @@
 
 import discord
 from discord.ext import commands
+from discord import app_commands
 import json
+import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import os
 import re
+import time
+import hashlib
+import unicodedata
+from urllib.parse import urlsplit
+from collections import Counter, OrderedDict
 
 # Importation de ManagerCog pour l'autocomplétion
 from .manager_cog import ManagerCog
@@ -18,11 +25,277 @@ try:
 except ImportError:
     AI_AVAILABLE = False
 
+# --- Pré-filtre local de modération ---
+
+DEFAULT_BENIGN_MESSAGES = [
+    "ok", "okay", "oki", "merci", "merci beaucoup", "mercii", "thx", "oui", "non", "ouais", "nan",
+    "salut", "bonjour", "bonsoir", "coucou", "hello", "yo", "cc", "slt", "bjr", "bye", "a plus",
+    "bonne nuit", "gg", "lol", "mdr", "ptdr", "top", "cool", "super", "parfait", "d'accord", "dac",
+    "bienvenue", "de rien", "pas de souci", "ça marche", "ca marche", "nice", "trop bien"
+]
+
+class ModerationRuleEngine:
+    """Règles compilées qui tranchent localement les cas évidents avant l'appel à l'IA."""
+    INVITE_PATTERN = re.compile(r'(?:discord(?:app)?\.(?:gg|com/invite|io|me)|dsc\.gg|discord\.link)\s*/\s*[\w-]+', re.IGNORECASE)
+    URL_PATTERN = re.compile(r'\bhttps?://[^\s<>]+|\bwww\.[^\s<>]+', re.IGNORECASE)
+    EMAIL_PATTERN = re.compile(r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[a-z]{2,}\b', re.IGNORECASE)
+    PHONE_PATTERN = re.compile(r'(?<!\d)(?:(?:\+|00)33[\s.-]?|0)[1-9](?:[\s.-]?\d{2}){4}(?!\d)')
+    IBAN_PATTERN = re.compile(r'\b[A-Z]{2}\d{2}(?:\s?[A-Z0-9]{4}){3,7}(?:\s?[A-Z0-9]{1,3})?\b')
+    CARD_PATTERN = re.compile(r'(?<!\d)(?:\d[ -]?){12,18}\d(?!\d)')
+    # Sans séparateurs, une suite de 13 à 19 chiffres est le plus souvent un ID Discord (snowflake)
+    PAYMENT_KEYWORDS_PATTERN = re.compile(r'\b(?:carte|cb|visa|mastercard|master card|amex|american express|card|cvv|cvc|cryptogramme|expiration)\b', re.IGNORECASE)
+    CUSTOM_EMOJI_PATTERN = re.compile(r'<a?:\w+:\d+>')
+    NON_WORD_PATTERN = re.compile(r"[^\w\s']+")
+    MULTI_SPACE_PATTERN = re.compile(r'\s+')
+
+    INVITE_REASON = "Publicité non autorisée dans ce salon. Veuillez utiliser le salon #publicité."
+    PII_REASON = "Partage de données personnelles détecté. Pour votre sécurité, ne partagez jamais ces informations publiquement."
+
+    def __init__(self, config: Dict[str, Any]):
+        fast_path_config = config.get("FAST_PATH", {})
+        self.enabled = fast_path_config.get("ENABLED", True)
+        self.max_benign_length = fast_path_config.get("MAX_BENIGN_LENGTH", 40)
+        # "discord.com/channels" -> ("discord.com", "/channels") : l'hôte est comparé exactement, le chemin par préfixe
+        self.allowed_domains = tuple(
+            (domain.split("/", 1)[0], "/" + domain.split("/", 1)[1].strip("/") if "/" in domain else "")
+            for domain in (d.lower() for d in fast_path_config.get("ALLOWED_DOMAINS", ["discord.com/channels", "tenor.com", "giphy.com"]))
+        )
+        self.benign_messages = {self._normalize(m) for m in fast_path_config.get("ALLOWLIST", DEFAULT_BENIGN_MESSAGES)}
+
+        self.evaluated = 0
+        self.escalated = 0
+        self.rule_hits: Counter = Counter()
+
+    @classmethod
+    def _normalize(cls, text: str) -> str:
+        text = cls.CUSTOM_EMOJI_PATTERN.sub(' ', text.lower())
+        text = cls.NON_WORD_PATTERN.sub(' ', text)
+        return cls.MULTI_SPACE_PATTERN.sub(' ', text).strip()
+
+    @staticmethod
+    def _luhn_valid(number: str) -> bool:
+        digits = [int(d) for d in number if d.isdigit()]
+        checksum = 0
+        for i, digit in enumerate(reversed(digits)):
+            if i % 2 == 1:
+                digit *= 2
+                if digit > 9: digit -= 9
+            checksum += digit
+        return checksum % 10 == 0
+
+    def _contains_pii(self, content: str) -> bool:
+        return bool(self.EMAIL_PATTERN.search(content) or self.PHONE_PATTERN.search(content) or self.IBAN_PATTERN.search(content))
+
+    def _card_number_signal(self, content: str) -> Optional[bool]:
+        """True pour un numéro de carte évident, None pour une suite de chiffres à confier à l'IA, False sinon."""
+        candidates = [match.group(0) for match in self.CARD_PATTERN.finditer(content) if self._luhn_valid(match.group(0))]
+        if not candidates:
+            return False
+        if self.PAYMENT_KEYWORDS_PATTERN.search(content) or any(sum(c in " -" for c in number) >= 2 for number in candidates):
+            return True
+        return None
+
+    def _url_allowed(self, url: str) -> bool:
+        try:
+            parts = urlsplit(url if "://" in url else f"http://{url}")
+            host = (parts.hostname or "").lower()
+        except ValueError:
+            return False
+        path = parts.path.lower()
+        for domain, path_prefix in self.allowed_domains:
+            if host == domain or host.endswith("." + domain):
+                if not path_prefix or path == path_prefix or path.startswith(path_prefix + "/"):
+                    return True
+        return False
+
+    def _hit(self, rule: str, verdict: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        self.rule_hits[rule] += 1
+        if verdict is None:
+            self.escalated += 1
+        return verdict
+
+    def evaluate(self, content: str) -> Optional[Dict[str, Any]]:
+        """Retourne un verdict local, ou None si le message doit être analysé par l'IA."""
+        self.evaluated += 1
+        if not self.enabled:
+            return self._hit("disabled", None)
+
+        if self.INVITE_PATTERN.search(content):
+            return self._hit("invite", {"action": "DELETE_AND_WARN", "reason": self.INVITE_REASON})
+
+        card_signal = self._card_number_signal(content)
+        if card_signal or self._contains_pii(content):
+            return self._hit("personal_info", {"action": "WARN_PERSONAL_INFO_SHARING", "reason": self.PII_REASON})
+        if card_signal is None:
+            return self._hit("possible_card", None)
+
+        urls = self.URL_PATTERN.findall(content)
+        if urls and not all(self._url_allowed(url) for url in urls):
+            return self._hit("url", None)
+
+        normalized = self._normalize(self.URL_PATTERN.sub(' ', content))
+        if not normalized:
+            return self._hit("empty_or_emoji", {"action": "PASS", "reason": "Message sans texte (emoji, pièce jointe ou lien autorisé)."})
+        if len(normalized) <= self.max_benign_length and normalized in self.benign_messages:
+            return self._hit("allowlist", {"action": "PASS", "reason": "Message court et anodin."})
+
+        return self._hit("ambiguous", None)
+
+    def stats_summary(self) -> Dict[str, Any]:
+        return {
+            "evaluated": self.evaluated,
+            "escalated": self.escalated,
+            "escalation_ratio": self.escalated / self.evaluated if self.evaluated else 0.0,
+            "rule_hits": dict(self.rule_hits)
+        }
+
+
+# --- Cache des verdicts de modération ---
+
+ZERO_WIDTH_AND_VARIANTS_PATTERN = re.compile('[\u200b-\u200f\u2060-\u2064\ufeff\ufe00-\ufe0f\U0001f3fb-\U0001f3ff\U000e0020-\U000e007f]')
+
+def normalize_message_content(content: str) -> str:
+    """Replie les variantes d'un même texte (casse, espaces, caractères invisibles, variantes d'emoji)."""
+    text = unicodedata.normalize("NFKC", content)
+    text = ZERO_WIDTH_AND_VARIANTS_PATTERN.sub('', text).casefold()
+    return " ".join(text.split())
+
+class ModerationVerdictCache:
+    """Cache LRU/TTL des verdicts de l'IA, indexé par contenu normalisé et classe de salon."""
+    def __init__(self, max_size: int = 2000, ttl_seconds: int = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content: str, channel_class: str) -> str:
+        normalized = normalize_message_content(content)
+        return hashlib.sha1(f"{channel_class}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, verdict: Dict[str, Any]):
+        if verdict.get("error"):
+            return # Ne jamais mettre en cache un repli dû à une erreur de l'IA
+        self._entries[key] = (time.monotonic(), verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats_summary(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+# --- Regroupement des requêtes de modération ---
+
+class ModerationBatcher:
+    """Regroupe les messages à modérer sur une courte fenêtre et les envoie à l'IA en une seule requête."""
+    def __init__(self, cog: 'ModeratorCog', window_seconds: float = 0.3, max_batch_size: int = 10):
+        self.cog = cog
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._pending: List[tuple] = []
+        self._timer_task: Optional[asyncio.Task] = None
+        self._flush_tasks: set = set()
+
+        self.requests_sent = 0
+        self.messages_processed = 0
+
+    async def submit(self, message: discord.Message) -> Optional[Dict[str, Any]]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush(self._take_batch())
+        elif self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    def _take_batch(self) -> List[tuple]:
+        batch, self._pending = self._pending, []
+        if self._timer_task:
+            self._timer_task.cancel()
+            self._timer_task = None
+        return batch
+
+    def _schedule_flush(self, batch: List[tuple]):
+        task = asyncio.create_task(self._process_batch(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window_seconds)
+        self._timer_task = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Le lot part dans une tâche suivie : annuler le minuteur ne peut plus l'interrompre
+            self._schedule_flush(batch)
+
+    async def _process_batch(self, batch: List[tuple]):
+        # Un contenu identique (même salon) n'occupe qu'une place dans la requête
+        representatives: Dict[str, discord.Message] = {}
+        for message, _ in batch:
+            representatives.setdefault(ModerationVerdictCache.make_key(message.content, message.channel.name), message)
+        messages = list(representatives.values())
+        verdicts: Dict[int, Optional[Dict[str, Any]]] = {}
+        try:
+            self.requests_sent += 1
+            self.messages_processed += len(batch)
+            if len(messages) == 1:
+                verdicts[messages[0].id] = await self.cog.query_gemini_moderation(messages[0])
+            else:
+                verdicts = await self.cog.query_gemini_moderation_batch(messages)
+        except Exception as e:
+            print(f"Erreur lors du traitement d'un lot de modération: {e}")
+        finally:
+            for message, future in batch:
+                if not future.done():
+                    representative = representatives[ModerationVerdictCache.make_key(message.content, message.channel.name)]
+                    future.set_result(verdicts.get(representative.id, {"action": "PASS", "reason": "Verdict IA manquant.", "error": True}))
+
+    def cancel(self):
+        for message, future in self._take_batch():
+            if not future.done():
+                future.cancel()
+        for task in list(self._flush_tasks):
+            task.cancel()
+
+    def stats_summary(self) -> Dict[str, Any]:
+        return {
+            "requests_sent": self.requests_sent,
+            "messages_processed": self.messages_processed,
+            "average_batch_size": self.messages_processed / self.requests_sent if self.requests_sent else 0.0
+        }
+
+
 class ModeratorCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
         self.model: Optional[genai.GenerativeModel] = None
+        self.rule_engine: Optional[ModerationRuleEngine] = None
+        self.verdict_cache: Optional[ModerationVerdictCache] = None
+        self.batcher: Optional[ModerationBatcher] = None
 
     async def cog_load(self):
         # Cette méthode est appelée lors du chargement du cog.
@@ -30,12 +303,38 @@ class ModeratorCog(commands.Cog):
         if not self.manager:
             return print("ERREUR CRITIQUE: ModeratorCog n'a pas pu trouver le ManagerCog.")
         
+        mod_config = self.manager.config.get("MODERATION_CONFIG", {})
+        self.rule_engine = ModerationRuleEngine(mod_config)
+        cache_config = mod_config.get("VERDICT_CACHE", {})
+        self.verdict_cache = ModerationVerdictCache(
+            max_size=cache_config.get("MAX_SIZE", 2000),
+            ttl_seconds=cache_config.get("TTL_SECONDS", 3600)
+        )
+        batching_config = mod_config.get("BATCHING", {})
+        if batching_config.get("ENABLED", True):
+            self.batcher = ModerationBatcher(
+                self,
+                window_seconds=batching_config.get("WINDOW_MS", 300) / 1000,
+                max_batch_size=batching_config.get("MAX_BATCH_SIZE", 10)
+            )
+
         if AI_AVAILABLE and self.manager.model:
             self.model = self.manager.model
             print("✅ Moderator Cog: Modèle Gemini partagé par ManagerCog chargé.")
         else:
             print("⚠️ ATTENTION: ModeratorCog désactivé car aucun modèle AI n'est disponible.")
 
+    def cog_unload(self):
+        if self.batcher:
+            self.batcher.cancel()
+
+    @commands.Cog.listener()
+    async def on_data_reload(self, name: str, version: int):
+        if name != "config" or not self.verdict_cache: return
+        # Règles et prompt ont pu changer : les verdicts déjà en cache ne sont plus fiables
+        self.rule_engine = ModerationRuleEngine(self.manager.config.get("MODERATION_CONFIG", {}))
+        self.verdict_cache.clear()
+
     async def _parse_gemini_json_response(self, text: str) -> Optional[Dict[str, Any]]:
         """Analyse de manière robuste une réponse JSON potentiellement mal formatée de l'IA."""
         match = re.search(r'```(?:json)?\s*({.*?})\s*```', text, re.DOTALL)
@@ -56,10 +355,8 @@ class ModeratorCog(commands.Cog):
              print("ATTENTION: Le prompt de modération IA est manquant dans config.json")
              return {"action": "PASS", "reason": "Configuration IA manquante."}
              
-        prompt = prompt_template.format(
-            user_message=message.content,
-            channel_name=message.channel.name
-        )
+        # Le modèle de prompt contient des accolades JSON littérales : str.format n'est pas utilisable.
+        prompt = prompt_template.replace("{user_message}", message.content).replace("{channel_name}", message.channel.name)
 
         try:
             generation_config = GenerationConfig(
@@ -72,14 +369,70 @@ class ModeratorCog(commands.Cog):
             return await self._parse_gemini_json_response(response.text)
         except Exception as e:
             print(f"Erreur Gemini (Modération): {e}")
-            return {"action": "PASS", "reason": f"Erreur d'analyse IA."}
+            return {"action": "PASS", "reason": f"Erreur d'analyse IA.", "error": True}
+
+    async def query_gemini_moderation_batch(self, messages: List[discord.Message]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Analyse plusieurs messages en une seule requête et retourne les verdicts par ID de message."""
+        if not self.model or not self.manager: return {}
+
+        mod_config = self.manager.config.get("MODERATION_CONFIG", {})
+        prompt_template = mod_config.get("AI_MODERATION_BATCH_PROMPT")
+        if not prompt_template:
+            results = await asyncio.gather(*(self.query_gemini_moderation(message) for message in messages))
+            return {message.id: result for message, result in zip(messages, results)}
+
+        messages_json = json.dumps(
+            [{"id": str(message.id), "channel_name": message.channel.name, "user_message": message.content} for message in messages],
+            ensure_ascii=False
+        )
+        prompt = prompt_template.replace("{messages_json}", messages_json)
+
+        try:
+            generation_config = GenerationConfig(
+                response_mime_type="application/json"
+            )
+            response = await self.model.generate_content_async(
+                contents=prompt,
+                generation_config=generation_config
+            )
+            parsed = json.loads(response.text)
+        except Exception as e:
+            print(f"Erreur Gemini (Modération groupée): {e}")
+            return {message.id: {"action": "PASS", "reason": "Erreur d'analyse IA.", "error": True} for message in messages}
+
+        if isinstance(parsed, dict):
+            parsed = parsed.get("verdicts", [])
+        verdicts_by_id = {str(v.get("id")): v for v in parsed if isinstance(v, dict)}
+
+        results = {}
+        for message in messages:
+            verdict = verdicts_by_id.get(str(message.id))
+            if verdict and "action" in verdict:
+                results[message.id] = {"action": verdict["action"], "reason": verdict.get("reason", "Aucune raison spécifiée.")}
+        return results
+
+    async def get_ai_verdict(self, message: discord.Message) -> Optional[Dict[str, Any]]:
+        """Retourne le verdict de l'IA, en réutilisant celui d'un contenu identique déjà analysé."""
+        query = self.batcher.submit if self.batcher else self.query_gemini_moderation
+        if not self.verdict_cache:
+            return await query(message)
+
+        cache_key = ModerationVerdictCache.make_key(message.content, message.channel.name)
+        cached_verdict = self.verdict_cache.get(cache_key)
+        if cached_verdict is not None:
+            return cached_verdict
+
+        result = await query(message)
+        if result and "action" in result:
+            self.verdict_cache.put(cache_key, result)
+        return result
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author.bot or message.guild is None: return
+        if message.author.bot or message.guild is None or not self.manager: return
 
         mod_config = self.manager.config.get("MODERATION_CONFIG", {})
-        if not self.manager or not mod_config.get("ENABLED", False):
+        if not mod_config.get("ENABLED", False):
             return
         
         # Ignorer les canaux où la promotion est autorisée
@@ -94,7 +447,9 @@ class ModeratorCog(commands.Cog):
         if any(role_name in author_roles for role_name in staff_role_names):
             return
 
-        result = await self.query_gemini_moderation(message)
+        result = self.rule_engine.evaluate(message.content) if self.rule_engine else None
+        if result is None:
+            result = await self.get_ai_verdict(message)
         if not result: return
         
         action = result.get("action", "PASS")
@@ -116,6 +471,41 @@ class ModeratorCog(commands.Cog):
         if handler:
             await handler(message, reason)
 
+    @app_commands.command(name="moderation_stats", description="[Staff] Affiche les statistiques du pré-filtre de modération.")
+    @app_commands.default_permissions(manage_messages=True)
+    async def moderation_stats(self, interaction: discord.Interaction):
+        if not self.rule_engine:
+            return await interaction.response.send_message("Le pré-filtre de modération n'est pas initialisé.", ephemeral=True)
+
+        stats = self.rule_engine.stats_summary()
+        embed = discord.Embed(title="📊 Statistiques de Modération", color=discord.Color.blurple())
+        embed.add_field(name="Messages analysés", value=f"`{stats['evaluated']}`", inline=True)
+        embed.add_field(name="Envoyés à l'IA", value=f"`{stats['escalated']}` ({stats['escalation_ratio']*100:.1f}%)", inline=True)
+
+        evaluated = stats['evaluated'] or 1
+        hits_text = "\n".join(
+            f"`{rule}` : {count} ({count / evaluated * 100:.1f}%)"
+            for rule, count in sorted(stats['rule_hits'].items(), key=lambda x: x[1], reverse=True)
+        )
+        embed.add_field(name="Règles déclenchées", value=hits_text or "Aucune donnée pour le moment.", inline=False)
+
+        if self.verdict_cache:
+            cache_stats = self.verdict_cache.stats_summary()
+            embed.add_field(
+                name="Cache des verdicts IA",
+                value=f"Taux de succès : `{cache_stats['hit_ratio']*100:.1f}%` ({cache_stats['hits']} / {cache_stats['hits'] + cache_stats['misses']})\nEntrées : `{cache_stats['size']}`",
+                inline=False
+            )
+
+        if self.batcher:
+            batch_stats = self.batcher.stats_summary()
+            embed.add_field(
+                name="Requêtes IA groupées",
+                value=f"Requêtes envoyées : `{batch_stats['requests_sent']}`\nMessages analysés : `{batch_stats['messages_processed']}`\nTaille moyenne des lots : `{batch_stats['average_batch_size']:.2f}`",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     async def handle_delete_and_warn(self, message: discord.Message, reason: str):
         try: await message.delete()
         except discord.NotFound: pass